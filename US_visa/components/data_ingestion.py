@@ -1,14 +1,26 @@
 ## -*- Code:Utf -*-
 
 import os
+import re
 import sys
+import math
+import shutil
+from typing import Any, Optional
+from US_visa.constants import (ARTIFACT_FILE_FORMAT, TRAIN_FILE_NAME, TEST_FILE_NAME,
+                               DATA_INGESTION_REFERENCE_PROFILE_FILE_NAME)
 from US_visa.entity.config_entity import DataIngestionConfig
 from US_visa.entity.artifact_entity import DataIngestionArtifact
+from US_visa.entity.data_profile import DataProfile
+from US_visa.entity.schema import get_schema
 from US_visa.logger import logging
 from US_visa.exception import USVisaException
+from US_visa.utils.main_utils import (read_yaml_file, write_yaml_file, concat_dataframe_chunks,
+                                     save_dataframe, read_dataframe_with_schema)
+from US_visa.utils.profiling import profile_step
 
 from pandas import DataFrame
 import numpy as np
+from bson import ObjectId
 from sklearn.model_selection import train_test_split
 
 from US_visa.data_access.usvisa_data import USvisaData
@@ -23,8 +35,14 @@ class DataIngestion:
     Methods:
         export_data_into_feature_store() -> DataFrame:
             Exports data from MongoDB into a feature store as a pandas DataFrame.
+        export_incremental_data_into_feature_store() -> list:
+            Appends the documents newer than the stored watermark to the persistent feature store.
         split_data_as_train_test(df: DataFrame) -> None:
-            Splits the data into training and testing sets and saves them to CSV files.
+            Splits the data into training and testing sets and saves them as DataFrame artifacts.
+        split_feature_store_as_train_test(partitions: list) -> None:
+            Saves the training and testing sets of the persistent feature store from the splits of its partitions.
+        save_reference_profile(train_set: DataFrame) -> None:
+            Saves the DataProfile of the training set that drift checks compare against.
         initiate_data_ingestion() -> DataIngestionArtifact:
             Initiates the data ingestion process including exporting data and splitting it into training and testing sets.
     """
@@ -42,12 +60,51 @@ class DataIngestion:
         try:
             logging.info("Data Ingestion Process Entered!")
             self.data_ingestion_config = data_ingestion_config
+            self._schema = get_schema()
         except Exception as e:
             raise USVisaException(e, sys)
 
     
     
     
+    def export_dataframe(self, usvisa_data: USvisaData, query_filter: Optional[dict] = None) -> DataFrame:
+        """
+        Exports the documents matching the filter, partitioned or streamed depending on the configuration.
+
+        Args:
+            usvisa_data (USvisaData): The data access object to export with.
+            query_filter (Optional[dict]): A MongoDB query document selecting the documents. Defaults to None.
+
+        Returns:
+            DataFrame: The exported documents.
+        """
+        config = self.data_ingestion_config
+        with profile_step("mongo_export") as step:
+            if config.export_partitions > 1 and config.sample_size is None and config.limit is None:
+                logging.info(f"Exporting in {config.export_partitions} partitions on {config.partition_key}")
+                dataframe = usvisa_data.export_collection_in_partitions(
+                    collection_name=config.collection_name,
+                    n_partitions=config.export_partitions,
+                    partition_key=config.partition_key,
+                    max_workers=config.export_max_workers,
+                    batch_size=config.batch_size,
+                    query_filter=query_filter,
+                    use_projection=config.use_projection
+                )
+            else:
+                dataframe = usvisa_data.export_collection_as_dataframe(
+                    collection_name=config.collection_name,
+                    batch_size=config.batch_size,
+                    query_filter=query_filter,
+                    use_projection=config.use_projection,
+                    sample_size=config.sample_size,
+                    limit=config.limit
+                )
+            step.rows = len(dataframe)
+        return dataframe
+
+
+
     def export_data_into_feature_store(self) -> DataFrame:
         """
         Exports data from MongoDB into a feature store as a pandas DataFrame.
@@ -61,25 +118,169 @@ class DataIngestion:
         try:
             logging.info("Exporting Data From MongoDB")
             usvisa_data = USvisaData()
-            dataframe = usvisa_data.export_collection_as_dataframe(
-                collection_name=self.data_ingestion_config.collection_name
-            )
+            dataframe = self.export_dataframe(usvisa_data=usvisa_data,
+                                              query_filter=self.data_ingestion_config.query_filter)
             logging.info(f"Shape of DataFrame: {dataframe.shape}")
             feature_store_file_path = self.data_ingestion_config.feature_store_file_path
             logging.info("Initialize Directory for Raw Data")
             os.makedirs(os.path.dirname(feature_store_file_path), exist_ok=True)
             logging.info(f"Saving exported data into feature store file path: {feature_store_file_path}")
-            dataframe.to_csv(feature_store_file_path, index=False, header=True)
+            with profile_step("feature_store_write", rows=len(dataframe)):
+                save_dataframe(filepath=feature_store_file_path, df=dataframe)
             return dataframe
         except Exception as e:
             logging.error(f"Error in Exporting Data into feature store: {e}")
             raise USVisaException(e, sys)
 
+
+
+    def read_watermark(self) -> dict:
+        """
+        Reads the watermark file of the persistent feature store.
+
+        Returns:
+            dict: The watermark `value` (None before the first run) and the list of stored `partitions`.
+
+        Raises:
+            USVisaException: If the stored watermark was recorded on another field.
+        """
+        watermark_file_path = self.data_ingestion_config.watermark_file_path
+        if not os.path.exists(watermark_file_path):
+            return {"value": None, "partitions": []}
+
+        watermark = read_yaml_file(filepath=watermark_file_path)
+        if watermark["field"] != self.data_ingestion_config.watermark_field:
+            raise Exception(f"Feature store watermark is on {watermark['field']}, "
+                            f"not on {self.data_ingestion_config.watermark_field}")
+        if watermark["type"] == "ObjectId":
+            watermark["value"] = ObjectId(watermark["value"])
+        return watermark
+
+
+
+    def write_watermark(self, value: Any, partitions: list) -> None:
+        """
+        Writes the watermark file of the persistent feature store.
+
+        Args:
+            value (Any): The largest watermark field value stored in the feature store.
+            partitions (list): The partition file names in the order they were appended.
+        """
+        write_yaml_file(filepath=self.data_ingestion_config.watermark_file_path,
+                        content={"field": self.data_ingestion_config.watermark_field,
+                                 "type": type(value).__name__,
+                                 "value": str(value) if isinstance(value, ObjectId) else value,
+                                 "partitions": partitions},
+                        replace=True)
+
+
+
+    def get_partition_split_dir(self, partition: str) -> str:
+        return os.path.join(self.data_ingestion_config.partition_splits_dir, os.path.splitext(partition)[0])
+
+
+
+    def split_partition(self, partition: str, dataframe: DataFrame,
+                        base_profile: Optional[DataProfile] = None) -> DataProfile:
+        """
+        Splits a partition of the persistent feature store into training and testing rows and profiles
+        its training rows, once, so later runs reuse them instead of splitting the whole history again.
+
+        The profile of the first partition fixes the bins and categories, the later partitions are
+        profiled with them through `empty_like` so that the profiles of all partitions merge. The
+        profile is written last and marks the split as complete.
+
+        Args:
+            partition (str): The partition file name.
+            dataframe (DataFrame): The rows of the partition.
+            base_profile (Optional[DataProfile]): The profile of the first partition, None for the first partition.
+
+        Returns:
+            DataProfile: The profile of the training rows of the partition.
+        """
+        try:
+            config = self.data_ingestion_config
+            split_dir = self.get_partition_split_dir(partition)
+            # a partition too small to hold a test row goes to the training set
+            if len(dataframe) > math.ceil(len(dataframe) * config.train_split_test_ratio):
+                train_set, test_set = train_test_split(dataframe, test_size=config.train_split_test_ratio,
+                                                       random_state=config.split_random_state)
+            else:
+                train_set, test_set = dataframe, dataframe.iloc[:0]
+            save_dataframe(filepath=os.path.join(split_dir, TRAIN_FILE_NAME), df=train_set)
+            save_dataframe(filepath=os.path.join(split_dir, TEST_FILE_NAME), df=test_set)
+
+            if base_profile is None:
+                profile = self.get_reference_profile(train_set)
+            else:
+                profile = base_profile.empty_like()
+                profile.update(train_set)
+            profile.save(filepath=os.path.join(split_dir, DATA_INGESTION_REFERENCE_PROFILE_FILE_NAME))
+            logging.info(f"Split partition {partition} into {len(train_set)} train and {len(test_set)} test rows")
+            return profile
+        except Exception as e:
+            logging.error(f"Error in Splitting the partition {partition}: {e}")
+            raise USVisaException(e, sys)
+
+
+
+    def export_incremental_data_into_feature_store(self) -> DataFrame:
+        """
+        Appends the documents newer than the stored watermark to the persistent feature store.
+
+        Only documents with `watermark_field` in (stored watermark, current max] are pulled from MongoDB,
+        they are written as a new partition named after the new watermark, so re-running after a crash
+        overwrites the partition instead of duplicating it. The watermark is moved once the partition is on disk.
+
+        Returns:
+            list: The partition file names of the feature store, including the new partition.
+
+        Raises:
+            USVisaException: If there is an error during the export process.
+        """
+        try:
+            config = self.data_ingestion_config
+            watermark = self.read_watermark()
+            partitions = list(watermark["partitions"])
+            logging.info(f"Incremental export from {config.watermark_field} > {watermark['value']}")
+
+            usvisa_data = USvisaData()
+            new_watermark = usvisa_data.get_max_value(collection_name=config.collection_name,
+                                                      field=config.watermark_field,
+                                                      query_filter=config.query_filter)
+
+            if new_watermark is not None and (watermark["value"] is None or new_watermark > watermark["value"]):
+                watermark_range = {"$lte": new_watermark}
+                if watermark["value"] is not None:
+                    watermark_range["$gt"] = watermark["value"]
+                query_filter = USvisaData.combine_filters(config.query_filter, {config.watermark_field: watermark_range})
+
+                new_dataframe = self.export_dataframe(usvisa_data=usvisa_data, query_filter=query_filter)
+                logging.info(f"Pulled {len(new_dataframe)} new documents up to {config.watermark_field} = {new_watermark}")
+
+                partition = f"part-{re.sub(r'[^0-9A-Za-z]+', '_', str(new_watermark))}.{ARTIFACT_FILE_FORMAT}"
+                # the split of a crashed run may not match the rows written now
+                shutil.rmtree(self.get_partition_split_dir(partition), ignore_errors=True)
+                save_dataframe(filepath=os.path.join(config.persistent_feature_store_dir, partition), df=new_dataframe)
+                if partition not in partitions:
+                    partitions.append(partition)
+                self.write_watermark(value=new_watermark, partitions=partitions)
+            else:
+                logging.info("No new documents since the last watermark")
+
+            return partitions
+        except Exception as e:
+            logging.error(f"Error in Incremental Export into feature store: {e}")
+            raise USVisaException(e, sys)
+
     
     
     def split_data_as_train_test(self, df: DataFrame) -> None:
         """
-        Splits the data into training and testing sets and saves them to CSV files.
+        Splits the data into training and testing sets and saves them as DataFrame artifacts.
+
+        The split is seeded with `split_random_state`, so the same rows in the same order always
+        give the same training set and the preprocessor and stage caches keyed by it can hit.
 
         Args:
             df (DataFrame): The DataFrame to split into training and testing sets.
@@ -89,18 +290,107 @@ class DataIngestion:
         """
         try:
             logging.info("Train test split on the dataframe Started!")
-            train_set, test_set = train_test_split(df, test_size=self.data_ingestion_config.train_split_test_ratio)
+            train_set, test_set = train_test_split(df, test_size=self.data_ingestion_config.train_split_test_ratio,
+                                                   random_state=self.data_ingestion_config.split_random_state)
             logging.info("Performed train test split on the dataframe")
             logging.info("Exited split_data_as_train_test method of Data_Ingestion class")
-            logging.info("Initialize Directory for Train Data")
-            os.makedirs(os.path.dirname(self.data_ingestion_config.training_file_path), exist_ok=True)
             logging.info("Exporting train and test file path.")
-            train_set.to_csv(self.data_ingestion_config.training_file_path, index=False, header=True)
-            test_set.to_csv(self.data_ingestion_config.testing_file_path, index=False, header=True)
+            with profile_step("train_test_write", rows=len(df)):
+                save_dataframe(filepath=self.data_ingestion_config.training_file_path, df=train_set)
+                save_dataframe(filepath=self.data_ingestion_config.testing_file_path, df=test_set)
+            self.save_reference_profile(train_set)
         except Exception as e:
             logging.error(f"Error in Splitting data as train & Test: {e}")
             raise USVisaException(e, sys)
 
+    def split_feature_store_as_train_test(self, partitions: list) -> None:
+        """
+        Saves the training and testing sets and the reference profile of the persistent feature store.
+
+        Every partition is split and profiled once, by `split_partition`, so a run only concatenates the
+        stored splits and merges the profiles instead of splitting and profiling the whole history. A row
+        stays in the same set on every run. Partitions appended before their splits were stored are split
+        here, once.
+
+        Args:
+            partitions (list): The partition file names in the order they were appended.
+
+        Raises:
+            USVisaException: If there is an error while reading or writing the splits.
+        """
+        try:
+            config = self.data_ingestion_config
+            if not partitions:
+                raise Exception(f"The persistent feature store has no partition, {config.collection_name} has no documents")
+            base_profile = None
+            profiles, train_sets, test_sets = [], [], []
+            for partition in partitions:
+                split_dir = self.get_partition_split_dir(partition)
+                profile_file_path = os.path.join(split_dir, DATA_INGESTION_REFERENCE_PROFILE_FILE_NAME)
+                if os.path.exists(profile_file_path):
+                    profile = DataProfile.load(profile_file_path)
+                else:
+                    dataframe = read_dataframe_with_schema(
+                        filepath=os.path.join(config.persistent_feature_store_dir, partition), schema=self._schema)
+                    profile = self.split_partition(partition, dataframe, base_profile=base_profile)
+                base_profile = base_profile or profile
+                profiles.append(profile)
+                train_sets.append(read_dataframe_with_schema(filepath=os.path.join(split_dir, TRAIN_FILE_NAME),
+                                                             schema=self._schema))
+                test_sets.append(read_dataframe_with_schema(filepath=os.path.join(split_dir, TEST_FILE_NAME),
+                                                            schema=self._schema))
+
+            train_set, test_set = concat_dataframe_chunks(train_sets), concat_dataframe_chunks(test_sets)
+            logging.info(f"Assembled {len(train_set)} train and {len(test_set)} test rows from {len(partitions)} partitions")
+            with profile_step("train_test_write", rows=len(train_set) + len(test_set)):
+                save_dataframe(filepath=config.training_file_path, df=train_set)
+                save_dataframe(filepath=config.testing_file_path, df=test_set)
+
+            # the merged profile has no exact quantiles, only the counts of the partition profiles
+            reference_profile = base_profile.empty_like()
+            for profile in profiles:
+                reference_profile.merge(profile)
+            reference_profile.save(filepath=config.reference_profile_file_path)
+            logging.info(f"Saved the reference profile of {len(profiles)} partitions to {config.reference_profile_file_path}")
+        except Exception as e:
+            logging.error(f"Error in Splitting the feature store as train & Test: {e}")
+            raise USVisaException(e, sys)
+
+    def get_reference_profile(self, train_set: DataFrame) -> DataProfile:
+        """
+        Profiles a training set with the bins and categories limits of the config.
+        """
+        config = self.data_ingestion_config
+        with profile_step("reference_profile", rows=len(train_set)):
+            return DataProfile.from_dataframe(
+                train_set,
+                numerical_columns=self._schema.numerical_columns,
+                categorical_columns=self._schema.categorical_columns,
+                n_bins=config.profile_n_bins,
+                n_quantiles=config.profile_n_quantiles,
+                max_categories=config.profile_max_categories
+            )
+
+    def save_reference_profile(self, train_set: DataFrame) -> None:
+        """
+        Profiles the training set once, so drift checks compare new data against the profile
+        instead of reading the training data again.
+
+        Args:
+            train_set (DataFrame): The training set.
+
+        Raises:
+            USVisaException: If there is an error while profiling the data.
+        """
+        try:
+            config = self.data_ingestion_config
+            reference_profile = self.get_reference_profile(train_set)
+            reference_profile.save(filepath=config.reference_profile_file_path)
+            logging.info(f"Saved the reference profile to {config.reference_profile_file_path}")
+        except Exception as e:
+            logging.error(f"Error in Saving the reference profile: {e}")
+            raise USVisaException(e, sys)
+
     
     
     def initiate_data_ingestion(self) -> DataIngestionArtifact:
@@ -115,14 +405,20 @@ class DataIngestion:
         """
         try:
             logging.info("Data Ingestion Started!")
-            dataframe = self.export_data_into_feature_store()
-            logging.info("Fetched the Data from MongoDB")
-            self.split_data_as_train_test(dataframe)
+            if self.data_ingestion_config.incremental:
+                partitions = self.export_incremental_data_into_feature_store()
+                logging.info("Fetched the Data from MongoDB")
+                self.split_feature_store_as_train_test(partitions)
+            else:
+                dataframe = self.export_data_into_feature_store()
+                logging.info("Fetched the Data from MongoDB")
+                self.split_data_as_train_test(dataframe)
             logging.info("Performed Train & Test Split!")
             logging.info("Exited initiate_data_ingestion method of Data_Ingestion class")
             data_ingestion_artifact = DataIngestionArtifact(
                 trained_file_path=self.data_ingestion_config.training_file_path,
-                test_file_path=self.data_ingestion_config.testing_file_path
+                test_file_path=self.data_ingestion_config.testing_file_path,
+                reference_profile_file_path=self.data_ingestion_config.reference_profile_file_path
             )
             logging.info(f"Data ingestion artifact: {data_ingestion_artifact}")
             return data_ingestion_artifact
@@ -0,0 +1,147 @@
+## -*- Code:Utf -*-
+
+import sys
+
+import numpy as np
+from imblearn.combine import SMOTEENN
+from imblearn.over_sampling import SMOTE
+from imblearn.under_sampling import EditedNearestNeighbours, RandomUnderSampler
+from sklearn.neighbors import NearestNeighbors
+
+from US_visa.entity.config_entity import DataResamplingConfig
+from US_visa.entity.artifact_entity import DataTransformationArtifact, DataResamplingArtifact
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+from US_visa.utils.main_utils import load_feature_target_data, save_feature_target_data
+from US_visa.utils.profiling import profile_step
+
+
+"The resampling strategies of DataResamplingConfig.strategy"
+RESAMPLING_STRATEGIES = ("smote", "smoteenn", "random_under", "none")
+
+"The sampling_strategy values an under-sampler cannot honour, it only removes rows of the other classes"
+OVER_SAMPLING_ONLY_STRATEGIES = ("minority",)
+
+
+class DataResampling:
+    """
+    A class used to rebalance the classes of the transformed training set.
+
+    Only the training set is resampled: the test set keeps the class balance of the data the
+    model is scored on, so its metrics stay comparable between strategies. With the `none`
+    strategy nothing is resampled and the model trainer weights the classes instead.
+
+    Attributes
+    ----------
+    data_transformation_artifact : DataTransformationArtifact
+        An artifact containing the paths to the transformed training and testing data.
+    data_resampling_config : DataResamplingConfig
+        A configuration object for the resampling strategy and its neighbor searches.
+
+    Methods
+    -------
+    get_resampler() -> object:
+        Creates the imbalanced-learn sampler of the configured strategy.
+    initiate_data_resampling() -> DataResamplingArtifact:
+        Resamples the training set and returns a DataResamplingArtifact.
+    """
+
+    def __init__(self, data_transformation_artifact: DataTransformationArtifact,
+                 data_resampling_config: DataResamplingConfig):
+        """
+        Initializes the DataResampling object with the transformation artifact and the resampling config.
+
+        Parameters
+        ----------
+        data_transformation_artifact : DataTransformationArtifact
+            An artifact containing the paths to the transformed training and testing data.
+        data_resampling_config : DataResamplingConfig
+            A configuration object for the resampling strategy and its neighbor searches.
+        """
+        try:
+            if data_resampling_config.strategy not in RESAMPLING_STRATEGIES:
+                raise ValueError(f"Unknown resampling strategy {data_resampling_config.strategy!r}, "
+                                 f"expected one of {RESAMPLING_STRATEGIES}")
+            if (data_resampling_config.strategy == "random_under"
+                    and data_resampling_config.sampling_strategy in OVER_SAMPLING_ONLY_STRATEGIES):
+                raise ValueError(f"The sampling strategy {data_resampling_config.sampling_strategy!r} only applies "
+                                 f"to over-sampling, use 'auto', 'majority', 'not minority', 'not majority', "
+                                 f"'all' or a float with random_under")
+            self.data_transformation_artifact = data_transformation_artifact
+            self.data_resampling_config = data_resampling_config
+
+        except Exception as e:
+            logging.error(f"Error during Initialization : {e}")
+            raise USVisaException(e, sys) from e
+
+    def get_resampler(self):
+        """
+        Creates the imbalanced-learn sampler of the configured strategy.
+
+        The nearest neighbor searches of SMOTE and ENN, the bulk of the resampling time, run on
+        `n_jobs` processes.
+
+        Returns
+        -------
+        object
+            The sampler, or None for the `none` strategy.
+        """
+        try:
+            config = self.data_resampling_config
+            if config.strategy == "none":
+                return None
+            if config.strategy == "random_under":
+                return RandomUnderSampler(sampling_strategy=config.sampling_strategy, random_state=config.random_state)
+
+            # imbalanced-learn asks the neighbor search for one more neighbor than k, the sample itself
+            smote = SMOTE(sampling_strategy=config.sampling_strategy, random_state=config.random_state,
+                          k_neighbors=NearestNeighbors(n_neighbors=config.k_neighbors + 1, n_jobs=config.n_jobs))
+            if config.strategy == "smote":
+                return smote
+            return SMOTEENN(smote=smote, enn=EditedNearestNeighbours(sampling_strategy="all", n_jobs=config.n_jobs),
+                            random_state=config.random_state)
+
+        except Exception as e:
+            logging.error(f"Error during Creating the Resampler : {e}")
+            raise USVisaException(e, sys) from e
+
+    def initiate_data_resampling(self) -> DataResamplingArtifact:
+        """
+        Resamples the transformed training set with the configured strategy.
+
+        Returns
+        -------
+        DataResamplingArtifact
+            An artifact containing the path to the resampled training data, and the class weight
+            the model trainer uses with the `none` strategy.
+        """
+        try:
+            config = self.data_resampling_config
+            resampler = self.get_resampler()
+            if resampler is None:
+                logging.info("Resampling strategy none, the classes are weighted by the model trainer")
+                return DataResamplingArtifact(
+                    resampled_train_file_path=self.data_transformation_artifact.transformed_train_file_path,
+                    strategy=config.strategy,
+                    class_weight="balanced")
+
+            features, target = load_feature_target_data(dirpath=self.data_transformation_artifact.transformed_train_file_path)
+            logging.info(f"Applying {config.strategy} on Training dataset, classes {np.bincount(target).tolist()}")
+
+            with profile_step(f"resample_{config.strategy}", rows=features.shape[0]):
+                resampled_features, resampled_target = resampler.fit_resample(features, target)
+
+            logging.info(f"Applied {config.strategy} on Training dataset, classes "
+                         f"{np.bincount(resampled_target).tolist()}")
+
+            save_feature_target_data(dirpath=config.resampled_train_file_path, features=resampled_features,
+                                     target=np.asarray(resampled_target))
+
+            data_resampling_artifact = DataResamplingArtifact(resampled_train_file_path=config.resampled_train_file_path,
+                                                              strategy=config.strategy)
+            logging.info(f"Data resampling artifact: {data_resampling_artifact}")
+            return data_resampling_artifact
+
+        except Exception as e:
+            logging.error(f"Error During Initiating Data Resampling : {e}")
+            raise USVisaException(e, sys) from e
@@ -3,19 +3,21 @@
 import sys
 import pandas as pd
 import numpy as np
-from imblearn.combine import SMOTEENN
 from sklearn.preprocessing import StandardScaler, OneHotEncoder, OrdinalEncoder, PowerTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 from pandas import DataFrame
 
-from US_visa.constants import SCHEMA_FILE_PATH, TARGET_COLUMN, CURRENT_YEAR
+from US_visa.constants import TARGET_COLUMN, CURRENT_YEAR
 from US_visa.entity.config_entity import DataTransformationConfig
 from US_visa.entity.artifact_entity import DataIngestionArtifact, DataValidationArtifact, DataTransformationArtifact
 from US_visa.logger import logging
 from US_visa.exception import USVisaException
-from US_visa.utils.main_utils import save_object, save_numpy_array_data, drop_columns, read_yaml_file
+from US_visa.utils.main_utils import save_object, save_feature_target_data, drop_columns, read_dataframe_with_schema
+from US_visa.entity.schema import get_schema
 from US_visa.entity.estimator import TargetValueMapping
+from US_visa.utils.profiling import profile_step
+from US_visa.utils.preprocessor_cache import PreprocessorCache, fingerprint_training_data
 
 
 class DataTransformation:
@@ -30,15 +32,19 @@ class DataTransformation:
         An artifact containing the validation status of the ingested data.
     data_transformation_config : DataTransformationConfig
         A configuration object for data transformation parameters.
-    _schema_config : dict
-        A dictionary containing the schema configuration read from a YAML file.
+    _schema : Schema
+        The schema parsed once per process by get_schema.
 
     Methods
     -------
-    read_data(file_path) -> DataFrame:
-        Reads the CSV file from the given file path and returns a pandas DataFrame.
+    read_data(file_path, columns=None, schema=None) -> DataFrame:
+        Reads the DataFrame artifact from the given file path and returns a pandas DataFrame.
+    get_input_columns() -> list:
+        Returns the columns the transformation needs from the ingested data.
     get_data_transformer_object() -> Pipeline:
         Creates and returns a preprocessor pipeline for transforming the data.
+    fit_transform_train(preprocessor, features, target) -> tuple:
+        Fits the preprocessor on the training features, or loads it from the preprocessor cache.
     initiate_data_transformation() -> DataTransformationArtifact:
         Initiates the data transformation process and returns a DataTransformationArtifact.
     """
@@ -62,39 +68,59 @@ class DataTransformation:
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_validation_artifact = data_validation_artifact
             self.data_transformation_config = data_transformation_config
-            self._schema_config = read_yaml_file(filepath=SCHEMA_FILE_PATH)
+            self._schema = get_schema()
 
         except Exception as e:
             logging.error(f"Error during Initialization : {e}")
             raise USVisaException(e, sys) from e
 
     @staticmethod
-    def read_data(file_path) -> DataFrame:
+    def read_data(file_path, columns=None, schema=None) -> DataFrame:
         """
-        Reads the CSV file from the given file path and returns a pandas DataFrame.
+        Reads the DataFrame artifact from the given file path and returns a pandas DataFrame
+        with the compact column types declared in the schema.
 
         Parameters
         ----------
         file_path : str
-            The path to the CSV file.
+            The path to the .parquet, .feather or .csv file.
+        columns : list, optional
+            Only read these columns. Defaults to all columns.
+        schema : Schema, optional
+            The schema. Defaults to get_schema().
 
         Returns
         -------
         DataFrame
-            A pandas DataFrame containing the data from the CSV file.
+            A pandas DataFrame containing the data from the file.
         """
         try:
-            return pd.read_csv(file_path)
+            return read_dataframe_with_schema(filepath=file_path, schema=schema, columns=columns)
         except Exception as e:
             logging.error(f"Error during Read Data : {e}")
             raise USVisaException(e, sys) from e
 
+    def get_input_columns(self) -> list:
+        """
+        Returns the columns the transformation needs from the ingested data, so the
+        dropped columns are never read from disk.
+
+        Returns
+        -------
+        list
+            The schema columns minus the drop columns, keeping `yr_of_estab` for `company_age`.
+        """
+        return [column for column in self._schema.column_names
+                if column not in self._schema.drop_columns or column == 'yr_of_estab']
+
     def get_data_transformer_object(self) -> Pipeline:
         """
         Creates and returns a preprocessor pipeline for transforming the data.
 
         The pipeline includes steps for standard scaling, one-hot encoding, ordinal encoding,
-        and power transformation based on the schema configuration.
+        and power transformation based on the schema configuration. It emits a CSR matrix when the
+        density of the output is below `sparse_threshold` of the config, as it gets with high
+        cardinality one-hot encoded columns, so those are never made dense.
 
         Returns
         -------
@@ -112,10 +138,7 @@ class DataTransformation:
 
             logging.info("Initialized StandardScaler, OneHotEncoder, OrdinalEncoder")
 
-            ohe_columns = self._schema_config['ohe_columns']
-            oe_columns = self._schema_config['oe_columns']
-            transform_columns = self._schema_config['transform_columns']
-            num_columns = self._schema_config['num_features']
+            transformer_columns = self._schema.transformer_columns
 
             logging.info("Initialize PowerTransformer")
 
@@ -124,11 +147,11 @@ class DataTransformation:
             ])
 
             preprocessor = ColumnTransformer(transformers=[
-                ("OneHotEncoder", ohe_transformer, ohe_columns),
-                ("OrdinalEncoder", oe_transformer, oe_columns),
-                ("Transformer", transform_pipeline, transform_columns),
-                ("StandardScaler", numeric_transformer, num_columns)
-            ])
+                ("OneHotEncoder", ohe_transformer, transformer_columns["OneHotEncoder"]),
+                ("OrdinalEncoder", oe_transformer, transformer_columns["OrdinalEncoder"]),
+                ("Transformer", transform_pipeline, transformer_columns["Transformer"]),
+                ("StandardScaler", numeric_transformer, transformer_columns["StandardScaler"])
+            ], sparse_threshold=self.data_transformation_config.sparse_threshold)
 
             logging.info("Created preprocessor object from ColumnTransformer")
 
@@ -139,12 +162,61 @@ class DataTransformation:
             logging.error(f"Error during Creating Preprocessor Pipeline : {e}")
             raise USVisaException(e, sys) from e
 
+    def fit_transform_train(self, preprocessor, features: DataFrame, target: pd.Series) -> tuple:
+        """
+        Fits the preprocessor on the training features and transforms them to the feature dtype.
+
+        With `use_preprocessor_cache` set in the config, the fitted preprocessor and the transformed
+        features are looked up by a fingerprint of the training rows and of the transformer
+        configuration first, and stored after a fit.
+
+        Parameters
+        ----------
+        preprocessor : ColumnTransformer
+            The unfitted preprocessor of get_data_transformer_object.
+        features : DataFrame
+            The training features.
+        target : pd.Series
+            The mapped training target, part of the fingerprint.
+
+        Returns
+        -------
+        tuple
+            The fitted preprocessor and the transformed training features.
+        """
+        try:
+            config = self.data_transformation_config
+            cache, fingerprint = None, None
+            if config.use_preprocessor_cache:
+                cache = PreprocessorCache(cache_dir=config.preprocessor_cache_dir,
+                                          max_bytes=config.preprocessor_cache_max_bytes)
+                transformer_config = {"preprocessor": preprocessor.get_params(deep=True),
+                                      "feature_dtype": config.feature_dtype}
+                fingerprint = fingerprint_training_data(features, target, transformer_config)
+                cached = cache.lookup(fingerprint)
+                if cached is not None:
+                    cached_preprocessor, cached_features, _ = cached
+                    return cached_preprocessor, cached_features
+
+            with profile_step("preprocessor_fit_transform", rows=len(features)):
+                transformed_features = preprocessor.fit_transform(features)
+            # the resampling and the model search then work on the stored dtype, not on float64
+            transformed_features = transformed_features.astype(config.feature_dtype, copy=False)
+
+            if cache is not None:
+                cache.store(fingerprint, preprocessor, transformed_features, target.to_numpy())
+            return preprocessor, transformed_features
+
+        except Exception as e:
+            logging.error(f"Error during Fitting the Preprocessor : {e}")
+            raise USVisaException(e, sys) from e
+
     def initiate_data_transformation(self) -> DataTransformationArtifact:
         """
         Initiates the data transformation process and returns a DataTransformationArtifact.
 
-        The process includes reading data, preprocessing, applying SMOTEENN for handling class imbalance,
-        and saving the transformed data and preprocessor object.
+        The process includes reading data, preprocessing, and saving the transformed data and
+        preprocessor object. The class imbalance is handled afterwards by DataResampling.
 
         Returns
         -------
@@ -158,8 +230,18 @@ class DataTransformation:
                 preprocessor = self.get_data_transformer_object()
                 logging.info("Fetched the preprocessor object")
 
-                train_df = DataTransformation.read_data(file_path=self.data_ingestion_artifact.trained_file_path)
-                test_df = DataTransformation.read_data(file_path=self.data_ingestion_artifact.test_file_path)
+                input_columns = self.get_input_columns()
+                # the rows breaking the quality rules were quarantined by the data validation
+                train_file_path = (self.data_validation_artifact.valid_train_file_path
+                                   or self.data_ingestion_artifact.trained_file_path)
+                test_file_path = (self.data_validation_artifact.valid_test_file_path
+                                  or self.data_ingestion_artifact.test_file_path)
+                train_df = DataTransformation.read_data(file_path=train_file_path,
+                                                        columns=input_columns,
+                                                        schema=self._schema)
+                test_df = DataTransformation.read_data(file_path=test_file_path,
+                                                       columns=input_columns,
+                                                       schema=self._schema)
 
                 logging.info("Read the Data from Train and Test File Path..!")
 
@@ -171,12 +253,13 @@ class DataTransformation:
                 input_features_train_df['company_age'] = CURRENT_YEAR - input_features_train_df['yr_of_estab']
                 logging.info("Added company_age column to the Training dataset")
 
-                drop_cols = self._schema_config['drop_columns']
+                drop_cols = self._schema.drop_columns
                 logging.info("Drop the columns in drop_cols of Training dataset")
 
-                input_features_train_df = drop_columns(df=input_features_train_df, cols = drop_cols)
+                input_features_train_df = drop_columns(df=input_features_train_df,
+                                                       cols=[col for col in drop_cols if col in input_features_train_df.columns])
                 
-                target_feature_train_df = target_feature_train_df.replace(TargetValueMapping()._asdict())
+                target_feature_train_df = target_feature_train_df.map(TargetValueMapping()._asdict()).astype(int)
                 logging.info("Target Variable Mapping is Done..!!")
 
                 input_features_test_df = test_df.drop(columns=[TARGET_COLUMN], axis=1)
@@ -185,45 +268,32 @@ class DataTransformation:
                 input_features_test_df['company_age'] = CURRENT_YEAR - input_features_test_df['yr_of_estab']
                 logging.info("Added company_age column to the Test dataset")
 
-                target_feature_test_df = target_feature_test_df.replace(TargetValueMapping()._asdict())
+                target_feature_test_df = target_feature_test_df.map(TargetValueMapping()._asdict()).astype(int)
 
                 logging.info("Got train features and target features of Testing dataset")
                 logging.info("Applying preprocessing object on training dataframe and testing dataframe")
 
-                input_features_train_arr = preprocessor.fit_transform(input_features_train_df)
+                preprocessor, input_features_train_arr = self.fit_transform_train(
+                    preprocessor, input_features_train_df, target_feature_train_df
+                )
                 logging.info("TRANSFORMED the preprocessor object to fit transform the train features")
 
-                input_features_test_arr = preprocessor.transform(input_features_test_df)
+                feature_dtype = self.data_transformation_config.feature_dtype
+                input_features_test_arr = preprocessor.transform(input_features_test_df).astype(feature_dtype, copy=False)
                 logging.info("TRANSFORMED the preprocessor object to transform the test features")
 
-                logging.info("Applying SMOTEENN on Training dataset")
-                smt = SMOTEENN(sampling_strategy='minority')
-
-                input_features_train_final, target_feature_train_final = smt.fit_resample(
-                    input_features_train_arr, target_feature_train_df
-                )
-
-                logging.info("Applied SMOTEENN on training dataset")
-
-                logging.info("Applying SMOTEENN on testing dataset")
-                input_features_test_final, target_feature_test_final = smt.fit_resample(
-                    input_features_test_arr, target_feature_test_df
-                )
-
-                logging.info("Applied SMOTEENN on testing dataset")
-
-                logging.info("Created train array and test array")
-                train_arr = np.c_[
-                    input_features_train_final, np.array(target_feature_train_final)
-                ]
-
-                test_arr = np.c_[
-                    input_features_test_final, np.array(target_feature_test_final)
-                ]
-
-                save_object(filepath=self.data_transformation_config.transformed_object_file_path, obj=preprocessor)
-                save_numpy_array_data(filepath=self.data_transformation_config.transformed_train_file_path, array=train_arr)
-                save_numpy_array_data(filepath=self.data_transformation_config.transformed_test_file_path, array=test_arr)
+                # the class imbalance of the training set is handled by the data resampling stage
+                with profile_step("transformed_data_write",
+                                  rows=input_features_train_arr.shape[0] + input_features_test_arr.shape[0]):
+                    save_object(filepath=self.data_transformation_config.transformed_object_file_path, obj=preprocessor)
+                    save_feature_target_data(dirpath=self.data_transformation_config.transformed_train_file_path,
+                                             features=input_features_train_arr,
+                                             target=target_feature_train_df.to_numpy(),
+                                             dtype=feature_dtype)
+                    save_feature_target_data(dirpath=self.data_transformation_config.transformed_test_file_path,
+                                             features=input_features_test_arr,
+                                             target=target_feature_test_df.to_numpy(),
+                                             dtype=feature_dtype)
 
                 logging.info("Saved the preprocessor object")
 
@@ -1,18 +1,29 @@
+import os
 import json
 import sys
+import dataclasses
 
 import pandas as pd
-from evidently.model_profile import Profile
-from evidently.model_profile.sections import DataDriftProfileSection
 
 from pandas import DataFrame
 
 from US_visa.exception import USVisaException
 from US_visa.logger import logging
-from US_visa.utils.main_utils import read_yaml_file, write_yaml_file
-from US_visa.entity.artifact_entity import DataIngestionArtifact, DataValidationArtifact
+from US_visa.utils.main_utils import (write_yaml_file, read_dataframe_with_schema, save_dataframe,
+                                     concat_dataframe_chunks)
+from US_visa.utils.profiling import profile_step
+from US_visa.utils.drift_utils import detect_drift, compare_profiles, add_confidence_intervals
+from US_visa.utils.sampling_utils import sample_dataframe, dkw_sample_size
+from US_visa.utils.quality_utils import split_valid_rows
+from US_visa.utils.parallel_utils import resolve_max_workers
+from US_visa.entity.data_profile import DataProfile
+from US_visa.entity.schema import get_schema
+from US_visa.entity.artifact_entity import DataIngestionArtifact, DataValidationArtifact, DataDriftArtifact
 from US_visa.entity.config_entity import DataValidationConfig
-from US_visa.constants import SCHEMA_FILE_PATH
+
+
+"The drift modes of DataValidationConfig.drift_mode"
+DRIFT_MODES = ("exact", "profile", "sampled")
 
 
 class DataValidation:
@@ -22,12 +33,25 @@ class DataValidation:
         :param data_validation_config: configuration for data validation
         """
         try:
+            if data_validation_config.drift_mode not in DRIFT_MODES:
+                raise ValueError(f"Unknown drift mode {data_validation_config.drift_mode!r}, expected one of {DRIFT_MODES}")
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_validation_config = data_validation_config
-            self._schema_config =read_yaml_file(filepath=SCHEMA_FILE_PATH)
+            self._schema = get_schema()
         except Exception as e:
             raise USVisaException(e,sys)
 
+    def get_max_workers(self, n_rows: int) -> int:
+        """
+        Method Name :   get_max_workers
+        Description :   This method gives the number of processes running the per-column checks and drift tests
+                        on n_rows rows, 1 below parallel_min_rows where the pool costs more than it saves
+
+        Output      :   Returns the number of worker processes
+        """
+        return resolve_max_workers(max_workers=self.data_validation_config.max_workers, n_rows=n_rows,
+                                   min_rows=self.data_validation_config.parallel_min_rows)
+
     def validate_number_of_columns(self, dataframe: DataFrame) -> bool:
         """
         Method Name :   validate_number_of_columns
@@ -37,7 +61,7 @@ class DataValidation:
         On Failure  :   Write an exception log and then raise an exception
         """
         try:
-            status = len(dataframe.columns) == len(self._schema_config["columns"])
+            status = len(dataframe.columns) == len(self._schema.columns)
             logging.info(f"Is required column present: [{status}]")
             return status
         except Exception as e:
@@ -57,7 +81,7 @@ class DataValidation:
             missing_categorical_columns = []
 
             "Validate Numerical Columns"
-            for column in self._schema_config["numerical_columns"]:
+            for column in self._schema.numerical_columns:
                 if column not in dataframe_columns:
                     missing_numerical_columns.append(column)
 
@@ -65,7 +89,7 @@ class DataValidation:
                 logging.info(f"Missing numerical column: {missing_numerical_columns}")
 
             "Validate Categorical Columns"
-            for column in self._schema_config["categorical_columns"]:
+            for column in self._schema.categorical_columns:
                 if column not in dataframe_columns:
                     missing_categorical_columns.append(column)
 
@@ -77,21 +101,151 @@ class DataValidation:
             raise USVisaException(e, sys) from e
 
     @staticmethod
-    def read_data(file_path) -> DataFrame:
+    def read_data(file_path, columns=None, schema=None) -> DataFrame:
         try:
-            return pd.read_csv(file_path)
+            return read_dataframe_with_schema(filepath=file_path, schema=schema, columns=columns)
         except Exception as e:
             raise USVisaException(e, sys)
 
     def detect_dataset_drift(self, reference_df: DataFrame, current_df: DataFrame, ) -> bool:
         """
         Method Name :   detect_dataset_drift
-        Description :   This method validates if drift is detected
+        Description :   This method validates if drift is detected, with the engine set in the config
         
         Output      :   Returns bool value based on validation results
         On Failure  :   Write an exception log and then raise an exception
         """
         try:
+            with profile_step("drift_profile", rows=len(reference_df) + len(current_df)):
+                if self.data_validation_config.drift_engine == "evidently":
+                    return self.detect_dataset_drift_with_evidently(reference_df, current_df)
+                return self.detect_dataset_drift_natively(reference_df, current_df)
+        except Exception as e:
+            raise USVisaException(e, sys) from e
+
+    def detect_dataset_drift_natively(self, reference_df: DataFrame, current_df: DataFrame) -> bool:
+        """
+        Method Name :   detect_dataset_drift_natively
+        Description :   This method computes KS / PSI on the numerical columns and chi-square / Jensen-Shannon
+                        on the categorical columns, and writes the compact drift report. In sampled mode the
+                        reference is profiled from a sample and compared like a reference profile
+
+        Output      :   Returns bool value based on validation results
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            config = self.data_validation_config
+            if config.drift_mode == "sampled":
+                reference_sample = self.sample_for_drift(reference_df)
+                reference_profile = DataProfile.from_dataframe(
+                    reference_sample,
+                    numerical_columns=self._schema.numerical_columns,
+                    categorical_columns=self._schema.categorical_columns)
+                return self.compare_with_reference_profile(reference_profile, current_df,
+                                                           reference_sampled=len(reference_sample) < len(reference_df))
+
+            report = detect_drift(reference_df, current_df,
+                                  numerical_columns=self._schema.numerical_columns,
+                                  categorical_columns=self._schema.categorical_columns,
+                                  p_value_threshold=config.drift_p_value_threshold,
+                                  psi_threshold=config.drift_psi_threshold,
+                                  distance_threshold=config.drift_distance_threshold,
+                                  drift_share=config.drift_share,
+                                  small_sample_size=config.drift_small_sample_size,
+                                  max_workers=self.get_max_workers(len(reference_df) + len(current_df)))
+
+            write_yaml_file(filepath=config.drift_report_file_path, content=report)
+
+            logging.info(f"{report['n_drifted_features']}/{report['n_features']} drift detected.")
+            return report["dataset_drift"]
+        except Exception as e:
+            raise USVisaException(e, sys) from e
+
+    def sample_for_drift(self, dataframe: DataFrame) -> DataFrame:
+        """
+        Method Name :   sample_for_drift
+        Description :   This method draws the stratified reservoir sample used in sampled drift mode. Its size is
+                        drift_sample_size, or the DKW sample size of drift_error_tolerance when it is not set
+
+        Output      :   Returns the sample, the whole dataframe when it is not larger than the sample size
+        """
+        config = self.data_validation_config
+        sample_size = config.drift_sample_size or dkw_sample_size(config.drift_error_tolerance,
+                                                                  config.drift_confidence_level)
+        return sample_dataframe(dataframe, sample_size=sample_size, stratify_column=config.drift_stratify_column,
+                                random_state=config.drift_random_state)
+
+    def detect_dataset_drift_against_profile(self, reference_profile: DataProfile, current_df: DataFrame) -> bool:
+        """
+        Method Name :   detect_dataset_drift_against_profile
+        Description :   This method compares the current data with the reference profile of the ingestion,
+                        timed as the drift_profile step
+
+        Output      :   Returns bool value based on validation results
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            with profile_step("drift_profile", rows=len(current_df)):
+                return self.compare_with_reference_profile(reference_profile, current_df)
+        except Exception as e:
+            raise USVisaException(e, sys) from e
+
+    def compare_with_reference_profile(self, reference_profile: DataProfile, current_df: DataFrame,
+                                       reference_sampled: bool = False) -> bool:
+        """
+        Method Name :   compare_with_reference_profile
+        Description :   This method profiles the current data with the bins and categories of the reference
+                        profile and compares the two, so the reference data is not read again. In sampled mode
+                        only a sample of the current data is profiled, and the statistics of the report get
+                        confidence intervals
+
+        Output      :   Returns bool value based on validation results
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            config = self.data_validation_config
+            current_sample = self.sample_for_drift(current_df) if config.drift_mode == "sampled" else current_df
+            current_profile = reference_profile.empty_like()
+            current_profile.update(current_sample, max_workers=self.get_max_workers(len(current_sample)))
+            report = compare_profiles(reference_profile, current_profile,
+                                      p_value_threshold=config.drift_p_value_threshold,
+                                      psi_threshold=config.drift_psi_threshold,
+                                      distance_threshold=config.drift_distance_threshold,
+                                      drift_share=config.drift_share,
+                                      small_sample_size=config.drift_small_sample_size)
+            report["mode"] = config.drift_mode
+            current_sampled = len(current_sample) < len(current_df)
+            if reference_sampled or current_sampled:
+                report["sample_sizes"] = {"reference": reference_profile.n_rows, "current": len(current_sample)}
+                add_confidence_intervals(report, reference_profile, current_profile,
+                                         reference_sampled=reference_sampled,
+                                         current_sampled=current_sampled,
+                                         confidence_level=config.drift_confidence_level,
+                                         n_resamples=config.drift_bootstrap_resamples,
+                                         p_value_threshold=config.drift_p_value_threshold,
+                                         psi_threshold=config.drift_psi_threshold,
+                                         distance_threshold=config.drift_distance_threshold,
+                                         random_state=config.drift_random_state)
+
+            write_yaml_file(filepath=config.drift_report_file_path, content=report)
+
+            logging.info(f"{report['n_drifted_features']}/{report['n_features']} drift detected against the reference profile.")
+            return report["dataset_drift"]
+        except Exception as e:
+            raise USVisaException(e, sys) from e
+
+    def detect_dataset_drift_with_evidently(self, reference_df: DataFrame, current_df: DataFrame) -> bool:
+        """
+        Method Name :   detect_dataset_drift_with_evidently
+        Description :   This method builds the evidently data drift profile and writes its full report
+
+        Output      :   Returns bool value based on validation results
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            from evidently.model_profile import Profile
+            from evidently.model_profile.sections import DataDriftProfileSection
+
             data_drift_profile = Profile(sections=[DataDriftProfileSection()])
 
             data_drift_profile.calculate(reference_df, current_df)
@@ -110,20 +264,16 @@ class DataValidation:
         except Exception as e:
             raise USVisaException(e, sys) from e
 
-    def initiate_data_validation(self) -> DataValidationArtifact:
+    def get_validation_error_message(self, train_df: DataFrame, test_df: DataFrame) -> str:
         """
-        Method Name :   initiate_data_validation
-        Description :   This method initiates the data validation component for the pipeline
-        
-        Output      :   Returns bool value based on validation results
+        Method Name :   get_validation_error_message
+        Description :   This method runs the column checks on the train and test set
+
+        Output      :   Returns the validation error message, empty when all checks pass
         On Failure  :   Write an exception log and then raise an exception
         """
-
         try:
             validation_error_msg = ""
-            logging.info("Starting data validation")
-            train_df, test_df = (DataValidation.read_data(file_path=self.data_ingestion_artifact.trained_file_path),
-                                 DataValidation.read_data(file_path=self.data_ingestion_artifact.test_file_path))
 
             "Validate all columns Train Set"
             status = self.validate_number_of_columns(dataframe=train_df)
@@ -149,26 +299,206 @@ class DataValidation:
             if not status:
                 validation_error_msg += f"columns are missing in test dataframe."
 
-            validation_status = len(validation_error_msg) == 0
+            return validation_error_msg
+        except Exception as e:
+            raise USVisaException(e, sys) from e
 
-            if validation_status:
-                drift_status = self.detect_dataset_drift(train_df, test_df)
-                if drift_status:
-                    logging.info(f"Drift detected.")
-                    validation_error_msg = "Drift detected"
-                else:
-                    validation_error_msg = "Drift not detected"
+    def read_train_test_data(self):
+        return (DataValidation.read_data(file_path=self.data_ingestion_artifact.trained_file_path,
+                                         schema=self._schema),
+                DataValidation.read_data(file_path=self.data_ingestion_artifact.test_file_path,
+                                         schema=self._schema))
+
+    def quarantine_invalid_rows(self, train_df: DataFrame, test_df: DataFrame) -> tuple:
+        """
+        Method Name :   quarantine_invalid_rows
+        Description :   This method evaluates the row level quality rules of the schema on the train and test set.
+                        The valid rows are written for the next stages and the invalid ones, with the rules they
+                        break, to the quarantine file, so a few bad records do not fail the whole run
+
+        Output      :   Returns the valid train and test set, and an error message when more than
+                        max_quarantine_ratio of the rows are quarantined
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            config = self.data_validation_config
+            quality_report = {}
+            valid_dfs, quarantined_dfs = [], []
+            with profile_step("row_quality_checks", rows=len(train_df) + len(test_df)):
+                for split, df, valid_file_path in (("train", train_df, config.valid_train_file_path),
+                                                   ("test", test_df, config.valid_test_file_path)):
+                    valid_df, invalid_df, rule_counts = split_valid_rows(df=df, schema=self._schema)
+                    invalid_df.insert(0, "split", split)
+                    save_dataframe(filepath=valid_file_path, df=valid_df)
+                    valid_dfs.append(valid_df)
+                    quarantined_dfs.append(invalid_df)
+                    quality_report[split] = {"n_rows": len(df), "n_quarantined": len(invalid_df),
+                                             "rule_counts": rule_counts}
+                    logging.info(f"Quarantined {len(invalid_df)} of {len(df)} {split} rows: {rule_counts}")
+                save_dataframe(filepath=config.quarantine_file_path, df=concat_dataframe_chunks(quarantined_dfs))
+
+            n_rows = len(train_df) + len(test_df)
+            quarantine_ratio = sum(len(df) for df in quarantined_dfs) / n_rows if n_rows else 0.0
+            quality_report.update(quarantine_ratio=quarantine_ratio, max_quarantine_ratio=config.max_quarantine_ratio)
+            write_yaml_file(filepath=config.quality_report_file_path, content=quality_report, replace=True)
+
+            validation_error_msg = ""
+            if quarantine_ratio > config.max_quarantine_ratio:
+                validation_error_msg = (f"{quarantine_ratio:.2%} of the rows break the data quality rules, "
+                                        f"more than {config.max_quarantine_ratio:.2%}.")
+            return valid_dfs[0], valid_dfs[1], validation_error_msg
+        except Exception as e:
+            raise USVisaException(e, sys) from e
+
+    def get_validation_artifact(self, validation_error_msg: str, quality_checked: bool) -> DataValidationArtifact:
+        """
+        Method Name :   get_validation_artifact
+        Description :   This method builds the validation artifact, pointing at the validated train and test set
+                        when every check passed. quality_checked tells if the row checks ran, they are skipped when
+                        the column checks fail
+
+        Output      :   Returns the validation artifact, its message holds the validation errors
+        """
+        config = self.data_validation_config
+        validation_status = len(validation_error_msg) == 0
+        if not validation_status:
+            logging.info(f"Validation_error: {validation_error_msg}")
+        return DataValidationArtifact(
+            validation_status=validation_status,
+            message=validation_error_msg,
+            drift_report_file_path=config.drift_report_file_path,
+            valid_train_file_path=config.valid_train_file_path if validation_status else None,
+            valid_test_file_path=config.valid_test_file_path if validation_status else None,
+            quarantine_file_path=config.quarantine_file_path if quality_checked else None,
+            quality_report_file_path=config.quality_report_file_path if quality_checked else None
+        )
+
+    def initiate_schema_validation(self) -> DataValidationArtifact:
+        """
+        Method Name :   initiate_schema_validation
+        Description :   This method runs the column checks and quarantines the rows breaking the quality
+                        rules, so the pipeline can go on while the drift report is computed by
+                        initiate_drift_detection
+
+        Output      :   Returns the validation artifact, its message holds the validation errors
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            logging.info("Starting schema validation")
+            train_df, test_df = self.read_train_test_data()
+            validation_error_msg = self.get_validation_error_message(train_df=train_df, test_df=test_df)
+            quality_checked = len(validation_error_msg) == 0
+            if quality_checked:
+                _, _, validation_error_msg = self.quarantine_invalid_rows(train_df=train_df, test_df=test_df)
+            data_validation_artifact = self.get_validation_artifact(validation_error_msg, quality_checked=quality_checked)
+            logging.info(f"Schema validation artifact: {data_validation_artifact}")
+            return data_validation_artifact
+        except Exception as e:
+            raise USVisaException(e, sys) from e
+
+    def uses_reference_profile(self) -> bool:
+        """
+        Method Name :   uses_reference_profile
+        Description :   This method tells if drift is checked against the reference profile of the ingestion. The
+                        exact mode never uses it: it compares the raw rows of the train and test set
+
+        Output      :   Returns True with the native engine, a profile or sampled drift mode and a reference
+                        profile on disk
+        """
+        config = self.data_validation_config
+        reference_profile_file_path = getattr(self.data_ingestion_artifact, "reference_profile_file_path", None)
+        return (config.drift_engine == "native" and config.drift_mode != "exact"
+                and reference_profile_file_path is not None and os.path.exists(reference_profile_file_path))
+
+    def initiate_drift_detection(self, data_validation_artifact: DataValidationArtifact) -> DataDriftArtifact:
+        """
+        Method Name :   initiate_drift_detection
+        Description :   This method writes the drift report of the validated test set against the reference
+                        profile of the train set, or against the validated train set when there is no profile
+                        or the evidently engine is used. Drift is not computed when the validation of
+                        initiate_schema_validation failed
+
+        Output      :   Returns the data drift artifact
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            logging.info("Starting drift detection")
+            drift_status = False
+            if not data_validation_artifact.validation_status:
+                logging.info("Skipping drift detection, the validation failed")
+            elif self.uses_reference_profile():
+                test_df = DataValidation.read_data(file_path=data_validation_artifact.valid_test_file_path,
+                                                   schema=self._schema)
+                reference_profile = DataProfile.load(self.data_ingestion_artifact.reference_profile_file_path)
+                drift_status = self.detect_dataset_drift_against_profile(reference_profile, test_df)
             else:
-                logging.info(f"Validation_error: {validation_error_msg}")
-                
+                train_df = DataValidation.read_data(file_path=data_validation_artifact.valid_train_file_path,
+                                                    schema=self._schema)
+                test_df = DataValidation.read_data(file_path=data_validation_artifact.valid_test_file_path,
+                                                   schema=self._schema)
+                drift_status = self.detect_dataset_drift(train_df, test_df)
 
-            data_validation_artifact = DataValidationArtifact(
-                validation_status=validation_status,
-                message=validation_error_msg,
+            data_drift_artifact = DataDriftArtifact(
+                drift_status=drift_status,
                 drift_report_file_path=self.data_validation_config.drift_report_file_path
             )
+            logging.info(f"Data drift artifact: {data_drift_artifact}")
+            return data_drift_artifact
+        except Exception as e:
+            raise USVisaException(e, sys) from e
+
+    @staticmethod
+    def merge_artifacts(data_validation_artifact: DataValidationArtifact,
+                        data_drift_artifact: DataDriftArtifact) -> DataValidationArtifact:
+        """
+        Method Name :   merge_artifacts
+        Description :   This method puts the drift outcome into the message of a passing validation artifact
+
+        Output      :   Returns the combined validation artifact
+        """
+        if not data_validation_artifact.validation_status:
+            return data_validation_artifact
+        if data_drift_artifact.drift_status:
+            logging.info(f"Drift detected.")
+        return dataclasses.replace(
+            data_validation_artifact,
+            message="Drift detected" if data_drift_artifact.drift_status else "Drift not detected",
+            drift_report_file_path=data_drift_artifact.drift_report_file_path
+        )
+
+    def initiate_data_validation(self) -> DataValidationArtifact:
+        """
+        Method Name :   initiate_data_validation
+        Description :   This method initiates the data validation component for the pipeline
+        
+        Output      :   Returns bool value based on validation results
+        On Failure  :   Write an exception log and then raise an exception
+        """
+
+        try:
+            logging.info("Starting data validation")
+            train_df, test_df = self.read_train_test_data()
+
+            validation_error_msg = self.get_validation_error_message(train_df=train_df, test_df=test_df)
+            quality_checked = len(validation_error_msg) == 0
+            if quality_checked:
+                train_df, test_df, validation_error_msg = self.quarantine_invalid_rows(train_df=train_df,
+                                                                                        test_df=test_df)
+            data_validation_artifact = self.get_validation_artifact(validation_error_msg, quality_checked=quality_checked)
+
+            if data_validation_artifact.validation_status:
+                if self.uses_reference_profile():
+                    reference_profile = DataProfile.load(self.data_ingestion_artifact.reference_profile_file_path)
+                    drift_status = self.detect_dataset_drift_against_profile(reference_profile, test_df)
+                else:
+                    drift_status = self.detect_dataset_drift(train_df, test_df)
+                data_drift_artifact = DataDriftArtifact(
+                    drift_status=drift_status,
+                    drift_report_file_path=self.data_validation_config.drift_report_file_path
+                )
+                data_validation_artifact = DataValidation.merge_artifacts(data_validation_artifact, data_drift_artifact)
 
             logging.info(f"Data validation artifact: {data_validation_artifact}")
             return data_validation_artifact
         except Exception as e:
-            raise USVisaException(e, sys) from e
\ No newline at end of file
+            raise USVisaException(e, sys) from e
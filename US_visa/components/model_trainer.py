@@ -1,26 +1,32 @@
 ## -*- Code:Utf -*-
 
 import sys
-from typing import Tuple
+import importlib
+from typing import Optional, Tuple
 
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
 
 from sklearn.metrics import accuracy_score, f1_score, recall_score, precision_score
-from US_visa.utils.main_utils import load_numpy_array_data, load_object, save_object, read_yaml_file
+from US_visa.utils.main_utils import load_feature_target_data, load_object, save_object, read_yaml_file
+from US_visa.utils.profiling import profile_step
 
 from US_visa.logger import logging
 from US_visa.exception import USVisaException
 
 from US_visa.entity.artifact_entity import (DataTransformationArtifact,
+                                            DataResamplingArtifact,
                                             ModelTrainerArtifact,
                                             ClassificationMetricsArtifact)
 
 from US_visa.entity.config_entity import ModelTrainerConfig
 from US_visa.entity.estimator import USvisaModel
-from neuro_mf import ModelFactory
+from US_visa.utils.model_selection import ModelSelection
+from US_visa.utils.cv_result_cache import CVResultCache
 from pandas import DataFrame
 from sklearn.pipeline import Pipeline
+from sklearn.utils import get_tags
 
 
 class ModelTrainer:
@@ -33,16 +39,21 @@ class ModelTrainer:
         An artifact containing paths to the transformed training and testing datasets.
     model_trainer_config : ModelTrainerConfig
         Configuration for the model training process.
+    data_resampling_artifact : DataResamplingArtifact, optional
+        The resampled training set, and the class weight to train with when it was not resampled.
 
     Methods
     -------
-    get_model_object_and_report(train: np.array, test: np.array) -> Tuple[object, object]:
+    estimators_accept_sparse() -> bool:
+        Whether every estimator of the model config accepts sparse features.
+    get_model_object_and_report(x_train, y_train, x_test, y_test, class_weight=None) -> Tuple[object, object]:
         Trains the model using the training data and evaluates it using the testing data.
     initiate_model_trainer() -> ModelTrainerArtifact:
         Initiates the model training process and returns an artifact containing the trained model and its metrics.
     """
 
-    def __init__(self, data_transformation_artifact: DataTransformationArtifact, model_trainer_config: ModelTrainerConfig):
+    def __init__(self, data_transformation_artifact: DataTransformationArtifact, model_trainer_config: ModelTrainerConfig,
+                 data_resampling_artifact: Optional[DataResamplingArtifact] = None):
         """
         Initializes the ModelTrainer with data transformation artifacts and model training configuration.
 
@@ -52,20 +63,50 @@ class ModelTrainer:
             An artifact containing paths to the transformed training and testing datasets.
         model_trainer_config : ModelTrainerConfig
             Configuration for the model training process.
+        data_resampling_artifact : DataResamplingArtifact, optional
+            The resampled training set. Defaults to training on the transformed training set.
         """
         self.data_transformation_artifact = data_transformation_artifact
         self.model_trainer_config = model_trainer_config
+        self.data_resampling_artifact = data_resampling_artifact
 
-    def get_model_object_and_report(self, train: np.array, test: np.array) -> Tuple[object, object]:
+    def estimators_accept_sparse(self) -> bool:
+        """
+        Whether every estimator of the model config accepts sparse features, read from the
+        scikit-learn input tags of its class.
+
+        Returns
+        -------
+        bool
+            True when the sparse feature matrices can be passed to the candidate search as they are.
+        """
+        try:
+            model_config = read_yaml_file(filepath=self.model_trainer_config.model_config_file_path)
+            for module_config in model_config["model_selection"].values():
+                estimator_class = getattr(importlib.import_module(module_config["module"]), module_config["class"])
+                if not get_tags(estimator_class()).input_tags.sparse:
+                    logging.info(f"{module_config['class']} does not accept sparse features")
+                    return False
+            return True
+
+        except Exception as e:
+            logging.error(f"Error reading the input tags of the estimators: {e}")
+            raise USVisaException(e, sys) from e
+
+    def get_model_object_and_report(self, x_train, y_train: np.array, x_test, y_test: np.array,
+                                    class_weight: Optional[str] = None) -> Tuple[object, object]:
         """
         Trains the model using the training data and evaluates it using the testing data.
 
         Parameters
         ----------
-        train : np.array
-            The training dataset.
-        test : np.array
-            The testing dataset.
+        x_train, x_test : np.array or scipy.sparse.csr_matrix
+            The training and testing features.
+        y_train, y_test : np.array
+            The training and testing labels.
+        class_weight : str, optional
+            Set as the class_weight of the estimators that have one, e.g. balanced when the
+            training set was not resampled. Defaults to None.
 
         Returns
         -------
@@ -78,14 +119,19 @@ class ModelTrainer:
             If an error occurs during model training or evaluation.
         """
         try:
-            logging.info("Using neuro_mf to get best model object and report")
-            model_factory = ModelFactory(model_config_path=self.model_trainer_config.model_config_file_path)
-
-            x_train, y_train, x_test, y_test = train[:, :-1], train[:, -1], test[:, :-1], test[:, -1]
-
-            best_model_detail = model_factory.get_best_model(
-                X=x_train, y=y_train, base_accuracy=self.model_trainer_config.expected_accuracy
-            )
+            logging.info("Using ModelSelection to get best model object and report")
+            config = self.model_trainer_config
+            cv_cache = None
+            if config.use_cv_cache:
+                cv_cache = CVResultCache(cache_dir=config.cv_cache_dir, max_bytes=config.cv_cache_max_bytes)
+            model_selection = ModelSelection(model_config_path=config.model_config_file_path,
+                                             max_workers=config.max_workers, cv_cache=cv_cache)
+
+            with profile_step("model_search", rows=x_train.shape[0]):
+                best_model_detail = model_selection.get_best_model(
+                    X=x_train, y=y_train, base_accuracy=self.model_trainer_config.expected_accuracy,
+                    class_weight=class_weight
+                )
 
             model_obj = best_model_detail.best_model
 
@@ -102,7 +148,7 @@ class ModelTrainer:
             return best_model_detail, metric_artifacts
 
         except Exception as e:
-            logging.error(f"Error during get model object and report using neuro_mf: {e}")
+            logging.error(f"Error during get model object and report: {e}")
             raise USVisaException(e, sys) from e
 
     def initiate_model_trainer(self, ) -> ModelTrainerArtifact:
@@ -120,10 +166,24 @@ class ModelTrainer:
             If an error occurs during the model training process.
         """
         try:
-            train_arr = load_numpy_array_data(filepath=self.data_transformation_artifact.transformed_train_file_path)
-            test_arr = load_numpy_array_data(filepath=self.data_transformation_artifact.transformed_test_file_path)
-
-            best_model_detail, metric_artifact = self.get_model_object_and_report(train=train_arr, test=test_arr)
+            # memory mapped, the arrays are paged in as the search reads them and the page cache is
+            # shared with any worker process mapping the same files
+            mmap_mode = self.model_trainer_config.mmap_mode
+            train_file_path, class_weight = self.data_transformation_artifact.transformed_train_file_path, None
+            if self.data_resampling_artifact is not None:
+                train_file_path = self.data_resampling_artifact.resampled_train_file_path
+                class_weight = self.data_resampling_artifact.class_weight
+            x_train, y_train = load_feature_target_data(dirpath=train_file_path, mmap_mode=mmap_mode)
+            x_test, y_test = load_feature_target_data(dirpath=self.data_transformation_artifact.transformed_test_file_path,
+                                                      mmap_mode=mmap_mode)
+
+            if sp.issparse(x_train) and not self.estimators_accept_sparse():
+                logging.info("Densifying the sparse features for the estimators of the model config")
+                x_train, x_test = x_train.toarray(), x_test.toarray()
+
+            best_model_detail, metric_artifact = self.get_model_object_and_report(x_train=x_train, y_train=y_train,
+                                                                                  x_test=x_test, y_test=y_test,
+                                                                                  class_weight=class_weight)
 
             preprocessing_obj = load_object(filepath=self.data_transformation_artifact.transformed_object_file_path)
 
@@ -136,7 +196,8 @@ class ModelTrainer:
             logging.info("Created usvisa model object with preprocessor and model")
             logging.info("Created best model file path.")
 
-            save_object(filepath=self.model_trainer_config.trained_model_file_path, obj=usvisa_model)
+            with profile_step("model_save"):
+                save_object(filepath=self.model_trainer_config.trained_model_file_path, obj=usvisa_model)
 
             model_trainer_artifact = ModelTrainerArtifact(trained_model_file_path=self.model_trainer_config.trained_model_file_path,
                                                           metrics_artifacts=metric_artifact)
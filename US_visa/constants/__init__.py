@@ -21,16 +21,29 @@ PIPELINE_NAME : str= "usvisa"
 ARTIFACTS_DIR : str="artifacts"
 
 
-TRAIN_FILE_NAME :str="train.csv" 
-TEST_FILE_NAME :str="test.csv" 
+"Format of the DataFrame artifacts: parquet, feather or csv"
+ARTIFACT_FILE_FORMAT :str="parquet"
 
-FILE_NAME :str="US_visa.csv"
+TRAIN_FILE_NAME :str=f"train.{ARTIFACT_FILE_FORMAT}"
+TEST_FILE_NAME :str=f"test.{ARTIFACT_FILE_FORMAT}"
+
+FILE_NAME :str=f"US_visa.{ARTIFACT_FILE_FORMAT}"
 MODEL_FILE_NAME = "model.pkl"
 
 TARGET_COLUMN = "case_status"
 CURRENT_YEAR = date.today().year
 PREPROCESSING_OBJECT_FILE_NAME="Preprocessor.pkl"
 SCHEMA_FILE_PATH = os.path.join("config","schema.yaml")
+STAGE_CACHE_DIR :str=os.path.join(ARTIFACTS_DIR, "stage_cache")
+RUN_MANIFEST_FILE_NAME :str="run_manifest.yaml"
+STAGE_TIMELINE_FILE_NAME :str="stage_timeline.yaml"
+PIPELINE_MAX_STAGE_WORKERS :int=2
+METRICS_FILE_NAME :str="metrics.json"
+PROFILES_DIR_NAME :str="profiles"
+
+"Set USVISA_PROFILE_STAGE to a stage or step name to profile it, with USVISA_PROFILER=cprofile or pyinstrument"
+PROFILE_STAGE_ENV_KEY = "USVISA_PROFILE_STAGE"
+PROFILER_ENV_KEY = "USVISA_PROFILER"
 
 
 """
@@ -43,6 +56,29 @@ DATA_INGESTION_FEATURE_STORE_DIR :str="Feature_store"
 DATA_INGESTION_INGESTED_DIR :str="Ingested"
 DATA_INGESTION_TRAIN_TEST_SPLIT_RATIO :float=0.2
 
+"Seed of the train test split, so re-ingesting the same rows gives the same split and the fingerprint keyed caches hit"
+DATA_INGESTION_SPLIT_RANDOM_STATE :int=42
+DATA_INGESTION_BATCH_SIZE :int=10000
+DATA_INGESTION_EXPORT_PARTITIONS :int=1
+DATA_INGESTION_PARTITION_KEY :str="_id"
+
+"Partition keys sampled per export partition to place the split points, 100 keep the partitions within about 10% of each other"
+DATA_INGESTION_PARTITION_SAMPLES :int=100
+DATA_INGESTION_INCREMENTAL :bool=False
+DATA_INGESTION_WATERMARK_FIELD :str="_id"
+
+"Field set on every insert and update of a document. Without one, in-place updates are invisible and the ingestion stage is never cached"
+DATA_INGESTION_UPDATED_AT_FIELD = None
+DATA_INGESTION_PERSISTENT_FEATURE_STORE_DIR :str=os.path.join(ARTIFACTS_DIR, "feature_store")
+DATA_INGESTION_WATERMARK_FILE_NAME :str="watermark.yaml"
+
+"Directory of the train test split and the profile of every partition of the persistent feature store, taken once when it is appended"
+DATA_INGESTION_PARTITION_SPLITS_DIR :str="splits"
+DATA_INGESTION_REFERENCE_PROFILE_FILE_NAME :str="reference_profile.yaml"
+DATA_INGESTION_PROFILE_N_BINS :int=10
+DATA_INGESTION_PROFILE_N_QUANTILES :int=100
+DATA_INGESTION_PROFILE_MAX_CATEGORIES :int=50
+
 
 """
 DATA VALIDATION Related CONSTANTS starts with DATA_VALIDATION VAR NAME
@@ -52,6 +88,30 @@ DATA_VALIDATION_DIR_NAME :str= "data_validation"
 DATA_VALIDATION_DRIFT_REPORT_DIR :str="drift_report"
 DATA_VALIDATION_DRIFT_REPORT_FILE_NAME :str= "drift_report.yaml"
 
+"Drift engine: native (NumPy statistics) or evidently"
+DATA_VALIDATION_DRIFT_ENGINE :str= "native"
+DATA_VALIDATION_DRIFT_P_VALUE_THRESHOLD :float= 0.05
+DATA_VALIDATION_DRIFT_PSI_THRESHOLD :float= 0.1
+DATA_VALIDATION_DRIFT_DISTANCE_THRESHOLD :float= 0.1
+DATA_VALIDATION_DRIFT_SHARE :float= 0.5
+DATA_VALIDATION_DRIFT_SMALL_SAMPLE_SIZE :int= 1000
+
+"Drift mode: exact on every raw row, for audits, profile against the binned reference profile of the ingestion, or sampled with a stratified reservoir sample and confidence intervals"
+DATA_VALIDATION_DRIFT_MODE :str= "profile"
+DATA_VALIDATION_DRIFT_ERROR_TOLERANCE :float= 0.01
+DATA_VALIDATION_DRIFT_CONFIDENCE_LEVEL :float= 0.95
+DATA_VALIDATION_DRIFT_BOOTSTRAP_RESAMPLES :int= 200
+
+"Row level quality checks: valid rows go on, the others are quarantined"
+DATA_VALIDATION_VALID_DATA_DIR :str= "validated"
+DATA_VALIDATION_QUARANTINE_DIR :str= "quarantine"
+DATA_VALIDATION_QUARANTINE_FILE_NAME :str= f"quarantine.{ARTIFACT_FILE_FORMAT}"
+DATA_VALIDATION_QUALITY_REPORT_FILE_NAME :str= "quality_report.yaml"
+DATA_VALIDATION_MAX_QUARANTINE_RATIO :float= 0.1
+
+"Per-column checks and drift tests run on a process pool from this many rows"
+DATA_VALIDATION_PARALLEL_MIN_ROWS :int= 1000000
+
 
 """
 DATA TRANSFORMATION Related CONSTANTS starts with DATA TRANSFORMATION VAR NAME
@@ -59,6 +119,33 @@ DATA TRANSFORMATION Related CONSTANTS starts with DATA TRANSFORMATION VAR NAME
 DATA_TRANSFORMATION_DIR_NAME :str="data_transformation"
 DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR :str="transformed"
 DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR :str="transformed_object"
+"Stored dtype of the transformed features, half the size of float64 and the dtype the tree models fit on"
+DATA_TRANSFORMATION_FEATURE_DTYPE :str="float32"
+DATA_TRANSFORMATION_PREPROCESSOR_CACHE_DIR :str=os.path.join(ARTIFACTS_DIR, "preprocessor_cache")
+
+"Disk quota of the preprocessor cache, the least recently used entries are evicted above it"
+DATA_TRANSFORMATION_PREPROCESSOR_CACHE_MAX_BYTES :int= 2 * 1024 ** 3
+
+"Keep the transformed features as a CSR matrix below this share of non-zero values, 0 always stores them dense"
+DATA_TRANSFORMATION_SPARSE_THRESHOLD :float= 0.1
+
+
+"""
+DATA RESAMPLING Related CONSTANTS starts with DATA RESAMPLING VAR NAME
+"""
+DATA_RESAMPLING_DIR_NAME :str="data_resampling"
+DATA_RESAMPLING_RESAMPLED_DATA_DIR :str="resampled"
+
+"How the training set is rebalanced: smote, smoteenn, random_under or none, which trains with class weights"
+DATA_RESAMPLING_STRATEGY :str="smoteenn"
+
+"The classes resampled, auto grows the minority class with SMOTE and shrinks the majority class with random_under"
+DATA_RESAMPLING_SAMPLING_STRATEGY :str="auto"
+DATA_RESAMPLING_K_NEIGHBORS :int=5
+
+"Processes of the nearest neighbor searches of SMOTE and ENN, -1 uses every CPU"
+DATA_RESAMPLING_N_JOBS :int=-1
+DATA_RESAMPLING_RANDOM_STATE :int=42
 
 
 """
@@ -69,3 +156,21 @@ MODEL_TRAINER_TRAINED_MODEL_DIR: str = "trained_model"
 MODEL_TRAINER_TRAINED_MODEL_NAME: str = "model.pkl"
 MODEL_TRAINER_EXPECTED_SCORE: float = 0.7
 MODEL_TRAINER_MODEL_CONFIG_FILE_PATH: str = os.path.join("config", "model.yaml")
+"Memory map mode of the transformed arrays read by the trainer, None reads them into memory"
+MODEL_TRAINER_MMAP_MODE: str = "r"
+
+"CPU budget of the model selection, the number of fits running at once. None uses every CPU"
+MODEL_TRAINER_MAX_WORKERS = None
+MODEL_TRAINER_CV_CACHE_DIR: str = os.path.join(ARTIFACTS_DIR, "cv_cache")
+
+"Disk quota of the cross-validation result cache, the least recently used files are evicted above it"
+MODEL_TRAINER_CV_CACHE_MAX_BYTES: int = 64 * 1024 ** 2
+
+
+"""
+DRIFT MONITOR Related CONSTANTS starts with DRIFT_MONITOR VAR NAME
+"""
+DRIFT_MONITOR_DIR :str=os.path.join(ARTIFACTS_DIR, "drift_monitor")
+DRIFT_MONITOR_WINDOW_SIZE :int=10000
+DRIFT_MONITOR_MAX_PENDING_BATCHES :int=1000
+DRIFT_MONITOR_MAX_COALESCED_BATCHES :int=256
@@ -2,25 +2,47 @@
 
 import pandas as pd
 from US_visa.configuration.mongo_db_connection import MongoDBClient
-from US_visa.constants import DATABASE_NAME
+from US_visa.constants import DATABASE_NAME, DATA_INGESTION_BATCH_SIZE, DATA_INGESTION_PARTITION_SAMPLES
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
 from US_visa.logger import logging
 from US_visa.exception import USVisaException
+from US_visa.utils.main_utils import cast_dataframe_to_schema, concat_dataframe_chunks
+from US_visa.entity.schema import get_schema
 import numpy as np
-from typing import Optional
+from typing import Any, Iterator, List, Optional, Tuple
+
+
+@dataclass
+class PartitionExportStats:
+    partition_index :int
+    lower_bound :Any
+    upper_bound :Any
+    n_rows :int
+    elapsed_seconds :float
+    rows_per_second :float
 
 
 class USvisaData:
     """
-    A class to handle operations related to US visa data, specifically fetching and converting data 
+    A class to handle operations related to US visa data, specifically fetching and converting data
     from a MongoDB collection into a pandas DataFrame.
 
     Attributes:
         mongo_client (MongoDBClient): An instance of the MongoDBClient class for connecting to MongoDB.
 
     Methods:
-        export_collection_as_dataframe(collection_name, database_name=None):
+        get_cursor(collection, query_filter=None, use_projection=True, sample_size=None, limit=None):
+            Opens a cursor with the filter, projection, sampling and limit pushed down to MongoDB.
+        export_collection_as_chunks(collection_name, database_name=None, batch_size=DATA_INGESTION_BATCH_SIZE):
+            Streams a MongoDB collection as typed pandas DataFrame chunks.
+        export_collection_as_dataframe(collection_name, database_name=None, batch_size=DATA_INGESTION_BATCH_SIZE):
             Exports a MongoDB collection as a pandas DataFrame.
+        export_collection_in_partitions(collection_name, database_name=None, n_partitions=4, partition_key="_id"):
+            Exports a MongoDB collection by reading key ranges concurrently.
     """
 
     def __init__(self):
@@ -32,20 +54,158 @@ class USvisaData:
         """
         try:
             self.mongo_client = MongoDBClient(database_name=DATABASE_NAME)
+            self._schema = get_schema()
+            self.partition_stats: List[PartitionExportStats] = []
             logging.info("Fetched data from MongoDB")
         except Exception as e:
             logging.error(f"Error fetching data from DB: {e}")
             raise USVisaException(e, sys)
 
-    
-    def export_collection_as_dataframe(self, collection_name: str, database_name: Optional[str] = None) -> pd.DataFrame:
+
+    def get_collection(self, collection_name: str, database_name: Optional[str] = None):
+        """
+        Returns the MongoDB collection from the default database or from the given database.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection.
+            database_name (Optional[str]): The name of the MongoDB database. Defaults to None.
+
+        Returns:
+            pymongo.collection.Collection: The MongoDB collection.
+        """
+        if database_name is None:
+            return self.mongo_client.data_base[collection_name]
+        return self.mongo_client.client[database_name][collection_name]
+
+
+    def get_projection(self) -> dict:
+        """
+        Builds a MongoDB projection that keeps only the schema columns and leaves out `_id`.
+
+        Returns:
+            dict: The projection document.
+        """
+        projection = {column: 1 for column in self._schema.columns}
+        projection["_id"] = 0
+        return projection
+
+
+    def get_cursor(self, collection, query_filter: Optional[dict] = None, use_projection: bool = True,
+                   sample_size: Optional[int] = None, limit: Optional[int] = None,
+                   batch_size: int = DATA_INGESTION_BATCH_SIZE):
+        """
+        Opens a cursor with the filter, projection, sampling and limit pushed down to MongoDB.
+
+        A plain `find` is used unless sampling is requested, in which case an aggregation
+        pipeline of `$match`, `$sample`, `$limit` and `$project` stages is sent instead.
+
+        Args:
+            collection (pymongo.collection.Collection): The collection to read from.
+            query_filter (Optional[dict]): A MongoDB query document selecting the documents. Defaults to None.
+            use_projection (bool): Whether to fetch only the schema columns. Defaults to True.
+            sample_size (Optional[int]): Number of documents to draw at random with `$sample`. Defaults to None.
+            limit (Optional[int]): Maximum number of documents to return. Defaults to None.
+            batch_size (int): The number of documents fetched per cursor round-trip.
+
+        Returns:
+            pymongo.cursor.Cursor | pymongo.command_cursor.CommandCursor: The open cursor.
+        """
+        projection = self.get_projection() if use_projection else None
+
+        if sample_size is None:
+            cursor = collection.find(query_filter or {}, projection, batch_size=batch_size)
+            return cursor.limit(limit) if limit else cursor
+
+        pipeline = []
+        if query_filter:
+            pipeline.append({"$match": query_filter})
+        pipeline.append({"$sample": {"size": sample_size}})
+        if limit:
+            pipeline.append({"$limit": limit})
+        if projection is not None:
+            pipeline.append({"$project": projection})
+
+        logging.info(f"Pushing aggregation pipeline down to MongoDB: {pipeline}")
+        return collection.aggregate(pipeline, batchSize=batch_size, allowDiskUse=True)
+
+
+    def convert_documents_to_dataframe(self, documents: list) -> pd.DataFrame:
+        """
+        Converts a batch of MongoDB documents into a DataFrame typed with the schema columns.
+
+        Args:
+            documents (list): The BSON documents of one cursor batch.
+
+        Returns:
+            pd.DataFrame: The batch as a DataFrame with categorical and numeric columns.
+        """
+        df = pd.DataFrame.from_records(documents)
+
+        if "_id" in df.columns.to_list():
+            df = df.drop(columns=["_id"])
+
+        df.replace({"nan": np.nan}, inplace=True)
+        return cast_dataframe_to_schema(df=df, schema=self._schema)
+
+
+    def export_collection_as_chunks(self, collection_name: str, database_name: Optional[str] = None,
+                                    batch_size: int = DATA_INGESTION_BATCH_SIZE, query_filter: Optional[dict] = None,
+                                    use_projection: bool = True, sample_size: Optional[int] = None,
+                                    limit: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        Streams a MongoDB collection as DataFrame chunks of at most `batch_size` rows.
+
+        Only one cursor batch is held as Python dicts at a time, every batch is converted
+        straight into typed columns before the next one is fetched.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection to export.
+            database_name (Optional[str]): The name of the MongoDB database. Defaults to None.
+            batch_size (int): The number of documents fetched per cursor round-trip and per chunk.
+            query_filter (Optional[dict]): A MongoDB query document selecting the documents. Defaults to None.
+            use_projection (bool): Whether to fetch only the schema columns. Defaults to True.
+            sample_size (Optional[int]): Number of documents to draw at random with `$sample`. Defaults to None.
+            limit (Optional[int]): Maximum number of documents to return. Defaults to None.
+
+        Yields:
+            pd.DataFrame: The next chunk of the collection.
+
+        Raises:
+            USVisaException: If there is an error during the export or conversion process.
+        """
+        try:
+            collection = self.get_collection(collection_name=collection_name, database_name=database_name)
+            cursor = self.get_cursor(collection=collection, query_filter=query_filter,
+                                     use_projection=use_projection, sample_size=sample_size,
+                                     limit=limit, batch_size=batch_size)
+
+            while True:
+                documents = list(islice(cursor, batch_size))
+                if not documents:
+                    break
+                yield self.convert_documents_to_dataframe(documents)
+
+        except Exception as e:
+            logging.error(f"Error in streaming collection chunks: {e}")
+            raise USVisaException(e, sys)
+
+
+    def export_collection_as_dataframe(self, collection_name: str, database_name: Optional[str] = None,
+                                       batch_size: int = DATA_INGESTION_BATCH_SIZE, query_filter: Optional[dict] = None,
+                                       use_projection: bool = True, sample_size: Optional[int] = None,
+                                       limit: Optional[int] = None) -> pd.DataFrame:
         """
         Exports a MongoDB collection as a pandas DataFrame.
 
         Args:
             collection_name (str): The name of the MongoDB collection to export.
             database_name (Optional[str]): The name of the MongoDB database. Defaults to None.
-            
+            batch_size (int): The number of documents converted at a time. Defaults to DATA_INGESTION_BATCH_SIZE.
+            query_filter (Optional[dict]): A MongoDB query document selecting the documents. Defaults to None.
+            use_projection (bool): Whether to fetch only the schema columns. Defaults to True.
+            sample_size (Optional[int]): Number of documents to draw at random with `$sample`. Defaults to None.
+            limit (Optional[int]): Maximum number of documents to return. Defaults to None.
+
         Returns:
             pd.DataFrame: The MongoDB collection data as a pandas DataFrame.
 
@@ -53,20 +213,249 @@ class USvisaData:
             USVisaException: If there is an error during the export or conversion process.
         """
         try:
-            if database_name is None:
-                collection = self.mongo_client.data_base[collection_name]
-            else:
-                collection = self.mongo_client[database_name][collection_name]
-
-            df = pd.DataFrame(list(collection.find()))
-            logging.info("Data is converted into DataFrame")
-            
-            if "_id" in df.columns.to_list():
-                df = df.drop(columns=["_id"], axis=1)
-
-            df.replace({"nan": np.nan}, inplace=True)
+            chunks = list(self.export_collection_as_chunks(collection_name=collection_name,
+                                                           database_name=database_name,
+                                                           batch_size=batch_size,
+                                                           query_filter=query_filter,
+                                                           use_projection=use_projection,
+                                                           sample_size=sample_size,
+                                                           limit=limit))
+            df = concat_dataframe_chunks(chunks)
+            logging.info(f"Data is converted into DataFrame from {len(chunks)} chunks")
             return df
 
         except Exception as e:
             logging.error(f"Error in converting DataFrame: {e}")
             raise USVisaException(e, sys)
+
+
+    def get_max_value(self, collection_name: str, field: str, database_name: Optional[str] = None,
+                      query_filter: Optional[dict] = None) -> Any:
+        """
+        Returns the largest value of a field, read from the end of its index.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection.
+            field (str): The field to look at, e.g. `_id` or an ingest timestamp.
+            database_name (Optional[str]): The name of the MongoDB database. Defaults to None.
+            query_filter (Optional[dict]): A MongoDB query document selecting the documents. Defaults to None.
+
+        Returns:
+            Any: The largest value, or None when no document matches.
+        """
+        try:
+            collection = self.get_collection(collection_name=collection_name, database_name=database_name)
+            cursor = collection.find(query_filter or {}, {field: 1}).sort(field, -1).limit(1)
+            document = next(iter(cursor), None)
+            return None if document is None else document.get(field)
+
+        except Exception as e:
+            logging.error(f"Error reading max value of {field}: {e}")
+            raise USVisaException(e, sys)
+
+
+    def get_collection_state(self, collection_name: str, updated_at_field: str, database_name: Optional[str] = None,
+                             query_filter: Optional[dict] = None) -> dict:
+        """
+        Returns a cheap summary of the collection contents, used to tell whether it changed since a previous export.
+
+        The document count and the largest `_id` catch inserts and deletes, the largest `updated_at_field`
+        catches in-place updates, so the field has to be set by every writer of the collection.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection.
+            updated_at_field (str): The field set on every insert and update, ideally indexed.
+            database_name (Optional[str]): The name of the MongoDB database. Defaults to None.
+            query_filter (Optional[dict]): A MongoDB query document selecting the documents. Defaults to None.
+
+        Returns:
+            dict: The number of matching documents, the largest `_id` and the largest `updated_at_field` among them.
+        """
+        try:
+            collection = self.get_collection(collection_name=collection_name, database_name=database_name)
+            max_id = self.get_max_value(collection_name=collection_name, field="_id",
+                                        database_name=database_name, query_filter=query_filter)
+            max_updated_at = self.get_max_value(collection_name=collection_name, field=updated_at_field,
+                                                database_name=database_name, query_filter=query_filter)
+            return {"n_documents": collection.count_documents(query_filter or {}),
+                    "max_id": None if max_id is None else str(max_id),
+                    "max_updated_at": None if max_updated_at is None else str(max_updated_at)}
+
+        except Exception as e:
+            logging.error(f"Error reading collection state: {e}")
+            raise USVisaException(e, sys)
+
+
+    @staticmethod
+    def combine_filters(query_filter: Optional[dict], range_filter: dict) -> dict:
+        """
+        Combines the user query filter with a partition range filter.
+
+        Args:
+            query_filter (Optional[dict]): A MongoDB query document, may be None.
+            range_filter (dict): The range condition on the partition key.
+
+        Returns:
+            dict: A query document matching both conditions.
+        """
+        if not query_filter:
+            return range_filter
+        if not range_filter:
+            return query_filter
+        return {"$and": [query_filter, range_filter]}
+
+
+    def get_partition_bounds(self, collection, n_partitions: int, partition_key: str = "_id",
+                             query_filter: Optional[dict] = None,
+                             samples_per_partition: int = DATA_INGESTION_PARTITION_SAMPLES) -> List[Tuple[Any, Any]]:
+        """
+        Splits the collection into contiguous ranges of the partition key holding roughly equal row counts.
+
+        The split points are the quantiles of a `$sample` of the partition key, so only
+        n_partitions * samples_per_partition keys are read whatever the size of the collection, where
+        skipping to every split point would scan the index up to it.
+
+        Args:
+            collection (pymongo.collection.Collection): The collection to split.
+            n_partitions (int): The number of ranges wanted.
+            partition_key (str): An indexed, totally ordered field. Defaults to `_id`.
+            query_filter (Optional[dict]): A MongoDB query document selecting the documents. Defaults to None.
+            samples_per_partition (int): The keys sampled per range wanted.
+
+        Returns:
+            List[Tuple[Any, Any]]: (lower, upper) bounds with lower inclusive, upper exclusive; None means unbounded.
+        """
+        split_points = []
+        if n_partitions > 1:
+            pipeline = [{"$match": query_filter or {}},
+                        {"$sample": {"size": n_partitions * samples_per_partition}},
+                        {"$project": {partition_key: 1}}]
+            keys = sorted(document[partition_key] for document in collection.aggregate(pipeline)
+                          if partition_key in document)
+            for partition_index in range(1, n_partitions):
+                position = partition_index * len(keys) // n_partitions
+                if position == 0 or position >= len(keys):
+                    continue
+                if not split_points or keys[position] > split_points[-1]:
+                    split_points.append(keys[position])
+
+        lower_bounds = [None] + split_points
+        upper_bounds = split_points + [None]
+        return list(zip(lower_bounds, upper_bounds))
+
+
+    def export_partition(self, collection_name: str, partition_index: int, lower_bound: Any, upper_bound: Any,
+                         partition_key: str = "_id", database_name: Optional[str] = None,
+                         batch_size: int = DATA_INGESTION_BATCH_SIZE, query_filter: Optional[dict] = None,
+                         use_projection: bool = True) -> Tuple[pd.DataFrame, PartitionExportStats]:
+        """
+        Exports one key range of the collection, sorted on the partition key.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection to export.
+            partition_index (int): Position of the range, used for reporting.
+            lower_bound (Any): Inclusive lower bound of the partition key, None for unbounded.
+            upper_bound (Any): Exclusive upper bound of the partition key, None for unbounded.
+            partition_key (str): The field the collection is split on. Defaults to `_id`.
+            database_name (Optional[str]): The name of the MongoDB database. Defaults to None.
+            batch_size (int): The number of documents fetched per cursor round-trip.
+            query_filter (Optional[dict]): A MongoDB query document selecting the documents. Defaults to None.
+            use_projection (bool): Whether to fetch only the schema columns. Defaults to True.
+
+        Returns:
+            Tuple[pd.DataFrame, PartitionExportStats]: The rows of the range and its throughput.
+        """
+        start_time = time.perf_counter()
+        collection = self.get_collection(collection_name=collection_name, database_name=database_name)
+
+        key_range = {}
+        if lower_bound is not None:
+            key_range["$gte"] = lower_bound
+        if upper_bound is not None:
+            key_range["$lt"] = upper_bound
+        range_filter = {partition_key: key_range} if key_range else {}
+
+        projection = self.get_projection() if use_projection else None
+        cursor = collection.find(self.combine_filters(query_filter, range_filter), projection,
+                                 batch_size=batch_size).sort(partition_key, 1)
+
+        chunks = []
+        while True:
+            documents = list(islice(cursor, batch_size))
+            if not documents:
+                break
+            chunks.append(self.convert_documents_to_dataframe(documents))
+        df = concat_dataframe_chunks(chunks)
+
+        elapsed_seconds = time.perf_counter() - start_time
+        stats = PartitionExportStats(partition_index=partition_index,
+                                     lower_bound=lower_bound,
+                                     upper_bound=upper_bound,
+                                     n_rows=len(df),
+                                     elapsed_seconds=elapsed_seconds,
+                                     rows_per_second=len(df) / elapsed_seconds if elapsed_seconds > 0 else 0.0)
+        logging.info(f"Exported partition {partition_index}: {stats.n_rows} rows "
+                     f"in {elapsed_seconds:.2f}s ({stats.rows_per_second:.0f} rows/sec)")
+        return df, stats
+
+
+    def export_collection_in_partitions(self, collection_name: str, database_name: Optional[str] = None,
+                                        n_partitions: int = 4, partition_key: str = "_id",
+                                        max_workers: Optional[int] = None,
+                                        batch_size: int = DATA_INGESTION_BATCH_SIZE,
+                                        query_filter: Optional[dict] = None,
+                                        use_projection: bool = True) -> pd.DataFrame:
+        """
+        Exports a MongoDB collection by reading key ranges concurrently.
+
+        The ranges are read on a thread pool sharing the pooled `MongoDBClient.client` and stitched
+        together in key order, so the row order does not depend on which thread finishes first.
+        Per-partition throughput is kept in `partition_stats`.
+
+        Args:
+            collection_name (str): The name of the MongoDB collection to export.
+            database_name (Optional[str]): The name of the MongoDB database. Defaults to None.
+            n_partitions (int): The number of key ranges to read. Defaults to 4.
+            partition_key (str): An indexed, totally ordered field such as `_id` or `case_id`. Defaults to `_id`.
+            max_workers (Optional[int]): Size of the thread pool. Defaults to one thread per partition.
+            batch_size (int): The number of documents fetched per cursor round-trip.
+            query_filter (Optional[dict]): A MongoDB query document selecting the documents. Defaults to None.
+            use_projection (bool): Whether to fetch only the schema columns. Defaults to True.
+
+        Returns:
+            pd.DataFrame: The MongoDB collection data ordered by the partition key.
+
+        Raises:
+            USVisaException: If there is an error during the export or conversion process.
+        """
+        try:
+            collection = self.get_collection(collection_name=collection_name, database_name=database_name)
+            bounds = self.get_partition_bounds(collection=collection, n_partitions=n_partitions,
+                                               partition_key=partition_key, query_filter=query_filter)
+            logging.info(f"Exporting {collection_name} in {len(bounds)} partitions on {partition_key}")
+
+            start_time = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=max_workers or len(bounds)) as executor:
+                futures = [executor.submit(self.export_partition,
+                                           collection_name=collection_name,
+                                           partition_index=partition_index,
+                                           lower_bound=lower_bound,
+                                           upper_bound=upper_bound,
+                                           partition_key=partition_key,
+                                           database_name=database_name,
+                                           batch_size=batch_size,
+                                           query_filter=query_filter,
+                                           use_projection=use_projection)
+                           for partition_index, (lower_bound, upper_bound) in enumerate(bounds)]
+                results = [future.result() for future in futures]
+
+            self.partition_stats = [stats for _, stats in results]
+            df = concat_dataframe_chunks([partition_df for partition_df, _ in results])
+
+            elapsed_seconds = time.perf_counter() - start_time
+            logging.info(f"Exported {len(df)} rows from {len(bounds)} partitions in {elapsed_seconds:.2f}s")
+            return df
+
+        except Exception as e:
+            logging.error(f"Error in partitioned export: {e}")
+            raise USVisaException(e, sys)
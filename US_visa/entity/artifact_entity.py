@@ -6,12 +6,14 @@
 
 
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
 class DataIngestionArtifact:
     trained_file_path :str
     test_file_path :str
+    reference_profile_file_path :Optional[str] = None
 
 
 @dataclass
@@ -19,6 +21,16 @@ class DataValidationArtifact:
     validation_status :bool
     message :str
     drift_report_file_path :str
+    valid_train_file_path :Optional[str] = None
+    valid_test_file_path :Optional[str] = None
+    quarantine_file_path :Optional[str] = None
+    quality_report_file_path :Optional[str] = None
+
+
+@dataclass
+class DataDriftArtifact:
+    drift_status :bool
+    drift_report_file_path :str
 
 
 @dataclass
@@ -28,6 +40,13 @@ class DataTransformationArtifact:
     transformed_test_file_path :str
 
 
+@dataclass
+class DataResamplingArtifact:
+    resampled_train_file_path :str
+    strategy :str
+    class_weight :Optional[str] = None
+
+
 @dataclass
 class ClassificationMetricsArtifact:
     f1_score :float
@@ -10,6 +10,7 @@
 import os
 from US_visa.constants import *
 from dataclasses import dataclass
+from typing import Optional
 from datetime import datetime
 
 TIMESTAMP :str= datetime.now().strftime("%m_%d_%Y_%H_%M_%S") 
@@ -20,6 +21,15 @@ class TrainingPipelineConfig:
     pipeline_name :str=PIPELINE_NAME
     artifacts_dir :str=os.path.join(ARTIFACTS_DIR, TIMESTAMP)
     timestamp :str=TIMESTAMP
+    use_stage_cache :bool=True
+    stage_cache_dir :str=STAGE_CACHE_DIR
+    run_manifest_file_path :str=os.path.join(ARTIFACTS_DIR, TIMESTAMP, RUN_MANIFEST_FILE_NAME)
+    stage_timeline_file_path :str=os.path.join(ARTIFACTS_DIR, TIMESTAMP, STAGE_TIMELINE_FILE_NAME)
+    max_stage_workers :int=PIPELINE_MAX_STAGE_WORKERS
+    metrics_file_path :str=os.path.join(ARTIFACTS_DIR, TIMESTAMP, METRICS_FILE_NAME)
+    profile_dir :str=os.path.join(ARTIFACTS_DIR, TIMESTAMP, PROFILES_DIR_NAME)
+    profile_stage :Optional[str]=os.getenv(PROFILE_STAGE_ENV_KEY)
+    profiler :str=os.getenv(PROFILER_ENV_KEY, "cprofile")
 
 training_pipeline_config : TrainingPipelineConfig=TrainingPipelineConfig()
 
@@ -29,8 +39,27 @@ class DataIngestionConfig:
     feature_store_file_path :str= os.path.join(data_ingestion_dir,DATA_INGESTION_FEATURE_STORE_DIR,FILE_NAME)
     training_file_path :str= os.path.join(data_ingestion_dir,DATA_INGESTION_INGESTED_DIR,TRAIN_FILE_NAME)
     testing_file_path :str= os.path.join(data_ingestion_dir,DATA_INGESTION_INGESTED_DIR,TEST_FILE_NAME)
+    reference_profile_file_path :str= os.path.join(data_ingestion_dir,DATA_INGESTION_INGESTED_DIR,DATA_INGESTION_REFERENCE_PROFILE_FILE_NAME)
+    profile_n_bins :int= DATA_INGESTION_PROFILE_N_BINS
+    profile_n_quantiles :int= DATA_INGESTION_PROFILE_N_QUANTILES
+    profile_max_categories :int= DATA_INGESTION_PROFILE_MAX_CATEGORIES
     train_split_test_ratio :float= DATA_INGESTION_TRAIN_TEST_SPLIT_RATIO
+    split_random_state :Optional[int]= DATA_INGESTION_SPLIT_RANDOM_STATE
     collection_name :str= DATA_INGESTION_COLLECTION_NAME
+    batch_size :int= DATA_INGESTION_BATCH_SIZE
+    use_projection :bool= True
+    query_filter :Optional[dict]= None
+    sample_size :Optional[int]= None
+    limit :Optional[int]= None
+    export_partitions :int= DATA_INGESTION_EXPORT_PARTITIONS
+    partition_key :str= DATA_INGESTION_PARTITION_KEY
+    export_max_workers :Optional[int]= None
+    incremental :bool= DATA_INGESTION_INCREMENTAL
+    watermark_field :str= DATA_INGESTION_WATERMARK_FIELD
+    updated_at_field :Optional[str]= DATA_INGESTION_UPDATED_AT_FIELD
+    persistent_feature_store_dir :str= DATA_INGESTION_PERSISTENT_FEATURE_STORE_DIR
+    watermark_file_path :str= os.path.join(DATA_INGESTION_PERSISTENT_FEATURE_STORE_DIR, DATA_INGESTION_WATERMARK_FILE_NAME)
+    partition_splits_dir :str= os.path.join(DATA_INGESTION_PERSISTENT_FEATURE_STORE_DIR, DATA_INGESTION_PARTITION_SPLITS_DIR)
 
 
 @dataclass
@@ -38,6 +67,28 @@ class DataValidationConfig:
     data_validation_dir: str = os.path.join(training_pipeline_config.artifacts_dir, DATA_VALIDATION_DIR_NAME)
     drift_report_file_path: str = os.path.join(data_validation_dir, DATA_VALIDATION_DRIFT_REPORT_DIR,
                                                DATA_VALIDATION_DRIFT_REPORT_FILE_NAME)
+    drift_engine: str = DATA_VALIDATION_DRIFT_ENGINE
+    drift_p_value_threshold: float = DATA_VALIDATION_DRIFT_P_VALUE_THRESHOLD
+    drift_psi_threshold: float = DATA_VALIDATION_DRIFT_PSI_THRESHOLD
+    drift_distance_threshold: float = DATA_VALIDATION_DRIFT_DISTANCE_THRESHOLD
+    drift_share: float = DATA_VALIDATION_DRIFT_SHARE
+    drift_small_sample_size: int = DATA_VALIDATION_DRIFT_SMALL_SAMPLE_SIZE
+    drift_mode: str = DATA_VALIDATION_DRIFT_MODE
+    drift_sample_size: Optional[int] = None
+    drift_error_tolerance: float = DATA_VALIDATION_DRIFT_ERROR_TOLERANCE
+    drift_confidence_level: float = DATA_VALIDATION_DRIFT_CONFIDENCE_LEVEL
+    drift_bootstrap_resamples: int = DATA_VALIDATION_DRIFT_BOOTSTRAP_RESAMPLES
+    drift_stratify_column: Optional[str] = TARGET_COLUMN
+    drift_random_state: Optional[int] = None
+    valid_train_file_path: str = os.path.join(data_validation_dir, DATA_VALIDATION_VALID_DATA_DIR, TRAIN_FILE_NAME)
+    valid_test_file_path: str = os.path.join(data_validation_dir, DATA_VALIDATION_VALID_DATA_DIR, TEST_FILE_NAME)
+    quarantine_file_path: str = os.path.join(data_validation_dir, DATA_VALIDATION_QUARANTINE_DIR,
+                                             DATA_VALIDATION_QUARANTINE_FILE_NAME)
+    quality_report_file_path: str = os.path.join(data_validation_dir, DATA_VALIDATION_QUARANTINE_DIR,
+                                                 DATA_VALIDATION_QUALITY_REPORT_FILE_NAME)
+    max_quarantine_ratio: float = DATA_VALIDATION_MAX_QUARANTINE_RATIO
+    max_workers: Optional[int] = None
+    parallel_min_rows: int = DATA_VALIDATION_PARALLEL_MIN_ROWS
     
 
 
@@ -46,19 +97,55 @@ class DataTransformationConfig:
     data_transformation_dir :str=os.path.join(training_pipeline_config.artifacts_dir, DATA_TRANSFORMATION_DIR_NAME)
     transformed_train_file_path :str=os.path.join(data_transformation_dir,
                                                   DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
-                                                  TRAIN_FILE_NAME.replace("csv","npy"))
+                                                  os.path.splitext(TRAIN_FILE_NAME)[0])
     transformed_test_file_path :str=os.path.join(data_transformation_dir,
                                                  DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
-                                                 TEST_FILE_NAME.replace("csv","npy"))
+                                                 os.path.splitext(TEST_FILE_NAME)[0])
     transformed_object_file_path :str=os.path.join(data_transformation_dir,
                                                    DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR,
                                                    PREPROCESSING_OBJECT_FILE_NAME)
+    sparse_threshold :float=DATA_TRANSFORMATION_SPARSE_THRESHOLD
+    feature_dtype :str=DATA_TRANSFORMATION_FEATURE_DTYPE
+    use_preprocessor_cache :bool=True
+    preprocessor_cache_dir :str=DATA_TRANSFORMATION_PREPROCESSOR_CACHE_DIR
+    preprocessor_cache_max_bytes :int=DATA_TRANSFORMATION_PREPROCESSOR_CACHE_MAX_BYTES
     
 
 
+@dataclass
+class DataResamplingConfig:
+    data_resampling_dir :str=os.path.join(training_pipeline_config.artifacts_dir, DATA_RESAMPLING_DIR_NAME)
+    resampled_train_file_path :str=os.path.join(data_resampling_dir,
+                                                DATA_RESAMPLING_RESAMPLED_DATA_DIR,
+                                                os.path.splitext(TRAIN_FILE_NAME)[0])
+    strategy :str=DATA_RESAMPLING_STRATEGY
+    sampling_strategy :str=DATA_RESAMPLING_SAMPLING_STRATEGY
+    k_neighbors :int=DATA_RESAMPLING_K_NEIGHBORS
+    n_jobs :int=DATA_RESAMPLING_N_JOBS
+    random_state :Optional[int]=DATA_RESAMPLING_RANDOM_STATE
+
+
 @dataclass
 class ModelTrainerConfig:
     model_trainer_dir: str = os.path.join(training_pipeline_config.artifacts_dir, MODEL_TRAINER_DIR_NAME)
     trained_model_file_path: str = os.path.join(model_trainer_dir, MODEL_TRAINER_TRAINED_MODEL_DIR, MODEL_FILE_NAME)
     expected_accuracy: float = MODEL_TRAINER_EXPECTED_SCORE
     model_config_file_path: str = MODEL_TRAINER_MODEL_CONFIG_FILE_PATH
+    mmap_mode: Optional[str] = MODEL_TRAINER_MMAP_MODE
+    max_workers: Optional[int] = MODEL_TRAINER_MAX_WORKERS
+    use_cv_cache: bool = True
+    cv_cache_dir: str = MODEL_TRAINER_CV_CACHE_DIR
+    cv_cache_max_bytes: int = MODEL_TRAINER_CV_CACHE_MAX_BYTES
+
+
+@dataclass
+class DriftMonitorConfig:
+    snapshot_dir: str = DRIFT_MONITOR_DIR
+    window_size: int = DRIFT_MONITOR_WINDOW_SIZE
+    max_pending_batches: int = DRIFT_MONITOR_MAX_PENDING_BATCHES
+    max_coalesced_batches: int = DRIFT_MONITOR_MAX_COALESCED_BATCHES
+    p_value_threshold: float = DATA_VALIDATION_DRIFT_P_VALUE_THRESHOLD
+    psi_threshold: float = DATA_VALIDATION_DRIFT_PSI_THRESHOLD
+    distance_threshold: float = DATA_VALIDATION_DRIFT_DISTANCE_THRESHOLD
+    drift_share: float = DATA_VALIDATION_DRIFT_SHARE
+    small_sample_size: int = DATA_VALIDATION_DRIFT_SMALL_SAMPLE_SIZE
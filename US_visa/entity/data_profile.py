@@ -0,0 +1,253 @@
+# -*- Code:Utf -*-
+
+import sys
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+from pandas import DataFrame, Series
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+from US_visa.utils.main_utils import read_yaml_file, write_yaml_file
+from US_visa.utils.drift_utils import get_bin_edges, histogram_counts
+from US_visa.utils.parallel_utils import map_columns
+
+
+def to_float_array(series: Series) -> np.ndarray:
+    """
+    The values of a numerical column as floats, the values that are not numbers, which the quality
+    rules quarantine, counted as nulls.
+    """
+    return pd.to_numeric(series, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+
+@dataclass
+class NumericalColumnProfile:
+    """
+    Summary of a numerical column: histograms over bin edges fixed by the reference data.
+
+    `counts` are over the PSI bins delimited by `bin_edges`, `quantile_counts` over the finer bins
+    delimited by `quantile_edges`, which are the reference percentiles. Both have one more bin than
+    edges, the outer bins being open. Profiles with the same edges merge by adding their counts.
+    """
+    n_rows :int = 0
+    null_count :int = 0
+    min :Optional[float] = None
+    max :Optional[float] = None
+    bin_edges :List[float] = field(default_factory=list)
+    counts :List[int] = field(default_factory=list)
+    quantile_edges :List[float] = field(default_factory=list)
+    quantile_counts :List[int] = field(default_factory=list)
+    quantiles :Dict[float, float] = field(default_factory=dict)
+    column_type :str = "num"
+
+    @staticmethod
+    def from_series(series: Series, n_bins: int = 10, n_quantiles: int = 100) -> "NumericalColumnProfile":
+        values = to_float_array(series)
+        values = values[~np.isnan(values)]
+        profile = NumericalColumnProfile(bin_edges=get_bin_edges(values, n_bins=n_bins).tolist(),
+                                         quantile_edges=get_bin_edges(values, n_bins=n_quantiles).tolist())
+        profile = profile.empty_like()
+        profile.update(series)
+        if len(values):
+            probabilities = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+            profile.quantiles = dict(zip(probabilities, np.quantile(values, probabilities).tolist()))
+        return profile
+
+    def empty_like(self) -> "NumericalColumnProfile":
+        return NumericalColumnProfile(bin_edges=list(self.bin_edges), counts=[0] * (len(self.bin_edges) + 1),
+                                      quantile_edges=list(self.quantile_edges),
+                                      quantile_counts=[0] * (len(self.quantile_edges) + 1))
+
+    def update(self, series: Series) -> None:
+        values = to_float_array(series)
+        is_null = np.isnan(values)
+        values = values[~is_null]
+        self.n_rows += len(is_null)
+        self.null_count += int(is_null.sum())
+        if len(values):
+            self.min = float(values.min()) if self.min is None else min(self.min, float(values.min()))
+            self.max = float(values.max()) if self.max is None else max(self.max, float(values.max()))
+        self.counts = (np.asarray(self.counts) + histogram_counts(values, np.asarray(self.bin_edges))).tolist()
+        self.quantile_counts = (np.asarray(self.quantile_counts)
+                                + histogram_counts(values, np.asarray(self.quantile_edges))).tolist()
+
+    def merge(self, other: "NumericalColumnProfile") -> None:
+        self.n_rows += other.n_rows
+        self.null_count += other.null_count
+        for bound, pick in (("min", min), ("max", max)):
+            values = [value for value in (getattr(self, bound), getattr(other, bound)) if value is not None]
+            setattr(self, bound, pick(values) if values else None)
+        self.counts = (np.asarray(self.counts) + np.asarray(other.counts)).tolist()
+        self.quantile_counts = (np.asarray(self.quantile_counts) + np.asarray(other.quantile_counts)).tolist()
+
+    def estimate_quantile(self, probability: float) -> Optional[float]:
+        """
+        Estimates a quantile by linear interpolation within the fine bins, bounded by min and max.
+        """
+        n_values = sum(self.quantile_counts)
+        if n_values == 0:
+            return None
+        edges = np.concatenate([[self.min], np.clip(self.quantile_edges, self.min, self.max), [self.max]])
+        cumulative = np.concatenate([[0], np.cumsum(self.quantile_counts)])
+        return float(np.interp(probability * n_values, cumulative, edges))
+
+
+@dataclass
+class CategoricalColumnProfile:
+    """
+    Summary of a categorical column: the frequency of the most frequent reference categories,
+    every other value being counted in `other_count`.
+    """
+    n_rows :int = 0
+    null_count :int = 0
+    categories :List[str] = field(default_factory=list)
+    counts :List[int] = field(default_factory=list)
+    other_count :int = 0
+    column_type :str = "cat"
+
+    @staticmethod
+    def from_series(series: Series, max_categories: int = 50) -> "CategoricalColumnProfile":
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # counting the codes skips the unobserved categories, which value_counts would list
+            codes = series.cat.codes.to_numpy()
+            counts = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories))
+            observed = np.flatnonzero(counts)
+            top = observed[np.argsort(-counts[observed], kind="stable")[:max_categories]]
+            categories = series.cat.categories[top]
+        else:
+            categories = series.value_counts(sort=True, dropna=True).index[:max_categories]
+        profile = CategoricalColumnProfile(categories=[str(category) for category in categories]).empty_like()
+        profile.update(series)
+        return profile
+
+    def empty_like(self) -> "CategoricalColumnProfile":
+        return CategoricalColumnProfile(categories=list(self.categories), counts=[0] * len(self.categories))
+
+    def get_category_index(self) -> pd.Index:
+        """
+        The categories as an Index, built once per profile since update runs on every batch.
+        """
+        if self.__dict__.get("_category_index") is None:
+            self._category_index = pd.Index(self.categories, dtype=object)
+        return self._category_index
+
+    def update(self, series: Series) -> None:
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # look up the categories of the series once instead of every value
+            series_codes = series.cat.codes.to_numpy()
+            is_null = series_codes < 0
+            category_codes = self.get_category_index().get_indexer(series.cat.categories.astype(str))
+            codes = np.append(category_codes, -1)[series_codes]
+        else:
+            values = series.to_numpy(dtype=object)
+            is_null = pd.isna(values)
+            if series.dtype != object:
+                values = values.astype(str)
+            codes = self.get_category_index().get_indexer(values)
+            codes[is_null] = -1
+        self.n_rows += len(series)
+        self.null_count += int(is_null.sum())
+        self.counts = (np.asarray(self.counts, dtype=np.int64)
+                       + np.bincount(codes[codes >= 0], minlength=len(self.categories))).tolist()
+        self.other_count += int(((codes < 0) & ~is_null).sum())
+
+    def merge(self, other: "CategoricalColumnProfile") -> None:
+        self.n_rows += other.n_rows
+        self.null_count += other.null_count
+        self.counts = (np.asarray(self.counts, dtype=np.int64) + np.asarray(other.counts, dtype=np.int64)).tolist()
+        self.other_count += other.other_count
+
+
+def update_column_profile(series: Series, column_profile):
+    """
+    Adds a column to its profile and returns the profile, the per-column task of DataProfile.update.
+    """
+    column_profile.update(series)
+    return column_profile
+
+
+@dataclass
+class DataProfile:
+    """
+    A compact, mergeable summary of a dataset, computed once from the training data at ingestion.
+
+    Drift checks compare a profile of the new data, built with the same bins and categories
+    through `empty_like`, against it, without reading the training data again.
+
+    Attributes
+    ----------
+    n_rows : int
+        The number of rows summarized.
+    columns : dict
+        Column name to NumericalColumnProfile or CategoricalColumnProfile.
+
+    Methods
+    -------
+    from_dataframe(df, numerical_columns, categorical_columns, ...) -> DataProfile:
+        Profiles a DataFrame, fixing the bins and categories from its values.
+    empty_like() -> DataProfile:
+        Returns an empty profile with the same bins and categories.
+    update(df, max_workers) -> None:
+        Adds the rows of a DataFrame to the profile, the columns on max_workers processes.
+    merge(other) -> None:
+        Adds the counts of a profile built with the same bins and categories.
+    save(filepath) / load(filepath):
+        Writes the profile to YAML and reads it back.
+    """
+    n_rows :int = 0
+    columns :Dict[str, object] = field(default_factory=dict)
+
+    @staticmethod
+    def from_dataframe(df: DataFrame, numerical_columns: list, categorical_columns: list, n_bins: int = 10,
+                       n_quantiles: int = 100, max_categories: int = 50) -> "DataProfile":
+        try:
+            columns = {}
+            for column in numerical_columns:
+                if column in df.columns:
+                    columns[column] = NumericalColumnProfile.from_series(df[column], n_bins=n_bins,
+                                                                         n_quantiles=n_quantiles)
+            for column in categorical_columns:
+                if column in df.columns:
+                    columns[column] = CategoricalColumnProfile.from_series(df[column], max_categories=max_categories)
+            return DataProfile(n_rows=len(df), columns=columns)
+
+        except Exception as e:
+            logging.error(f"Error profiling the DataFrame: {e}")
+            raise USVisaException(e, sys) from e
+
+    def empty_like(self) -> "DataProfile":
+        return DataProfile(columns={name: column.empty_like() for name, column in self.columns.items()})
+
+    def update(self, df: DataFrame, max_workers: int = 1) -> None:
+        self.n_rows += len(df)
+        names = [name for name in self.columns if name in df.columns]
+        self.columns.update(map_columns(update_column_profile, frames=[df], columns=names, max_workers=max_workers,
+                                        column_kwargs={name: {"column_profile": self.columns[name]} for name in names}))
+
+    def merge(self, other: "DataProfile") -> None:
+        self.n_rows += other.n_rows
+        for name, column in self.columns.items():
+            if name in other.columns:
+                column.merge(other.columns[name])
+
+    def to_dict(self) -> dict:
+        return {"n_rows": self.n_rows, "columns": {name: asdict(column) for name, column in self.columns.items()}}
+
+    @staticmethod
+    def from_dict(content: dict) -> "DataProfile":
+        column_classes = {"num": NumericalColumnProfile, "cat": CategoricalColumnProfile}
+        return DataProfile(n_rows=content["n_rows"],
+                           columns={name: column_classes[column["column_type"]](**column)
+                                    for name, column in content["columns"].items()})
+
+    def save(self, filepath: str) -> None:
+        write_yaml_file(filepath=filepath, content=self.to_dict(), replace=True)
+
+    @staticmethod
+    def load(filepath: str) -> "DataProfile":
+        try:
+            return DataProfile.from_dict(read_yaml_file(filepath=filepath))
+        except Exception as e:
+            raise USVisaException(e, sys) from e
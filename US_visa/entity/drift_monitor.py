@@ -0,0 +1,158 @@
+# -*- Code:Utf -*-
+
+import os
+import sys
+import queue
+import threading
+from datetime import datetime
+import pandas as pd
+from pandas import DataFrame
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+from US_visa.entity.config_entity import DriftMonitorConfig
+from US_visa.entity.data_profile import DataProfile
+from US_visa.utils.drift_utils import compare_profiles
+from US_visa.utils.main_utils import write_yaml_file
+
+
+class DriftMonitor:
+    """
+    Watches the data scored in production for drift against the training reference profile.
+
+    `observe` only queues the batch, so the prediction path pays for a non-blocking put. A background
+    thread adds the queued batches to the profile of the current window, built with the bins and
+    categories of the reference profile, so memory stays constant whatever the traffic. Once a window
+    holds `window_size` rows the thread compares it against the reference with the tests of
+    DataValidation and writes the snapshot. When the thread falls `max_pending_batches` behind, the
+    new batches are dropped and counted instead of blocking the caller.
+
+    Attributes
+    ----------
+    reference_profile : DataProfile
+        The profile of the training data.
+    drift_monitor_config : DriftMonitorConfig
+        Window size, snapshot directory, queue bound and drift thresholds.
+    window : DataProfile
+        The profile of the rows observed since the last window closed.
+    latest_report : dict
+        The drift report of the last window written.
+    n_dropped_batches : int
+        Batches dropped because the background thread was behind.
+
+    Methods
+    -------
+    observe(dataframe) -> None:
+        Queues a batch of scored rows for the current window.
+    flush() -> None:
+        Waits for the queued batches and closes the current window even if it is not full.
+    close() -> None:
+        Flushes and stops the background thread.
+    """
+
+    def __init__(self, reference_profile: DataProfile, drift_monitor_config: DriftMonitorConfig = DriftMonitorConfig()):
+        self.reference_profile = reference_profile
+        self.drift_monitor_config = drift_monitor_config
+        self.window = reference_profile.empty_like()
+        self.window_index = 0
+        self.latest_report = None
+        self.n_dropped_batches = 0
+        self._start()
+
+    def _start(self) -> None:
+        self._queue = queue.Queue(maxsize=self.drift_monitor_config.max_pending_batches)
+        self._worker = threading.Thread(target=self._process_batches, name="drift-monitor", daemon=True)
+        self._worker.start()
+
+    @staticmethod
+    def from_profile_file(reference_profile_file_path: str,
+                          drift_monitor_config: DriftMonitorConfig = DriftMonitorConfig()) -> "DriftMonitor":
+        """
+        Builds a monitor from the reference profile saved by the data ingestion.
+        """
+        return DriftMonitor(reference_profile=DataProfile.load(reference_profile_file_path),
+                            drift_monitor_config=drift_monitor_config)
+
+    def observe(self, dataframe: DataFrame) -> None:
+        """
+        Queues a batch of scored rows. The dataframe is read later by the background thread and must
+        not be modified in place afterwards. Never blocks and never raises.
+        """
+        try:
+            self._queue.put_nowait(("batch", dataframe))
+        except queue.Full:
+            self.n_dropped_batches += 1
+            if self.n_dropped_batches % 1000 == 1:
+                logging.warning(f"Drift monitor is behind, {self.n_dropped_batches} batches dropped so far")
+
+    def flush(self) -> None:
+        self._queue.put(("flush", None))
+        self._queue.join()
+
+    def close(self) -> None:
+        self.flush()
+        self._queue.put((None, None))
+        self._worker.join()
+
+    def _process_batches(self) -> None:
+        """
+        Adds the queued batches to the window, coalescing whatever is pending into one update so
+        that many small requests cost one profile update.
+        """
+        running = True
+        while running:
+            items = [self._queue.get()]
+            while len(items) < self.drift_monitor_config.max_coalesced_batches:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            running = all(kind is not None for kind, _ in items)
+            try:
+                batches = [dataframe for kind, dataframe in items if kind == "batch"]
+                if batches:
+                    self.window.update(batches[0] if len(batches) == 1 else pd.concat(batches, ignore_index=True))
+                flush = any(kind != "batch" for kind, _ in items)
+                if self.window.n_rows >= self.drift_monitor_config.window_size or (flush and self.window.n_rows):
+                    window, self.window = self.window, self.reference_profile.empty_like()
+                    self._write_snapshot(window)
+            except Exception as e:
+                logging.error(f"Drift monitor failed to process a batch: {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _write_snapshot(self, window: DataProfile) -> None:
+        config = self.drift_monitor_config
+        window_index, self.window_index = self.window_index, self.window_index + 1
+        closed_at = datetime.now().strftime("%m_%d_%Y_%H_%M_%S")
+        report = compare_profiles(self.reference_profile, window,
+                                  p_value_threshold=config.p_value_threshold,
+                                  psi_threshold=config.psi_threshold,
+                                  distance_threshold=config.distance_threshold,
+                                  drift_share=config.drift_share,
+                                  small_sample_size=config.small_sample_size)
+        self.latest_report = report
+        write_yaml_file(filepath=os.path.join(config.snapshot_dir, f"window_{window_index:06d}_{closed_at}.yaml"),
+                        content={"window_index": window_index,
+                                 "closed_at": closed_at,
+                                 "n_rows": window.n_rows,
+                                 "n_dropped_batches": self.n_dropped_batches,
+                                 "drift": report,
+                                 "profile": window.to_dict()})
+        if report["dataset_drift"]:
+            logging.warning(f"Drift detected in serving window {window_index}: "
+                            f"{report['n_drifted_features']}/{report['n_features']} columns drifted")
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        for name in ("_queue", "_worker"):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        try:
+            self.__dict__.update(state)
+            self._start()
+        except Exception as e:
+            raise USVisaException(e, sys) from e
@@ -54,11 +54,17 @@ class USvisaModel:
         A preprocessing pipeline to transform input data.
     trained_model_object : DataFrame
         A trained model object to make predictions.
+    drift_monitor : DriftMonitor
+        An optional monitor observing every dataframe passed to predict. It is not pickled with the model.
 
     Methods
     -------
     predict(dataframe: DataFrame) -> DataFrame:
         Transforms the input dataframe using the preprocessing pipeline and returns predictions from the trained model.
+    attach_drift_monitor(drift_monitor: DriftMonitor) -> None:
+        Makes predict feed the scored data to a drift monitor.
+    detach_drift_monitor() -> DriftMonitor:
+        Stops feeding the drift monitor and returns it.
     """
 
     def __init__(self, preprocessing_object: Pipeline, trained_model_object: DataFrame):
@@ -75,6 +81,7 @@ class USvisaModel:
         try:
             self.preprocessing_object = preprocessing_object
             self.trained_model_object = trained_model_object
+            self.drift_monitor = None
 
         except Exception as e:
             logging.error(f"Error during initializing Objects for USvisaModel class: {e}")
@@ -99,14 +106,50 @@ class USvisaModel:
             logging.info("Using the trained model to get predictions")
 
             transformed_feature = self.preprocessing_object.transform(dataframe)
+            prediction = self.trained_model_object.predict(transformed_feature)
+
+            drift_monitor = getattr(self, "drift_monitor", None)
+            if drift_monitor is not None:
+                drift_monitor.observe(dataframe)
 
             logging.info("Used the trained model to get predictions")
-            return self.trained_model_object.predict(transformed_feature)
+            return prediction
 
         except Exception as e:
             logging.error(f"Error during prediction using USvisaModel class: {e}")
             raise USVisaException(e, sys) from e
 
+    def attach_drift_monitor(self, drift_monitor) -> None:
+        """
+        Makes predict feed every scored dataframe to the drift monitor.
+
+        Parameters
+        ----------
+        drift_monitor : DriftMonitor
+            The monitor, usually built from the reference profile of the training run.
+        """
+        self.drift_monitor = drift_monitor
+
+    def detach_drift_monitor(self):
+        """
+        Stops feeding the drift monitor.
+
+        Returns
+        -------
+        DriftMonitor
+            The detached monitor, None if there was none.
+        """
+        drift_monitor, self.drift_monitor = getattr(self, "drift_monitor", None), None
+        return drift_monitor
+
+    def __getstate__(self):
+        """
+        Leaves the drift monitor out of the pickled model.
+        """
+        state = self.__dict__.copy()
+        state["drift_monitor"] = None
+        return state
+
     def __repr__(self):
         """
         Returns a string representation of the USvisaModel class.
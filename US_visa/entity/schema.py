@@ -0,0 +1,109 @@
+# -*- Code:Utf -*-
+
+import sys
+import yaml
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from typing import Dict, Tuple
+
+import pandas as pd
+
+from US_visa.constants import SCHEMA_FILE_PATH
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+
+
+@dataclass(frozen=True, eq=False)
+class Schema:
+    """
+    The typed content of schema.yaml, parsed once per process by `get_schema`.
+
+    The lookup structures the components use on every call (the column names, pandas dtypes of the
+    categorical columns, the column groups of the preprocessor) are computed on first use and then
+    kept with the schema, so no caller re-parses the YAML or rebuilds them.
+
+    Attributes
+    ----------
+    columns : dict
+        Column name to schema type (category, int or float), in the schema order.
+    numerical_columns, categorical_columns : tuple
+        The columns the drift checks and profiles treat as numerical or categorical.
+    category_domains : dict
+        Column name to its known categories, in category code order.
+    nullable_columns : frozenset
+        The columns the quality rules allow to be null.
+    ranges : dict
+        Column name to the `min` and `max` the quality rules allow.
+    drop_columns, num_features, oe_columns, ohe_columns, transform_columns : tuple
+        The column groups of the data transformation.
+
+    Methods
+    -------
+    from_dict(content) -> Schema:
+        Builds the schema from the parsed YAML.
+    """
+    columns :Dict[str, str] = field(default_factory=dict)
+    numerical_columns :Tuple[str, ...] = ()
+    categorical_columns :Tuple[str, ...] = ()
+    category_domains :Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+    nullable_columns :frozenset = frozenset()
+    ranges :Dict[str, dict] = field(default_factory=dict)
+    drop_columns :Tuple[str, ...] = ()
+    num_features :Tuple[str, ...] = ()
+    oe_columns :Tuple[str, ...] = ()
+    ohe_columns :Tuple[str, ...] = ()
+    transform_columns :Tuple[str, ...] = ()
+
+    @staticmethod
+    def from_dict(content: dict) -> "Schema":
+        quality_rules = content.get("quality_rules") or {}
+        return Schema(
+            columns={column: dtype for column_type in content["columns"] for column, dtype in column_type.items()},
+            numerical_columns=tuple(content.get("numerical_columns") or ()),
+            categorical_columns=tuple(content.get("categorical_columns") or ()),
+            category_domains={column: tuple(domain)
+                              for column, domain in (content.get("category_domains") or {}).items()},
+            nullable_columns=frozenset(quality_rules.get("nullable") or ()),
+            ranges=dict(quality_rules.get("ranges") or {}),
+            drop_columns=tuple(content.get("drop_columns") or ()),
+            num_features=tuple(content.get("num_features") or ()),
+            oe_columns=tuple(content.get("oe_columns") or ()),
+            ohe_columns=tuple(content.get("ohe_columns") or ()),
+            transform_columns=tuple(content.get("transform_columns") or ()),
+        )
+
+    @cached_property
+    def column_names(self) -> Tuple[str, ...]:
+        return tuple(self.columns)
+
+    @cached_property
+    def category_dtypes(self) -> Dict[str, pd.CategoricalDtype]:
+        """The pandas dtype of every column with a category domain, the domain giving the codes."""
+        return {column: pd.CategoricalDtype(categories=list(domain)) for column, domain in self.category_domains.items()}
+
+    @cached_property
+    def category_domain_sets(self) -> Dict[str, frozenset]:
+        return {column: frozenset(domain) for column, domain in self.category_domains.items()}
+
+    @cached_property
+    def transformer_columns(self) -> Dict[str, list]:
+        """The columns of each step of the preprocessor ColumnTransformer, by step name."""
+        return {"OneHotEncoder": list(self.ohe_columns),
+                "OrdinalEncoder": list(self.oe_columns),
+                "Transformer": list(self.transform_columns),
+                "StandardScaler": list(self.num_features)}
+
+
+@lru_cache(maxsize=None)
+def get_schema(filepath: str = SCHEMA_FILE_PATH) -> Schema:
+    """
+    Parses a schema file once per process and returns the same Schema on every later call.
+    A process changing the file has to call get_schema.cache_clear() to see it.
+    """
+    try:
+        with open(filepath, "rb") as yaml_file:
+            schema = Schema.from_dict(yaml.safe_load(yaml_file))
+        logging.info(f"Parsed the schema {filepath}: {len(schema.columns)} columns")
+        return schema
+    except Exception as e:
+        raise USVisaException(e, sys) from e
@@ -0,0 +1,116 @@
+## -*- Code:Utf -*-
+
+import os
+import sys
+import glob
+import threading
+from typing import Optional
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+from US_visa.utils.main_utils import read_yaml_file, write_yaml_file, artifact_to_dict, artifact_from_dict
+
+
+class RunManifest:
+    """
+    Records the progress of one TrainPipeline run in `<artifacts_dir>/run_manifest.yaml`.
+
+    The manifest holds the run status and, in completion order, the artifact of every
+    stage that finished, so a failed run can be resumed from its first incomplete stage.
+
+    Attributes
+    ----------
+    manifest_file_path : str
+        Where the manifest is written.
+    status : str
+        One of `running`, `failed`, `completed`, or `resumed` once a later run finished it.
+    stages : dict
+        Stage name to artifact dataclass, in completion order.
+    failed_stage : str
+        The stage that raised, if the run failed.
+
+    Methods
+    -------
+    record_stage(stage_name, artifact) -> None:
+        Records a completed stage and saves the manifest.
+    mark_failed(stage_name, error) -> None:
+        Marks the run as failed in the given stage and saves the manifest.
+    mark_completed() -> None:
+        Marks the run as completed and saves the manifest.
+    load(manifest_file_path) -> RunManifest:
+        Reads a manifest back.
+    find_latest_failed(artifacts_root, manifest_file_name) -> Optional[str]:
+        Returns the manifest of the most recent failed run.
+    """
+
+    def __init__(self, manifest_file_path: str):
+        self.manifest_file_path = manifest_file_path
+        self.status = "running"
+        self.stages = {}
+        self.failed_stage = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def save(self) -> None:
+        with self._lock:
+            self.write()
+
+    def write(self) -> None:
+        try:
+            write_yaml_file(filepath=self.manifest_file_path,
+                            content={"status": self.status,
+                                     "failed_stage": self.failed_stage,
+                                     "error": self.error,
+                                     "stages": [{"stage_name": stage_name, "artifact": artifact_to_dict(artifact)}
+                                                for stage_name, artifact in self.stages.items()]},
+                            replace=True)
+        except Exception as e:
+            raise USVisaException(e, sys) from e
+
+    def record_stage(self, stage_name: str, artifact) -> None:
+        with self._lock:
+            self.stages[stage_name] = artifact
+            self.write()
+
+    def mark_failed(self, stage_name: str, error: Exception) -> None:
+        with self._lock:
+            if self.status != "failed":
+                self.status = "failed"
+                self.failed_stage = stage_name
+                self.error = str(error)
+            self.write()
+
+    def mark_completed(self) -> None:
+        self.status = "completed"
+        self.failed_stage = None
+        self.error = None
+        self.save()
+
+    @staticmethod
+    def load(manifest_file_path: str) -> "RunManifest":
+        """
+        Reads a manifest back, rebuilding the artifact dataclasses of its completed stages.
+        """
+        try:
+            content = read_yaml_file(filepath=manifest_file_path)
+            manifest = RunManifest(manifest_file_path=manifest_file_path)
+            manifest.status = content["status"]
+            manifest.failed_stage = content.get("failed_stage")
+            manifest.error = content.get("error")
+            manifest.stages = {stage["stage_name"]: artifact_from_dict(stage["artifact"]) for stage in content["stages"]}
+            return manifest
+        except Exception as e:
+            raise USVisaException(e, sys) from e
+
+    @staticmethod
+    def find_latest_failed(artifacts_root: str, manifest_file_name: str) -> Optional[str]:
+        """
+        Returns the manifest path of the most recently updated failed run under artifacts_root, or None.
+        """
+        manifest_file_paths = sorted(glob.glob(os.path.join(artifacts_root, "*", manifest_file_name)),
+                                     key=os.path.getmtime, reverse=True)
+        for manifest_file_path in manifest_file_paths:
+            if read_yaml_file(filepath=manifest_file_path).get("status") == "failed":
+                logging.info(f"Latest failed run manifest: {manifest_file_path}")
+                return manifest_file_path
+        return None
@@ -0,0 +1,167 @@
+## -*- Code:Utf -*-
+
+import os
+import sys
+import json
+import hashlib
+import dataclasses
+from typing import Optional
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+from US_visa.utils.main_utils import read_yaml_file, write_yaml_file, artifact_to_dict, artifact_from_dict
+
+
+class StageCache:
+    """
+    A content-addressed cache of pipeline stage outputs.
+
+    A stage is identified by a fingerprint of everything it reads: the files behind its input
+    artifacts, its config dataclass and the YAML files it depends on. The artifact produced for
+    a fingerprint is stored as `<cache_dir>/<stage_name>/<fingerprint>.yaml`, and points at the
+    files written by the run that computed it.
+
+    Attributes
+    ----------
+    cache_dir : str
+        The directory holding the cached artifacts.
+    artifacts_dir : str
+        The artifacts directory of the current run. It is blanked out of config paths so that
+        the timestamped directory does not change the fingerprint.
+
+    Methods
+    -------
+    compute_fingerprint(stage_name, inputs, config, config_files) -> str:
+        Computes the fingerprint of a stage.
+    lookup(stage_name, fingerprint) -> Optional[object]:
+        Returns the cached artifact of a fingerprint, if its files still exist.
+    store(stage_name, fingerprint, artifact) -> None:
+        Records the artifact produced for a fingerprint.
+    """
+
+    def __init__(self, cache_dir: str, artifacts_dir: str):
+        self.cache_dir = cache_dir
+        self.artifacts_dir = artifacts_dir
+        self._file_digests = {}
+
+    def file_digest(self, file_path: str) -> str:
+        """
+        Returns the sha256 of a file, memoized on its path, size and modification time.
+        """
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        if key not in self._file_digests:
+            digest = hashlib.sha256()
+            with open(file_path, "rb") as file_obj:
+                for block in iter(lambda: file_obj.read(1024 * 1024), b""):
+                    digest.update(block)
+            self._file_digests[key] = digest.hexdigest()
+        return self._file_digests[key]
+
+    def describe_input(self, value):
+        """
+        Turns an input into a JSON-able description: files become their content digest, directories
+        the digests of their files, artifact dataclasses are described field by field.
+        """
+        if dataclasses.is_dataclass(value):
+            return {field.name: self.describe_input(getattr(value, field.name)) for field in dataclasses.fields(value)}
+        if isinstance(value, str) and os.path.isfile(value):
+            return {"sha256": self.file_digest(value)}
+        if isinstance(value, str) and os.path.isdir(value):
+            return {"sha256": {file_name: self.file_digest(os.path.join(value, file_name))
+                               for file_name in sorted(os.listdir(value))
+                               if os.path.isfile(os.path.join(value, file_name))}}
+        return value
+
+    def describe_config(self, config) -> dict:
+        """
+        Describes a config dataclass with the current run's artifacts directory blanked out of its paths.
+        """
+        description = {}
+        for field in dataclasses.fields(config):
+            value = getattr(config, field.name)
+            if isinstance(value, str) and value.startswith(self.artifacts_dir):
+                value = "<artifacts_dir>" + value[len(self.artifacts_dir):]
+            description[field.name] = value
+        return description
+
+    def compute_fingerprint(self, stage_name: str, inputs: dict, config, config_files: Optional[list] = None) -> str:
+        """
+        Computes the fingerprint of a stage.
+
+        Parameters
+        ----------
+        stage_name : str
+            The name of the stage.
+        inputs : dict
+            What the stage reads: input artifacts, file paths or plain values.
+        config : dataclass
+            The config dataclass of the stage.
+        config_files : list, optional
+            YAML files the stage depends on, e.g. schema.yaml or model.yaml.
+
+        Returns
+        -------
+        str
+            The hex sha256 fingerprint.
+        """
+        try:
+            description = {
+                "stage_name": stage_name,
+                "inputs": {name: self.describe_input(value) for name, value in inputs.items()},
+                "config": self.describe_config(config),
+                "config_files": {file_path: self.file_digest(file_path) for file_path in (config_files or [])},
+            }
+            payload = json.dumps(description, sort_keys=True, default=str)
+            return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+        except Exception as e:
+            logging.error(f"Error computing fingerprint of {stage_name}: {e}")
+            raise USVisaException(e, sys) from e
+
+    def get_entry_path(self, stage_name: str, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, stage_name, f"{fingerprint}.yaml")
+
+    @staticmethod
+    def artifact_files_exist(artifact) -> bool:
+        """
+        Checks that every path recorded in the artifact still exists.
+        """
+        for field in dataclasses.fields(artifact):
+            value = getattr(artifact, field.name)
+            if dataclasses.is_dataclass(value):
+                if not StageCache.artifact_files_exist(value):
+                    return False
+            elif field.name.endswith("_path") and value and not os.path.exists(value):
+                return False
+        return True
+
+    def lookup(self, stage_name: str, fingerprint: str) -> Optional[object]:
+        """
+        Returns the cached artifact of a fingerprint, or None on a miss or when its files were removed.
+        """
+        try:
+            entry_path = self.get_entry_path(stage_name, fingerprint)
+            if not os.path.exists(entry_path):
+                return None
+            artifact = artifact_from_dict(read_yaml_file(filepath=entry_path))
+            if not StageCache.artifact_files_exist(artifact):
+                logging.info(f"Cached {stage_name} artifact {fingerprint[:12]} lost its files, recomputing")
+                return None
+            return artifact
+
+        except Exception as e:
+            logging.error(f"Error reading stage cache of {stage_name}: {e}")
+            raise USVisaException(e, sys) from e
+
+    def store(self, stage_name: str, fingerprint: str, artifact) -> None:
+        """
+        Records the artifact produced for a fingerprint.
+        """
+        try:
+            write_yaml_file(filepath=self.get_entry_path(stage_name, fingerprint),
+                            content=artifact_to_dict(artifact), replace=True)
+
+        except Exception as e:
+            logging.error(f"Error writing stage cache of {stage_name}: {e}")
+            raise USVisaException(e, sys) from e
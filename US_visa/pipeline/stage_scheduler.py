@@ -0,0 +1,174 @@
+## -*- Code:Utf -*-
+
+import sys
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+
+
+@dataclass
+class Stage:
+    name :str
+    function :Callable[[dict], object]
+    depends_on :List[str] = field(default_factory=list)
+
+
+@dataclass
+class StageTiming:
+    name :str
+    start :float
+    end :float
+    worker :str
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class StageScheduler:
+    """
+    Runs pipeline stages declared as a dependency graph on a thread pool.
+
+    A stage starts as soon as every stage it depends on has finished, so independent stages
+    overlap. Each stage function receives a dict of the results of its dependencies. Threads
+    are used because stages share the pipeline object, and the heavy lifting in numpy, pandas
+    and scikit-learn releases the GIL.
+
+    Attributes
+    ----------
+    stages : Dict[str, Stage]
+        The stages by name.
+    max_workers : int
+        Size of the thread pool.
+    timeline : List[StageTiming]
+        Start and end of every finished stage, in seconds since the scheduler started.
+
+    Methods
+    -------
+    run() -> dict:
+        Runs the graph and returns the result of every stage by name.
+    critical_path() -> List[str]:
+        Returns the chain of stages that determined the total run time.
+    format_timeline(width) -> str:
+        Renders the timeline as a text gantt chart.
+    """
+
+    def __init__(self, stages: List[Stage], max_workers: Optional[int] = None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers or len(stages)
+        self.timeline: List[StageTiming] = []
+
+        for stage in stages:
+            unknown = [name for name in stage.depends_on if name not in self.stages]
+            if unknown:
+                raise USVisaException(Exception(f"Stage {stage.name} depends on unknown stages {unknown}"), sys)
+        self.topological_order()
+
+    def topological_order(self) -> List[str]:
+        """
+        Returns the stage names in dependency order, raising if the graph has a cycle.
+        """
+        order, visiting, visited = [], set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise USVisaException(Exception(f"Stage graph has a cycle through {name}"), sys)
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def run(self) -> Dict[str, object]:
+        """
+        Runs the graph and returns the result of every stage by name.
+
+        The first stage that raises stops the scheduling of new stages. Stages already running
+        are left to finish, then the error is raised.
+        """
+        results: Dict[str, object] = {}
+        pending = dict(self.stages)
+        running = {}
+        origin = time.perf_counter()
+
+        def run_stage(stage: Stage):
+            start = time.perf_counter() - origin
+            try:
+                return stage.function({name: results[name] for name in stage.depends_on})
+            finally:
+                self.timeline.append(StageTiming(name=stage.name, start=start,
+                                                 end=time.perf_counter() - origin,
+                                                 worker=threading.current_thread().name))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage") as executor:
+            error = None
+            while (pending or running) and error is None:
+                ready = [stage for stage in pending.values() if all(name in results for name in stage.depends_on)]
+                for stage in ready:
+                    logging.info(f"Scheduling stage {stage.name}")
+                    running[executor.submit(run_stage, stage)] = stage.name
+                    del pending[stage.name]
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        logging.error(f"Stage {name} failed: {e}")
+                        error = error or e
+
+            wait(running)
+
+        self.timeline.sort(key=lambda timing: timing.start)
+        logging.info(f"Stage timeline:\n{self.format_timeline()}")
+        if error is not None:
+            raise error
+        return results
+
+    def critical_path(self) -> List[str]:
+        """
+        Returns the chain of stages that determined the total run time: starting from the last
+        stage to finish, repeatedly follow the dependency that finished last.
+        """
+        timings = {timing.name: timing for timing in self.timeline}
+        if not timings:
+            return []
+        path = [max(timings.values(), key=lambda timing: timing.end).name]
+        while True:
+            dependencies = [timings[name] for name in self.stages[path[-1]].depends_on if name in timings]
+            if not dependencies:
+                break
+            path.append(max(dependencies, key=lambda timing: timing.end).name)
+        return list(reversed(path))
+
+    def format_timeline(self, width: int = 50) -> str:
+        """
+        Renders the timeline as a text gantt chart, marking the stages on the critical path with `*`.
+        """
+        if not self.timeline:
+            return ""
+        total = max(timing.end for timing in self.timeline) or 1.0
+        critical = set(self.critical_path())
+        name_width = max(len(timing.name) for timing in self.timeline)
+        lines = []
+        for timing in self.timeline:
+            begin = int(timing.start / total * width)
+            length = max(1, int(timing.duration / total * width))
+            bar = " " * begin + "#" * length
+            marker = "*" if timing.name in critical else " "
+            lines.append(f"{marker} {timing.name:<{name_width}} |{bar:<{width}}| "
+                         f"{timing.start:8.2f}s -> {timing.end:8.2f}s ({timing.duration:.2f}s)")
+        return "\n".join(lines)
@@ -9,16 +9,28 @@ from US_visa.exception import USVisaException
 from US_visa.components.data_ingestion import DataIngestion
 from US_visa.components.data_validation import DataValidation
 from US_visa.components.data_transformation import DataTransformation
+from US_visa.components.data_resampling import DataResampling
 from US_visa.components.model_trainer import ModelTrainer
-
-from US_visa.entity.config_entity import (DataIngestionConfig,
+from US_visa.data_access.usvisa_data import USvisaData
+from US_visa.pipeline.stage_cache import StageCache
+from US_visa.pipeline.run_manifest import RunManifest
+from US_visa.pipeline.stage_scheduler import Stage, StageScheduler
+from US_visa.utils.main_utils import write_yaml_file
+from US_visa.utils.profiling import profile_step, metrics_recorder
+from US_visa.constants import SCHEMA_FILE_PATH, ARTIFACTS_DIR, RUN_MANIFEST_FILE_NAME
+
+from US_visa.entity.config_entity import (training_pipeline_config,
+                                          DataIngestionConfig,
                                           DataValidationConfig,
                                           DataTransformationConfig,
+                                          DataResamplingConfig,
                                           ModelTrainerConfig)
 
 from US_visa.entity.artifact_entity import (DataIngestionArtifact,
                                             DataValidationArtifact,
+                                            DataDriftArtifact,
                                             DataTransformationArtifact,
+                                            DataResamplingArtifact,
                                             ModelTrainerArtifact)
 
 
@@ -29,12 +41,22 @@ class TrainPipeline:
 
     Attributes
     ----------
+    training_pipeline_config : TrainingPipelineConfig
+        Configuration of the run, including the stage cache settings.
+    stage_cache : StageCache
+        Cache of stage artifacts keyed by the fingerprint of their inputs.
+    run_manifest : RunManifest
+        The completed stages of this run and their artifacts.
+    resumed_artifacts : dict
+        Artifacts of the stages completed by the run being resumed.
     data_ingestion_config : DataIngestionConfig
         Configuration for data ingestion.
     data_validation_config : DataValidationConfig
         Configuration for data validation.
     data_transformation_config : DataTransformationConfig
         Configuration for data transformation.
+    data_resampling_config : DataResamplingConfig
+        Configuration for the resampling of the training set.
     model_trainer_config : ModelTrainerConfig
         Configuration for Model Trainer.
     """
@@ -43,11 +65,71 @@ class TrainPipeline:
         """
         Initializes the TrainPipeline with data ingestion, validation, and transformation configurations.
         """
+        self.training_pipeline_config = training_pipeline_config
+        self.stage_cache = StageCache(cache_dir=self.training_pipeline_config.stage_cache_dir,
+                                      artifacts_dir=self.training_pipeline_config.artifacts_dir)
+        self.run_manifest = RunManifest(manifest_file_path=self.training_pipeline_config.run_manifest_file_path)
+        self.resumed_artifacts = {}
+        metrics_recorder.configure(profile_step_name=self.training_pipeline_config.profile_stage,
+                                   profiler=self.training_pipeline_config.profiler,
+                                   profile_dir=self.training_pipeline_config.profile_dir)
         self.data_ingestion_config = DataIngestionConfig()
         self.data_validation_config = DataValidationConfig()
         self.data_transformation_config = DataTransformationConfig()
+        self.data_resampling_config = DataResamplingConfig()
         self.model_trainer_config = ModelTrainerConfig()
 
+    def run_stage(self, stage_name: str, stage_function, inputs: dict, config, config_files: list = None,
+                  cacheable: bool = True):
+        """
+        Runs a stage, or returns its artifact from the run being resumed or from the stage cache.
+        The outcome is recorded in the run manifest and the stage is timed in the run metrics.
+
+        Parameters
+        ----------
+        stage_name : str
+            The name of the stage, used as the cache namespace.
+        stage_function : callable
+            Runs the stage and returns its artifact.
+        inputs : dict
+            What the stage reads: input artifacts, file paths or plain values.
+        config : dataclass
+            The config dataclass of the stage.
+        config_files : list, optional
+            YAML files the stage depends on.
+        cacheable : bool, optional
+            False when the inputs cannot tell whether the stage output changed, the stage then always
+            runs. Defaults to True.
+
+        Returns
+        -------
+        object
+            The artifact of the stage.
+        """
+        try:
+            with profile_step(stage_name):
+                if stage_name in self.resumed_artifacts:
+                    artifact = self.resumed_artifacts[stage_name]
+                    logging.info(f"Resuming with the {stage_name} artifact of the failed run: {artifact}")
+                elif not self.training_pipeline_config.use_stage_cache or not cacheable:
+                    artifact = stage_function()
+                else:
+                    fingerprint = self.stage_cache.compute_fingerprint(stage_name=stage_name, inputs=inputs,
+                                                                       config=config, config_files=config_files)
+                    artifact = self.stage_cache.lookup(stage_name=stage_name, fingerprint=fingerprint)
+                    if artifact is not None:
+                        logging.info(f"Reusing cached {stage_name} artifact {fingerprint[:12]}: {artifact}")
+                    else:
+                        artifact = stage_function()
+                        self.stage_cache.store(stage_name=stage_name, fingerprint=fingerprint, artifact=artifact)
+
+            self.run_manifest.record_stage(stage_name=stage_name, artifact=artifact)
+            return artifact
+
+        except Exception as e:
+            self.run_manifest.mark_failed(stage_name=stage_name, error=e)
+            raise
+
     def start_data_ingestion(self) -> DataIngestionArtifact:
         """
         Starts the data ingestion process and fetches the data from MongoDB.
@@ -110,6 +192,63 @@ class TrainPipeline:
         except Exception as e:
             raise USVisaException(e, sys) from e
 
+    def start_schema_validation(self, data_ingestion_artifact: DataIngestionArtifact) -> DataValidationArtifact:
+        """
+        Starts the column checks of the data validation, without the drift report.
+
+        Parameters
+        ----------
+        data_ingestion_artifact : DataIngestionArtifact
+            An artifact containing paths to the ingested training and testing datasets.
+
+        Returns
+        -------
+        DataValidationArtifact
+            An artifact containing the validation status and the validation errors.
+
+        Raises
+        ------
+        USVisaException
+            If any error occurs during data validation.
+        """
+        try:
+            data_validation = DataValidation(data_ingestion_artifact=data_ingestion_artifact,
+                                             data_validation_config=self.data_validation_config)
+            return data_validation.initiate_schema_validation()
+
+        except Exception as e:
+            raise USVisaException(e, sys) from e
+
+    def start_drift_detection(self, data_ingestion_artifact: DataIngestionArtifact,
+                              data_validation_artifact: DataValidationArtifact) -> DataDriftArtifact:
+        """
+        Starts the drift report of the validated test set against the train set.
+
+        Parameters
+        ----------
+        data_ingestion_artifact : DataIngestionArtifact
+            An artifact containing paths to the ingested training and testing datasets.
+        data_validation_artifact : DataValidationArtifact
+            An artifact containing the validation status and the paths to the validated datasets.
+
+        Returns
+        -------
+        DataDriftArtifact
+            An artifact containing the drift status and the drift report path.
+
+        Raises
+        ------
+        USVisaException
+            If any error occurs during drift detection.
+        """
+        try:
+            data_validation = DataValidation(data_ingestion_artifact=data_ingestion_artifact,
+                                             data_validation_config=self.data_validation_config)
+            return data_validation.initiate_drift_detection(data_validation_artifact=data_validation_artifact)
+
+        except Exception as e:
+            raise USVisaException(e, sys) from e
+
     def start_data_transformation(self, data_ingestion_artifact: DataIngestionArtifact,
                                   data_validation_artifact: DataValidationArtifact) -> DataTransformationArtifact:
         """
@@ -146,7 +285,36 @@ class TrainPipeline:
             raise USVisaException(e, sys) from e
         
 
-    def start_model_training(self, data_transformation_artifact:DataTransformationArtifact) -> ModelTrainerArtifact:
+    def start_data_resampling(self, data_transformation_artifact: DataTransformationArtifact) -> DataResamplingArtifact:
+        """
+        Starts the resampling of the transformed training set.
+
+        Parameters
+        ----------
+        data_transformation_artifact : DataTransformationArtifact
+            An artifact containing paths to the transformed training and testing datasets.
+
+        Returns
+        -------
+        DataResamplingArtifact
+            An artifact containing the path to the resampled training dataset.
+
+        Raises
+        ------
+        USVisaException
+            If any error occurs during the resampling.
+        """
+        try:
+            data_resampling = DataResampling(data_transformation_artifact=data_transformation_artifact,
+                                             data_resampling_config=self.data_resampling_config)
+            return data_resampling.initiate_data_resampling()
+
+        except Exception as e:
+            logging.error(f"Error During start data resampling: {e}")
+            raise USVisaException(e, sys) from e
+
+    def start_model_training(self, data_transformation_artifact:DataTransformationArtifact,
+                             data_resampling_artifact: DataResamplingArtifact = None) -> ModelTrainerArtifact:
         """
         Initiates the model training process using the provided data transformation artifact.
 
@@ -154,6 +322,8 @@ class TrainPipeline:
         ----------
         data_transformation_artifact : DataTransformationArtifact
             An artifact containing paths to the transformed training and testing datasets.
+        data_resampling_artifact : DataResamplingArtifact, optional
+            An artifact containing the path to the resampled training dataset.
 
         Returns
         -------
@@ -167,7 +337,8 @@ class TrainPipeline:
         """
         try:
             model_trainer = ModelTrainer(data_transformation_artifact=data_transformation_artifact,
-                                         model_trainer_config=self.model_trainer_config)
+                                         model_trainer_config=self.model_trainer_config,
+                                         data_resampling_artifact=data_resampling_artifact)
             
             model_trainer_artifact = model_trainer.initiate_model_trainer()
             return model_trainer_artifact
@@ -176,9 +347,105 @@ class TrainPipeline:
             logging.error(f"Error During start model training: {e}")
             raise USVisaException(e, sys) from e
 
+    def get_stages(self) -> list:
+        """
+        Declares the training pipeline as a dependency graph.
+
+        The drift report only feeds the validation message, so it runs on the validated data next to
+        the transformation and training instead of in front of them.
+
+        Returns
+        -------
+        list
+            The Stage objects of the pipeline.
+        """
+        def data_ingestion(artifacts: dict) -> DataIngestionArtifact:
+            # without an updated_at field an in-place update leaves the collection state unchanged, so
+            # the export always runs; the later stages still hit the cache on unchanged ingested files
+            updated_at_field = self.data_ingestion_config.updated_at_field
+            collection_state = {}
+            if self.training_pipeline_config.use_stage_cache and updated_at_field is not None \
+                    and "data_ingestion" not in self.resumed_artifacts:
+                collection_state = USvisaData().get_collection_state(
+                    collection_name=self.data_ingestion_config.collection_name,
+                    updated_at_field=updated_at_field,
+                    query_filter=self.data_ingestion_config.query_filter)
+            return self.run_stage(
+                stage_name="data_ingestion",
+                stage_function=self.start_data_ingestion,
+                inputs={"collection_state": collection_state},
+                config=self.data_ingestion_config,
+                config_files=[SCHEMA_FILE_PATH],
+                cacheable=updated_at_field is not None)
+
+        def data_validation(artifacts: dict) -> DataValidationArtifact:
+            return self.run_stage(
+                stage_name="data_validation",
+                stage_function=lambda: self.start_schema_validation(data_ingestion_artifact=artifacts["data_ingestion"]),
+                inputs={"data_ingestion_artifact": artifacts["data_ingestion"]},
+                config=self.data_validation_config,
+                config_files=[SCHEMA_FILE_PATH])
+
+        def drift_report(artifacts: dict) -> DataDriftArtifact:
+            return self.run_stage(
+                stage_name="drift_report",
+                stage_function=lambda: self.start_drift_detection(
+                    data_ingestion_artifact=artifacts["data_ingestion"],
+                    data_validation_artifact=artifacts["data_validation"]),
+                inputs={"data_ingestion_artifact": artifacts["data_ingestion"],
+                        "validation_status": artifacts["data_validation"].validation_status,
+                        "valid_train_file_path": artifacts["data_validation"].valid_train_file_path,
+                        "valid_test_file_path": artifacts["data_validation"].valid_test_file_path},
+                config=self.data_validation_config,
+                config_files=[SCHEMA_FILE_PATH])
+
+        def data_transformation(artifacts: dict) -> DataTransformationArtifact:
+            return self.run_stage(
+                stage_name="data_transformation",
+                stage_function=lambda: self.start_data_transformation(
+                    data_ingestion_artifact=artifacts["data_ingestion"],
+                    data_validation_artifact=artifacts["data_validation"]),
+                inputs={"data_ingestion_artifact": artifacts["data_ingestion"],
+                        "validation_status": artifacts["data_validation"].validation_status,
+                        "valid_train_file_path": artifacts["data_validation"].valid_train_file_path,
+                        "valid_test_file_path": artifacts["data_validation"].valid_test_file_path},
+                config=self.data_transformation_config,
+                config_files=[SCHEMA_FILE_PATH])
+
+        def data_resampling(artifacts: dict) -> DataResamplingArtifact:
+            return self.run_stage(
+                stage_name="data_resampling",
+                stage_function=lambda: self.start_data_resampling(
+                    data_transformation_artifact=artifacts["data_transformation"]),
+                inputs={"transformed_train_file_path": artifacts["data_transformation"].transformed_train_file_path},
+                config=self.data_resampling_config)
+
+        def model_trainer(artifacts: dict) -> ModelTrainerArtifact:
+            return self.run_stage(
+                stage_name="model_trainer",
+                stage_function=lambda: self.start_model_training(
+                    data_transformation_artifact=artifacts["data_transformation"],
+                    data_resampling_artifact=artifacts["data_resampling"]),
+                inputs={"data_transformation_artifact": artifacts["data_transformation"],
+                        "data_resampling_artifact": artifacts["data_resampling"]},
+                config=self.model_trainer_config,
+                config_files=[self.model_trainer_config.model_config_file_path])
+
+        return [
+            Stage(name="data_ingestion", function=data_ingestion),
+            Stage(name="data_validation", function=data_validation, depends_on=["data_ingestion"]),
+            Stage(name="drift_report", function=drift_report, depends_on=["data_ingestion", "data_validation"]),
+            Stage(name="data_transformation", function=data_transformation,
+                  depends_on=["data_ingestion", "data_validation"]),
+            Stage(name="data_resampling", function=data_resampling, depends_on=["data_transformation"]),
+            Stage(name="model_trainer", function=model_trainer, depends_on=["data_transformation", "data_resampling"]),
+        ]
+
     def run_pipeline(self) -> None:
         """
-        Executes the entire training pipeline.
+        Executes the entire training pipeline, running independent stages concurrently.
+        The per-stage timeline and critical path, and the metrics of every stage and step,
+        are written next to the run manifest.
 
         Raises
         ------
@@ -186,11 +453,64 @@ class TrainPipeline:
             If any error occurs during the pipeline execution.
         """
         try:
-            data_ingestion_artifact = self.start_data_ingestion()
-            data_validation_artifact = self.start_data_validation(data_ingestion_artifact=data_ingestion_artifact)
-            data_transformation_artifact = self.start_data_transformation(data_ingestion_artifact=data_ingestion_artifact,
-                                                                          data_validation_artifact=data_validation_artifact)
-            model_trainer_artifact = self.start_model_training(data_transformation_artifact=data_transformation_artifact)
+            scheduler = StageScheduler(stages=self.get_stages(),
+                                       max_workers=self.training_pipeline_config.max_stage_workers)
+            try:
+                artifacts = scheduler.run()
+            finally:
+                write_yaml_file(filepath=self.training_pipeline_config.stage_timeline_file_path,
+                                content={"critical_path": scheduler.critical_path(),
+                                         "stages": [{"name": timing.name,
+                                                     "start": round(timing.start, 3),
+                                                     "end": round(timing.end, 3),
+                                                     "duration": round(timing.duration, 3),
+                                                     "worker": timing.worker}
+                                                    for timing in scheduler.timeline]},
+                                replace=True)
+                metrics_recorder.write(filepath=self.training_pipeline_config.metrics_file_path)
+
+            data_validation_artifact = DataValidation.merge_artifacts(artifacts["data_validation"],
+                                                                      artifacts["drift_report"])
+            logging.info(f"Data validation artifact: {data_validation_artifact}")
+            logging.info(f"Model trainer artifact: {artifacts['model_trainer']}")
+
+            self.run_manifest.mark_completed()
 
         except Exception as e:
             raise USVisaException(e, sys)
+
+    def resume(self, run_manifest_file_path: str = None) -> None:
+        """
+        Resumes a failed run from its first incomplete stage.
+
+        The artifacts of the stages the failed run completed are reloaded from its manifest and
+        reused as they are, the remaining stages run and write into this run's artifacts directory.
+
+        Parameters
+        ----------
+        run_manifest_file_path : str, optional
+            The manifest of the run to resume. Defaults to the most recent failed run.
+
+        Raises
+        ------
+        USVisaException
+            If there is no failed run to resume or any error occurs during the pipeline execution.
+        """
+        try:
+            if run_manifest_file_path is None:
+                run_manifest_file_path = RunManifest.find_latest_failed(artifacts_root=ARTIFACTS_DIR,
+                                                                        manifest_file_name=RUN_MANIFEST_FILE_NAME)
+            if run_manifest_file_path is None:
+                raise Exception("No failed training pipeline run to resume")
+
+            failed_run_manifest = RunManifest.load(manifest_file_path=run_manifest_file_path)
+            self.resumed_artifacts = failed_run_manifest.stages
+            logging.info(f"Resuming {run_manifest_file_path} after stages {list(self.resumed_artifacts)}, "
+                         f"failed in {failed_run_manifest.failed_stage}")
+            self.run_pipeline()
+
+            failed_run_manifest.status = "resumed"
+            failed_run_manifest.save()
+
+        except Exception as e:
+            raise USVisaException(e, sys) from e
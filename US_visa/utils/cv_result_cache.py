@@ -0,0 +1,195 @@
+## -*- Code : Utf -*-
+
+"""
+A disk cache of cross-validation results.
+
+The fold scores and fit time of a parameter set are keyed by the estimator class, all its
+parameters, the training rows it was fitted on and the CV spec: the folds, the subsample order and
+the scoring. Only the results of estimators with a fixed random_state, or none, are cached. A run
+of the model selection on unchanged training data only cross-validates the parameter sets that are
+new or whose key changed. The results of one training set and CV spec live in
+`<cache_dir>/<fingerprint>.json`, and the least recently used files are evicted to keep the
+directory under a disk quota.
+"""
+
+import os
+import sys
+import json
+import hashlib
+from typing import Optional
+
+import numpy as np
+import sklearn
+from scipy import sparse
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+
+
+def fingerprint_arrays(*arrays) -> str:
+    """
+    Fingerprints NumPy arrays and CSR matrices by their dtype, shape and content.
+
+    Args:
+        *arrays: The arrays, a list of arrays, e.g. the folds, being fingerprinted item by item.
+
+    Returns:
+        str: The hex sha256 fingerprint.
+    """
+    digest = hashlib.sha256()
+    for array in arrays:
+        if isinstance(array, (list, tuple)):
+            digest.update(fingerprint_arrays(*array).encode("utf-8"))
+            continue
+        parts = [array.data, array.indices, array.indptr] if sparse.issparse(array) else [array]
+        digest.update(f"{type(array).__name__}{array.shape}".encode("utf-8"))
+        for part in parts:
+            part = np.ascontiguousarray(part)
+            digest.update(str(part.dtype).encode("utf-8"))
+            digest.update(part.view(np.uint8).reshape(-1).data)
+    return digest.hexdigest()
+
+
+def fingerprint_cv_spec(features, target, folds: list, fold_orders: list, scoring: Optional[str]) -> str:
+    """
+    Fingerprints the training data and the CV spec the results of a model selection depend on.
+
+    Args:
+        features: The training features, a NumPy array or a CSR matrix.
+        target: The training labels.
+        folds (list): The (train_index, test_index) pairs.
+        fold_orders (list): The order of the training rows of every fold the subsamples are taken from.
+        scoring (Optional[str]): The scikit-learn scorer name, None for the score method.
+
+    Returns:
+        str: The hex sha256 fingerprint.
+    """
+    try:
+        digest = hashlib.sha256(fingerprint_arrays(features, np.asarray(target), folds, fold_orders).encode("utf-8"))
+        digest.update(repr(scoring).encode("utf-8"))
+        return digest.hexdigest()
+
+    except Exception as e:
+        logging.error(f"Error fingerprinting the cross-validation spec: {e}")
+        raise USVisaException(e, sys) from e
+
+
+def is_deterministic(estimator, params: dict) -> bool:
+    """
+    Whether the scores of a parameter set can be cached: an estimator with a random_state left to
+    None draws differently on every fit, so its scores are one random draw and are not stored.
+    """
+    all_params = {**estimator.get_params(deep=False), **params}
+    return "random_state" not in all_params or all_params["random_state"] is not None
+
+
+def get_result_key(estimator, params: dict, n_samples: Optional[int]) -> str:
+    """
+    The key of a parameter set of an estimator within the results of one training set and CV spec:
+    the estimator class and every parameter, the fixed ones included, so changing a fixed parameter
+    of model.yaml invalidates the results.
+    """
+    all_params = {**estimator.get_params(deep=False), **params}
+    description = {"class": f"{type(estimator).__module__}.{type(estimator).__qualname__}",
+                   "params": all_params, "n_samples": n_samples, "sklearn": sklearn.__version__}
+    return hashlib.sha256(json.dumps(description, sort_keys=True, default=repr).encode("utf-8")).hexdigest()
+
+
+class CVResultCache:
+    """
+    A disk cache of the fold scores and fit times of cross-validated parameter sets.
+
+    Attributes:
+        cache_dir (str): The directory holding one JSON file per training set and CV spec.
+        max_bytes (int): The disk quota of the cache directory.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def get_file_path(self, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, f"{fingerprint}.json")
+
+    def load(self, fingerprint: str) -> dict:
+        """
+        Loads the results of a training set and CV spec.
+
+        Args:
+            fingerprint (str): The fingerprint of the training data, the folds and the scoring.
+
+        Returns:
+            dict: The {"fold_scores", "fit_time"} of every result key, empty on a miss.
+        """
+        try:
+            file_path = self.get_file_path(fingerprint)
+            if not os.path.exists(file_path):
+                return {}
+            with open(file_path) as file:
+                entries = json.load(file)
+            # the modification time of the file records its last use for the eviction
+            os.utime(file_path)
+            logging.info(f"Loaded {len(entries)} cross-validation results of {fingerprint[:12]}")
+            return entries
+
+        except Exception as e:
+            logging.error(f"Error reading the cross-validation results of {fingerprint[:12]}: {e}")
+            raise USVisaException(e, sys) from e
+
+    def store(self, fingerprint: str, entries: dict) -> None:
+        """
+        Adds results to the file of a training set and CV spec, then evicts the least recently used
+        files over the quota.
+
+        The file is written next to its final path and renamed into place, so a concurrent run never
+        reads a partial file. Two runs storing at once keep the results of the last one.
+        """
+        try:
+            if not entries:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            file_path = self.get_file_path(fingerprint)
+            stored = {}
+            if os.path.exists(file_path):
+                with open(file_path) as file:
+                    stored = json.load(file)
+            stored.update(entries)
+            tmp_path = f"{file_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(stored, file)
+            os.replace(tmp_path, file_path)
+            self.evict()
+
+        except Exception as e:
+            logging.error(f"Error writing the cross-validation results of {fingerprint[:12]}: {e}")
+            raise USVisaException(e, sys) from e
+
+    def evict(self) -> list:
+        """
+        Removes the least recently used files until the cache fits in max_bytes.
+
+        Returns:
+            list: The evicted fingerprints.
+        """
+        try:
+            files = []
+            for file_name in os.listdir(self.cache_dir):
+                if file_name.endswith(".json"):
+                    file_path = os.path.join(self.cache_dir, file_name)
+                    files.append((os.path.getmtime(file_path), file_name, os.path.getsize(file_path)))
+
+            total_bytes = sum(size for _, _, size in files)
+            evicted = []
+            for _, file_name, size in sorted(files):
+                if total_bytes <= self.max_bytes:
+                    break
+                os.remove(os.path.join(self.cache_dir, file_name))
+                total_bytes -= size
+                evicted.append(os.path.splitext(file_name)[0])
+            if evicted:
+                logging.info(f"Evicted {len(evicted)} cross-validation result files, {total_bytes} bytes left")
+            return evicted
+
+        except Exception as e:
+            logging.error(f"Error evicting cross-validation result files: {e}")
+            raise USVisaException(e, sys) from e
@@ -0,0 +1,410 @@
+## -*- Code : Utf -*-
+
+"""
+Column drift statistics computed directly with NumPy.
+
+Numerical columns get the two-sample Kolmogorov-Smirnov test and the population stability index (PSI),
+categorical columns the chi-square goodness-of-fit test and the Jensen-Shannon distance. As in evidently,
+the p-value tests decide for small reference samples and the distances decide for large ones, where
+p-values flag negligible shifts.
+"""
+
+import sys
+import numpy as np
+import pandas as pd
+from typing import Optional
+from pandas import DataFrame, Series
+from scipy.stats import chi2, kstwo
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+from US_visa.utils.sampling_utils import dkw_error
+from US_visa.utils.parallel_utils import map_columns
+
+"Smoothing added to empty bins so that PSI and the chi-square expectation stay finite"
+EPSILON :float= 1e-4
+
+
+def ks_test(reference: np.ndarray, current: np.ndarray) -> tuple:
+    """
+    Two-sample Kolmogorov-Smirnov test.
+
+    Args:
+        reference (np.ndarray): The reference values, without NaN.
+        current (np.ndarray): The current values, without NaN.
+
+    Returns:
+        tuple: The KS statistic and its asymptotic p-value.
+    """
+    reference, current = np.sort(reference), np.sort(current)
+    n_reference, n_current = len(reference), len(current)
+    values = np.concatenate([reference, current])
+    reference_cdf = np.searchsorted(reference, values, side="right") / n_reference
+    current_cdf = np.searchsorted(current, values, side="right") / n_current
+    statistic = float(np.max(np.abs(reference_cdf - current_cdf)))
+    effective_n = round(n_reference * n_current / (n_reference + n_current))
+    p_value = float(np.clip(kstwo.sf(statistic, max(effective_n, 1)), 0.0, 1.0))
+    return statistic, p_value
+
+
+def get_bin_edges(reference: np.ndarray, n_bins: int = 10) -> np.ndarray:
+    """
+    Inner quantile bin edges of the reference values, the outer bins are open to -inf and inf.
+    """
+    if len(reference) == 0:
+        return np.array([], dtype=float)
+    return np.unique(np.quantile(reference, np.linspace(0, 1, n_bins + 1)[1:-1])).astype(float)
+
+
+def histogram_counts(values: np.ndarray, bin_edges: np.ndarray) -> np.ndarray:
+    """
+    Counts the values falling in each of the len(bin_edges) + 1 bins delimited by the inner edges.
+    """
+    bin_index = np.searchsorted(bin_edges, values, side="right")
+    return np.bincount(bin_index, minlength=len(bin_edges) + 1)
+
+
+def ks_test_from_counts(reference_counts: np.ndarray, current_counts: np.ndarray) -> tuple:
+    """
+    Kolmogorov-Smirnov test on two histograms over the same bins, comparing the empirical CDFs at the bin edges.
+    The statistic is a lower bound of the exact one, equal to it when the bins are fine enough.
+
+    Returns:
+        tuple: The KS statistic and its asymptotic p-value.
+    """
+    n_reference, n_current = int(reference_counts.sum()), int(current_counts.sum())
+    if n_reference == 0 or n_current == 0:
+        return 0.0, 1.0
+    statistic = float(np.max(np.abs(np.cumsum(reference_counts) / n_reference
+                                    - np.cumsum(current_counts) / n_current)))
+    effective_n = round(n_reference * n_current / (n_reference + n_current))
+    p_value = float(np.clip(kstwo.sf(statistic, max(effective_n, 1)), 0.0, 1.0))
+    return statistic, p_value
+
+
+def to_proportions(counts: np.ndarray) -> np.ndarray:
+    """
+    Turns counts into proportions along the last axis, giving empty bins a small share.
+    """
+    counts = np.asarray(counts, dtype=float)
+    proportions = counts / np.maximum(counts.sum(axis=-1, keepdims=True), 1)
+    proportions = np.where(proportions == 0, EPSILON, proportions)
+    return proportions / proportions.sum(axis=-1, keepdims=True)
+
+
+def population_stability_index(reference_counts: np.ndarray, current_counts: np.ndarray):
+    """
+    PSI between histograms over the same bins. Stacked histograms (one per row) give one PSI per row.
+    """
+    reference_proportions, current_proportions = to_proportions(reference_counts), to_proportions(current_counts)
+    psi = np.sum((current_proportions - reference_proportions)
+                 * np.log(current_proportions / reference_proportions), axis=-1)
+    return float(psi) if np.ndim(psi) == 0 else psi
+
+
+def chi_square_test(reference_counts: np.ndarray, current_counts: np.ndarray) -> tuple:
+    """
+    Chi-square goodness-of-fit test of the current counts against the reference proportions.
+
+    Returns:
+        tuple: The chi-square statistic and its p-value.
+    """
+    if current_counts.sum() == 0:
+        return 0.0, 1.0
+    expected = to_proportions(reference_counts) * current_counts.sum()
+    statistic = float(np.sum((current_counts - expected) ** 2 / expected))
+    p_value = float(chi2.sf(statistic, max(len(current_counts) - 1, 1)))
+    return statistic, p_value
+
+
+def jensen_shannon_distance(reference_counts: np.ndarray, current_counts: np.ndarray):
+    """
+    Jensen-Shannon distance (base 2, between 0 and 1) between count vectors. Stacked count vectors
+    (one per row) give one distance per row.
+    """
+    reference_counts = np.asarray(reference_counts, dtype=float)
+    current_counts = np.asarray(current_counts, dtype=float)
+    p = reference_counts / np.maximum(reference_counts.sum(axis=-1, keepdims=True), 1)
+    q = current_counts / np.maximum(current_counts.sum(axis=-1, keepdims=True), 1)
+    m = (p + q) / 2
+
+    def kl_divergence(a, b):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.sum(np.where(a > 0, a * np.log2(a / b), 0.0), axis=-1)
+
+    distance = np.sqrt(np.maximum((kl_divergence(p, m) + kl_divergence(q, m)) / 2, 0.0))
+    return float(distance) if np.ndim(distance) == 0 else distance
+
+
+def category_counts(reference: Series, current: Series) -> tuple:
+    """
+    Counts the categories of both series over their union with np.bincount of the category codes.
+
+    Returns:
+        tuple: The reference counts, the current counts and the categories.
+    """
+    if isinstance(reference.dtype, pd.CategoricalDtype) and isinstance(current.dtype, pd.CategoricalDtype):
+        categories = reference.cat.categories.union(current.cat.categories, sort=False)
+    else:
+        categories = pd.Index(pd.unique(pd.concat([reference.dropna(), current.dropna()]).astype(object)))
+    reference_codes = pd.Categorical(reference, categories=categories).codes
+    current_codes = pd.Categorical(current, categories=categories).codes
+    return (np.bincount(reference_codes[reference_codes >= 0], minlength=len(categories)),
+            np.bincount(current_codes[current_codes >= 0], minlength=len(categories)),
+            categories)
+
+
+def numerical_drift_decision(ks_statistic: float, p_value: float, psi: float, n_reference: int,
+                             p_value_threshold: float = 0.05, psi_threshold: float = 0.1,
+                             small_sample_size: int = 1000) -> dict:
+    """
+    Drift decision of a numerical column: KS decides up to small_sample_size reference values, PSI above.
+    """
+    if n_reference <= small_sample_size:
+        stattest, drift_detected = "ks", p_value < p_value_threshold
+    else:
+        stattest, drift_detected = "psi", psi >= psi_threshold
+    return {"column_type": "num", "stattest": stattest, "ks_statistic": ks_statistic,
+            "p_value": p_value, "psi": psi, "drift_detected": bool(drift_detected)}
+
+
+def categorical_drift_decision(reference_counts: np.ndarray, current_counts: np.ndarray,
+                               p_value_threshold: float = 0.05, distance_threshold: float = 0.1,
+                               small_sample_size: int = 1000) -> dict:
+    """
+    Drift decision of a categorical column from its category counts: chi-square decides up to
+    small_sample_size reference values, the Jensen-Shannon distance above.
+    """
+    chi_square_statistic, p_value = chi_square_test(reference_counts, current_counts)
+    distance = jensen_shannon_distance(reference_counts, current_counts)
+    if reference_counts.sum() <= small_sample_size:
+        stattest, drift_detected = "chisquare", p_value < p_value_threshold
+    else:
+        stattest, drift_detected = "jensenshannon", distance >= distance_threshold
+    return {"column_type": "cat", "stattest": stattest, "chi_square_statistic": chi_square_statistic,
+            "p_value": p_value, "jensen_shannon": distance, "drift_detected": bool(drift_detected)}
+
+
+def numerical_column_drift(reference: Series, current: Series, p_value_threshold: float = 0.05,
+                           psi_threshold: float = 0.1, small_sample_size: int = 1000, n_bins: int = 10) -> dict:
+    """
+    Drift of a numerical column, with the exact KS test on the raw values.
+
+    Returns:
+        dict: The statistics of the column and its drift decision.
+    """
+    reference_values = reference.to_numpy(dtype=float, na_value=np.nan)
+    current_values = current.to_numpy(dtype=float, na_value=np.nan)
+    reference_values = reference_values[~np.isnan(reference_values)]
+    current_values = current_values[~np.isnan(current_values)]
+
+    ks_statistic, p_value = ks_test(reference_values, current_values)
+    bin_edges = get_bin_edges(reference_values, n_bins=n_bins)
+    psi = population_stability_index(histogram_counts(reference_values, bin_edges),
+                                      histogram_counts(current_values, bin_edges))
+    return numerical_drift_decision(ks_statistic, p_value, psi, n_reference=len(reference_values),
+                                    p_value_threshold=p_value_threshold, psi_threshold=psi_threshold,
+                                    small_sample_size=small_sample_size)
+
+
+def categorical_column_drift(reference: Series, current: Series, p_value_threshold: float = 0.05,
+                             distance_threshold: float = 0.1, small_sample_size: int = 1000) -> dict:
+    """
+    Drift of a categorical column.
+
+    Returns:
+        dict: The statistics of the column and its drift decision.
+    """
+    reference_counts, current_counts, _ = category_counts(reference, current)
+    return categorical_drift_decision(reference_counts, current_counts, p_value_threshold=p_value_threshold,
+                                      distance_threshold=distance_threshold, small_sample_size=small_sample_size)
+
+
+def column_drift(reference: Series, current: Series, column_type: str, p_value_threshold: float = 0.05,
+                 psi_threshold: float = 0.1, distance_threshold: float = 0.1, small_sample_size: int = 1000) -> dict:
+    """
+    Drift of a column, numerical ("num") or categorical ("cat"), so both kinds run as the same per-column task.
+    """
+    if column_type == "num":
+        return numerical_column_drift(reference, current, p_value_threshold=p_value_threshold,
+                                      psi_threshold=psi_threshold, small_sample_size=small_sample_size)
+    return categorical_column_drift(reference, current, p_value_threshold=p_value_threshold,
+                                    distance_threshold=distance_threshold, small_sample_size=small_sample_size)
+
+
+def summarize_drift(column_report: dict, drift_share: float = 0.5) -> dict:
+    """
+    Builds the drift report from the per-column results. The dataset drifts when at least drift_share
+    of the columns drift, the rule of evidently's DataDriftProfileSection.
+    """
+    n_features = len(column_report)
+    n_drifted_features = sum(column["drift_detected"] for column in column_report.values())
+    share_drifted_features = n_drifted_features / n_features if n_features else 0.0
+    return {"dataset_drift": bool(n_features > 0 and share_drifted_features >= drift_share),
+            "n_features": n_features,
+            "n_drifted_features": int(n_drifted_features),
+            "share_drifted_features": share_drifted_features,
+            "columns": column_report}
+
+
+def detect_drift(reference_df: DataFrame, current_df: DataFrame, numerical_columns: list,
+                 categorical_columns: list, p_value_threshold: float = 0.05, psi_threshold: float = 0.1,
+                 distance_threshold: float = 0.1, drift_share: float = 0.5,
+                 small_sample_size: int = 1000, columns: Optional[list] = None, max_workers: int = 1) -> dict:
+    """
+    Computes the drift of every column of two DataFrames and the dataset drift decision.
+
+    Args:
+        reference_df (DataFrame): The reference data, e.g. the train set.
+        current_df (DataFrame): The data compared against it, e.g. the test set.
+        numerical_columns (list): The numerical columns.
+        categorical_columns (list): The categorical columns.
+        columns (Optional[list]): Restricts the report to these columns. Defaults to every column present in both frames.
+        max_workers (int): The number of processes computing the columns. Defaults to 1.
+
+    Returns:
+        dict: The compact drift report, with `dataset_drift`, `n_features`, `n_drifted_features` and the per-column statistics.
+    """
+    try:
+        present = set(reference_df.columns) & set(current_df.columns)
+        column_types = {}
+        for column_type, type_columns in (("num", numerical_columns), ("cat", categorical_columns)):
+            for column in type_columns:
+                if column in present and (columns is None or column in columns):
+                    column_types[column] = column_type
+        column_report = map_columns(column_drift, frames=[reference_df, current_df], columns=list(column_types),
+                                    max_workers=max_workers,
+                                    column_kwargs={column: {"column_type": column_type}
+                                                   for column, column_type in column_types.items()},
+                                    p_value_threshold=p_value_threshold, psi_threshold=psi_threshold,
+                                    distance_threshold=distance_threshold, small_sample_size=small_sample_size)
+        return summarize_drift(column_report, drift_share=drift_share)
+
+    except Exception as e:
+        logging.error(f"Error computing drift: {e}")
+        raise USVisaException(e, sys) from e
+
+
+def compare_profiles(reference_profile, current_profile, p_value_threshold: float = 0.05,
+                     psi_threshold: float = 0.1, distance_threshold: float = 0.1, drift_share: float = 0.5,
+                     small_sample_size: int = 1000, columns: Optional[list] = None) -> dict:
+    """
+    Computes the drift of a current DataProfile against a reference DataProfile built with the same
+    bins and categories (see DataProfile.empty_like), so the cost does not depend on the reference size.
+
+    Args:
+        reference_profile (DataProfile): The profile of the reference data.
+        current_profile (DataProfile): The profile of the data compared against it.
+        columns (Optional[list]): Restricts the report to these columns. Defaults to every profiled column
+            the current profile has seen.
+
+    Returns:
+        dict: The compact drift report, in the format of detect_drift.
+    """
+    try:
+        column_report = {}
+        for column, reference in reference_profile.columns.items():
+            if column not in current_profile.columns or (columns is not None and column not in columns):
+                continue
+            current = current_profile.columns[column]
+            if current.n_rows == 0:
+                continue
+            if reference.column_type == "num":
+                reference_counts, current_counts = np.asarray(reference.counts), np.asarray(current.counts)
+                ks_statistic, p_value = ks_test_from_counts(np.asarray(reference.quantile_counts),
+                                                            np.asarray(current.quantile_counts))
+                column_report[column] = numerical_drift_decision(
+                    ks_statistic, p_value, population_stability_index(reference_counts, current_counts),
+                    n_reference=int(reference_counts.sum()), p_value_threshold=p_value_threshold,
+                    psi_threshold=psi_threshold, small_sample_size=small_sample_size)
+            else:
+                column_report[column] = categorical_drift_decision(
+                    np.append(reference.counts, reference.other_count), np.append(current.counts, current.other_count),
+                    p_value_threshold=p_value_threshold, distance_threshold=distance_threshold,
+                    small_sample_size=small_sample_size)
+        return summarize_drift(column_report, drift_share=drift_share)
+
+    except Exception as e:
+        logging.error(f"Error comparing data profiles: {e}")
+        raise USVisaException(e, sys) from e
+
+
+def bootstrap_interval(statistic, reference_counts: np.ndarray, current_counts: np.ndarray,
+                       reference_sampled: bool, current_sampled: bool, confidence_level: float = 0.95,
+                       n_resamples: int = 200, rng: Optional[np.random.Generator] = None) -> list:
+    """
+    Bootstrap interval of a non-negative statistic of two histograms. The histograms of the sampled sides are
+    redrawn from a multinomial with the observed proportions, all resamples at once. PSI and divergences of
+    sampled histograms are biased upwards, so the percentile interval is shifted by the bootstrap estimate
+    of the bias and clipped at 0.
+
+    Args:
+        statistic (callable): A statistic of (reference_counts, current_counts) accepting stacked histograms.
+        reference_sampled (bool): Whether the reference histogram comes from a sample.
+        current_sampled (bool): Whether the current histogram comes from a sample.
+
+    Returns:
+        list: The lower and upper bound.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+
+    def resample(counts, sampled):
+        counts = np.asarray(counts, dtype=np.int64)
+        n_values = int(counts.sum())
+        if not sampled or n_values == 0:
+            return np.broadcast_to(counts, (n_resamples, len(counts)))
+        return rng.multinomial(n_values, counts / n_values, size=n_resamples)
+
+    values = statistic(resample(reference_counts, reference_sampled), resample(current_counts, current_sampled))
+    bias = float(np.mean(values)) - statistic(np.asarray(reference_counts), np.asarray(current_counts))
+    alpha = 1 - confidence_level
+    return [max(0.0, float(np.quantile(values, alpha / 2)) - bias),
+            max(0.0, float(np.quantile(values, 1 - alpha / 2)) - bias)]
+
+
+def add_confidence_intervals(report: dict, reference_profile, current_profile, reference_sampled: bool,
+                             current_sampled: bool, confidence_level: float = 0.95, n_resamples: int = 200,
+                             p_value_threshold: float = 0.05, psi_threshold: float = 0.1,
+                             distance_threshold: float = 0.1, random_state: Optional[int] = None) -> dict:
+    """
+    Adds confidence intervals to the per-column statistics of a report of compare_profiles built on samples:
+    the DKW bound for the KS statistic, bootstrap intervals for PSI and the Jensen-Shannon distance.
+    `decision_confident` tells if the interval of the deciding statistic lies on one side of its threshold.
+
+    Returns:
+        dict: The report, updated in place.
+    """
+    rng = np.random.default_rng(random_state)
+    for column, column_report in report["columns"].items():
+        reference, current = reference_profile.columns[column], current_profile.columns[column]
+        if column_report["column_type"] == "num":
+            n_reference, n_current = int(np.sum(reference.counts)), int(np.sum(current.counts))
+            error = (dkw_error(n_reference, confidence_level) if reference_sampled else 0.0) \
+                + (dkw_error(n_current, confidence_level) if current_sampled else 0.0)
+            ks_interval = [max(0.0, column_report["ks_statistic"] - error), min(1.0, column_report["ks_statistic"] + error)]
+            effective_n = max(round(n_reference * n_current / max(n_reference + n_current, 1)), 1)
+            column_report["ks_statistic_interval"] = ks_interval
+            column_report["p_value_interval"] = [float(kstwo.sf(ks_interval[1], effective_n)),
+                                                 float(kstwo.sf(ks_interval[0], effective_n))]
+            column_report["psi_interval"] = bootstrap_interval(
+                population_stability_index, reference.counts, current.counts, reference_sampled, current_sampled,
+                confidence_level=confidence_level, n_resamples=n_resamples, rng=rng)
+            if column_report["stattest"] == "ks":
+                low, high = column_report["p_value_interval"]
+                threshold = p_value_threshold
+            else:
+                low, high = column_report["psi_interval"]
+                threshold = psi_threshold
+        else:
+            column_report["jensen_shannon_interval"] = bootstrap_interval(
+                jensen_shannon_distance, np.append(reference.counts, reference.other_count),
+                np.append(current.counts, current.other_count), reference_sampled, current_sampled,
+                confidence_level=confidence_level, n_resamples=n_resamples, rng=rng)
+            if column_report["stattest"] == "chisquare":
+                column_report["decision_confident"] = None
+                continue
+            low, high = column_report["jensen_shannon_interval"]
+            threshold = distance_threshold
+        column_report["decision_confident"] = bool(high < threshold or low >= threshold)
+    report["confidence_level"] = confidence_level
+    return report
@@ -6,8 +6,15 @@ import dill
 import yaml
 import numpy as np
 import sys
+import dataclasses
+import pandas as pd
+import scipy.sparse as sp
+from typing import Optional
 from pandas import DataFrame
+from pandas.api.types import union_categoricals
 
+from US_visa.entity import artifact_entity
+from US_visa.entity.schema import Schema, get_schema
 from US_visa.logger import logging
 from US_visa.exception import USVisaException
 
@@ -153,7 +160,163 @@ def save_numpy_array_data(filepath:str, array:np.array):
         raise USVisaException(e,sys) from e
 
 
+
+def save_feature_target_data(dirpath:str, features:object, target:np.array, dtype:Optional[str]=None)-> None:
+    """
+    Save a feature matrix and its labels as separate .npy arrays of one directory, so they can be
+    memory mapped back. A sparse feature matrix is stored as its CSR arrays, so it is never made dense.
+
+    Args:
+        dirpath (str): The directory of the arrays.
+        features (object): The feature matrix, a NumPy array or a SciPy sparse matrix.
+        target (np.array): The labels, one per row of features.
+        dtype (Optional[str]): Store the features with this dtype, e.g. float32. Defaults to their own.
+    """
+
+    try:
+        os.makedirs(dirpath, exist_ok=True)
+        if sp.issparse(features):
+            features = sp.csr_matrix(features)
+            data = features.data if dtype is None else features.data.astype(dtype, copy=False)
+            arrays = {"X_data": data, "X_indices": features.indices, "X_indptr": features.indptr,
+                      "X_shape": np.array(features.shape)}
+        else:
+            arrays = {"X": np.asarray(features, dtype=dtype)}
+        arrays["y"] = np.asarray(target)
+        logging.info(f"Saving features {features.shape} and target to {dirpath}")
+        for name, array in arrays.items():
+            with open(os.path.join(dirpath, f"{name}.npy"), mode='wb') as file:
+                np.save(file, np.ascontiguousarray(array), allow_pickle=False)
+
+    except Exception as e:
+        logging.error(f"Saving Array Error: {e}")
+        raise USVisaException(e,sys) from e
+
+
+
+def load_feature_target_data(dirpath:str, mmap_mode:Optional[str]=None)-> tuple:
+    """
+    Load a feature matrix and its labels saved by save_feature_target_data
+
+    Args:
+        dirpath (str): The directory of the arrays.
+        mmap_mode (Optional[str]): Memory map the arrays with this mode, e.g. 'r', instead of
+            reading them. Defaults to None.
+
+    Return:
+        tuple: The features, a CSR matrix when they were saved sparse, and the labels.
+    """
+
+    try:
+        logging.info(f"Loading the arrays of {dirpath}")
+
+        def load(name):
+            return np.load(os.path.join(dirpath, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+
+        if os.path.exists(os.path.join(dirpath, "X.npy")):
+            features = load("X")
+        else:
+            features = sp.csr_matrix((load("X_data"), load("X_indices"), load("X_indptr")),
+                                     shape=tuple(load("X_shape")), copy=False)
+        return features, load("y")
+
+    except Exception as e:
+        logging.error(f"Error loading object: {e}")
+        raise USVisaException(e,sys) from e
+
+
         
+def save_dataframe(filepath:str, df:DataFrame)-> None:
+    """
+    Save a DataFrame in the format given by the file extension (.parquet, .feather or .csv)
+
+    Args:
+        filepath (str): The path to the file where the DataFrame will be saved
+        df (DataFrame): The DataFrame which has to be saved
+    """
+
+    try:
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        file_format = os.path.splitext(filepath)[1]
+        logging.info(f"Saving DataFrame of shape {df.shape} to {filepath}")
+        if file_format == ".parquet":
+            df.to_parquet(filepath, index=False)
+        elif file_format == ".feather":
+            df.reset_index(drop=True).to_feather(filepath)
+        elif file_format == ".csv":
+            df.to_csv(filepath, index=False, header=True)
+        else:
+            raise Exception(f"Unsupported DataFrame file format: {file_format}")
+
+    except Exception as e:
+        logging.error(f"Saving DataFrame Error: {e}")
+        raise USVisaException(e,sys) from e
+
+
+
+def read_dataframe(filepath:str, columns:Optional[list]=None)-> DataFrame:
+    """
+    Read a DataFrame saved by save_dataframe
+
+    Args:
+        filepath (str): The path to the .parquet, .feather or .csv file
+        columns (Optional[list]): Only read these columns. Defaults to all columns
+
+    Return:
+        The DataFrame, with categorical and integer types preserved for the columnar formats
+    """
+
+    try:
+        file_format = os.path.splitext(filepath)[1]
+        logging.info(f"Reading DataFrame from {filepath}")
+        if file_format == ".parquet":
+            return pd.read_parquet(filepath, columns=columns)
+        if file_format == ".feather":
+            return pd.read_feather(filepath, columns=columns)
+        if file_format == ".csv":
+            return pd.read_csv(filepath, usecols=columns)
+        raise Exception(f"Unsupported DataFrame file format: {file_format}")
+
+    except Exception as e:
+        logging.error(f"Reading DataFrame Error: {e}")
+        raise USVisaException(e,sys) from e
+
+
+
+def read_dataframe_with_schema(filepath:str, schema:Optional[Schema]=None, columns:Optional[list]=None)-> DataFrame:
+    """
+    Read a DataFrame artifact and cast it to the compact types declared in schema.yaml
+
+    Categorical columns get the known category domains and integer columns the smallest width
+    holding their values, whatever format the file was saved in.
+
+    Args:
+        filepath (str): The path to the .parquet, .feather or .csv file
+        schema (Optional[Schema]): The schema. Defaults to get_schema()
+        columns (Optional[list]): Only read these columns. Defaults to all columns
+
+    Return:
+        The typed DataFrame
+    """
+
+    try:
+        if schema is None:
+            schema = get_schema()
+
+        df = read_dataframe(filepath=filepath, columns=columns)
+        memory_before = df.memory_usage(deep=True).sum()
+        df = cast_dataframe_to_schema(df=df, schema=schema)
+        memory_after = df.memory_usage(deep=True).sum()
+        logging.info(f"Loaded {filepath} with schema types: memory {memory_before / 1024 ** 2:.2f} MB "
+                     f"-> {memory_after / 1024 ** 2:.2f} MB")
+        return df
+
+    except Exception as e:
+        logging.error(f"Reading DataFrame with Schema Error: {e}")
+        raise USVisaException(e,sys) from e
+
+
+
 def drop_columns(df:DataFrame, cols:list)-> DataFrame:
     """
     Drop the List columns from Dataframe
@@ -173,4 +336,151 @@ def drop_columns(df:DataFrame, cols:list)-> DataFrame:
     
     except Exception as e:
         logging.error(f"Error Dropping Columns {e}")
-        raise USVisaException(e,sys) from e
\ No newline at end of file
+        raise USVisaException(e,sys) from e
+
+
+def cast_dataframe_to_schema(df:DataFrame, schema:Schema)-> DataFrame:
+    """
+    Cast the columns of a DataFrame to the types declared in the schema
+
+    Args:
+        df (DataFrame): The DataFrame whose columns have to be casted
+        schema (Schema): The schema. For the columns with a category domain, known categories come
+            first, in the declared order, and unseen values are kept as extra categories after them
+
+    Return:
+        The DataFrame with `category` columns as categoricals, `int` columns as the smallest integer
+        type holding their values and `float` columns as floats. Values are never coerced away: an
+        `int` column with nulls or fractions stays float and a numerical column with values that are
+        not numbers stays text, for the quality rules to report them
+    """
+
+    try:
+        for column, dtype in schema.columns.items():
+            if column not in df.columns:
+                continue
+            if dtype == "category":
+                category_dtype = schema.category_dtypes.get(column)
+                values = df[column]
+                if category_dtype is None:
+                    df[column] = values.astype("category")
+                    continue
+                if values.dtype == category_dtype:
+                    continue
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    observed = values.cat.categories
+                else:
+                    observed = pd.unique(values.dropna())
+                domain = schema.category_domain_sets[column]
+                extra_categories = sorted((value for value in observed if value not in domain), key=str)
+                if extra_categories:
+                    category_dtype = pd.CategoricalDtype(categories=list(category_dtype.categories) + extra_categories)
+                df[column] = values.astype(category_dtype)
+            else:
+                values = pd.to_numeric(df[column], errors="coerce")
+                n_invalid = int((values.isna() & df[column].notna()).sum())
+                if n_invalid:
+                    # the raw values are kept, as text, for the dtype quality rule to report them
+                    logging.warning(f"{n_invalid} values of {column} are not numbers, the column is kept as text")
+                    df[column] = df[column].astype("string")
+                    continue
+                if dtype == "int" and not values.isna().any() and (values == np.floor(values)).all():
+                    values = pd.to_numeric(values.astype(np.int64), downcast="integer")
+                df[column] = values
+        return df
+
+    except Exception as e:
+        logging.error(f"Error Casting DataFrame to Schema {e}")
+        raise USVisaException(e,sys) from e
+
+
+
+def concat_dataframe_chunks(chunks:list)-> DataFrame:
+    """
+    Concatenate DataFrame chunks while keeping categorical columns categorical and text columns text
+
+    Args:
+        chunks (list): DataFrames in the order they have to be stacked. A column categorical in any
+            chunk is categorical in the result, missing rows of the chunks without it are NaN
+
+    Return:
+        The concatenated DataFrame
+    """
+
+    try:
+        chunks = [chunk for chunk in chunks if len(chunk.columns) > 0]
+        if len(chunks) == 0:
+            return DataFrame()
+        if len(chunks) == 1:
+            return chunks[0].reset_index(drop=True)
+
+        categorical_columns = list(dict.fromkeys(column for chunk in chunks for column, dtype in chunk.dtypes.items()
+                                                 if isinstance(dtype, pd.CategoricalDtype)))
+        for column in categorical_columns:
+            # a chunk may hold the column as object, e.g. when all its values were missing, or not at all
+            for chunk in chunks:
+                if column in chunk.columns and not isinstance(chunk[column].dtype, pd.CategoricalDtype):
+                    chunk[column] = chunk[column].astype("category")
+            categories = union_categoricals([chunk[column] for chunk in chunks if column in chunk.columns]).categories
+            for chunk in chunks:
+                if column in chunk.columns:
+                    chunk[column] = chunk[column].cat.set_categories(categories)
+                else:
+                    chunk[column] = pd.Categorical([None] * len(chunk), categories=categories)
+
+        # cast_dataframe_to_schema keeps a numerical column as text in the chunks holding values that
+        # are not numbers, mixed with the float chunks it would become an object column
+        string_columns = set(column for chunk in chunks for column, dtype in chunk.dtypes.items()
+                             if isinstance(dtype, pd.StringDtype))
+        for column in string_columns:
+            for chunk in chunks:
+                if column in chunk.columns and not isinstance(chunk[column].dtype, pd.StringDtype):
+                    chunk[column] = chunk[column].astype("string")
+
+        return pd.concat(chunks, ignore_index=True)
+
+    except Exception as e:
+        logging.error(f"Error Concatenating DataFrame chunks {e}")
+        raise USVisaException(e,sys) from e
+
+
+
+
+def artifact_to_dict(artifact:object)-> dict:
+    """
+    Convert an artifact dataclass into plain python types that can be written to YAML
+
+    Args:
+        artifact (object): An instance of a dataclass from US_visa.entity.artifact_entity
+
+    Return:
+        dict: {"artifact_class": class name, "fields": field values}, nested artifacts are converted too
+    """
+
+    def to_builtin(value):
+        if dataclasses.is_dataclass(value):
+            return artifact_to_dict(value)
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    return {"artifact_class": type(artifact).__name__,
+            "fields": {field.name: to_builtin(getattr(artifact, field.name)) for field in dataclasses.fields(artifact)}}
+
+
+
+def artifact_from_dict(content:dict)-> object:
+    """
+    Rebuild an artifact dataclass converted by artifact_to_dict
+
+    Args:
+        content (dict): The output of artifact_to_dict
+
+    Return:
+        The artifact dataclass instance
+    """
+
+    artifact_class = getattr(artifact_entity, content["artifact_class"])
+    fields = {name: artifact_from_dict(value) if isinstance(value, dict) and "artifact_class" in value else value
+              for name, value in content["fields"].items()}
+    return artifact_class(**fields)
@@ -0,0 +1,491 @@
+## -*- Code : Utf -*-
+
+"""
+Model selection over the candidates of config/model.yaml on a bounded process pool.
+
+Every (module, parameter set, fold) fit is an independent task, so the folds, the grid points and
+the modules all run concurrently within one CPU budget, instead of one GridSearchCV per module
+after the other. The folds are split once per run, and the training and held out rows of every
+fold are written once as .npy files that are memory mapped, so every fit of a fold reads the same
+pages instead of copying its rows out of the training set. A task of the process pool only carries
+the estimator, its parameters and the number of its fold, while a search in this process maps the
+folds once and keeps them for all its fits. Which parameter sets are cross-validated, and on how
+much of the data, is up to the search strategy of US_visa.utils.search_strategies.
+
+With a CVResultCache, the results of earlier runs on the same training data and folds are reused.
+The parameter sets of an estimator with warm_start that only differ by n_estimators, such as the
+3, 5 and 9 trees of the RandomForest grid, are fitted as one growing ensemble per fold.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import warnings
+import importlib
+from concurrent.futures import as_completed
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import check_cv
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+from US_visa.utils.main_utils import read_yaml_file, save_feature_target_data, load_feature_target_data
+from US_visa.utils.parallel_utils import get_executor
+from US_visa.utils.cv_result_cache import CVResultCache, fingerprint_cv_spec, get_result_key, is_deterministic
+from US_visa.utils.search_strategies import SearchBudget, get_search_strategy
+
+
+@dataclass
+class ModelCandidate:
+    """
+    A module of model.yaml: the estimator with its fixed params and the grid searched over.
+    """
+    model_serial_number :str
+    model_name :str
+    estimator :object
+    param_grid :dict = field(default_factory=dict)
+
+
+@dataclass
+class CVResult:
+    """
+    The cross-validated score of one parameter set of a candidate, fitted on n_samples training
+    rows of every fold, all of them when None.
+    """
+    model_serial_number :str
+    params :dict
+    fold_scores :list
+    fit_time :float
+    n_samples :Optional[int] = None
+
+    @property
+    def mean_score(self) -> float:
+        return float(np.mean(self.fold_scores))
+
+
+@dataclass
+class SearchContext:
+    """
+    The data a search cross-validates on: the folds, the materialized rows of every fold, and a
+    random order of the training rows of every fold, whose first n_samples rows are the subsample
+    of a job on fewer rows.
+
+    The fold rows are read from fold_data in this process, or from data_dir in the workers.
+    """
+    folds :list
+    fold_orders :list
+    fold_data :Optional["FoldRows"] = None
+    data_dir :Optional[str] = None
+    cache_fingerprint :Optional[str] = None
+    cached_results :dict = field(default_factory=dict)
+
+    @property
+    def n_train_rows(self) -> int:
+        return min(len(train_index) for train_index, _ in self.folds)
+
+    def get_sample_index(self, fold_index: int, n_samples: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        The positions of a subsample of n_samples rows within the training rows of a fold, None for
+        all of them.
+        """
+        if n_samples is None or n_samples >= len(self.folds[fold_index][0]):
+            return None
+        return np.sort(self.fold_orders[fold_index][:n_samples])
+
+
+@dataclass
+class BestModel:
+    """
+    The selected model, refitted on the whole training set, and the cross-validation results.
+    """
+    model_serial_number :str
+    model :object
+    best_model :object
+    best_parameters :dict
+    best_score :float
+    cv_results :list = field(default_factory=list)
+
+
+def set_n_jobs(estimator, n_jobs: Optional[int]):
+    """
+    Sets the n_jobs of an estimator that has one, so a fit running next to other fits does not
+    start its own threads or processes on top of the CPU budget.
+    """
+    if "n_jobs" in estimator.get_params():
+        estimator.set_params(n_jobs=n_jobs)
+    return estimator
+
+
+def get_fold_dir(data_dir: str, fold_index: int, subset: str) -> str:
+    return os.path.join(data_dir, f"fold_{fold_index}", subset)
+
+
+def materialize_folds(X, y: np.ndarray, folds: list, data_dir: str) -> None:
+    """
+    Writes the training and held out rows of every fold once, as .npy files in data_dir/fold_i/train
+    and data_dir/fold_i/test to be memory mapped.
+
+    Args:
+        X: The training features, a NumPy array or a CSR matrix.
+        y (np.ndarray): The training labels.
+        folds (list): The (train_index, test_index) pairs.
+        data_dir (str): The directory of the fold files.
+    """
+    for fold_index, (train_index, test_index) in enumerate(folds):
+        for subset, index in (("train", train_index), ("test", test_index)):
+            save_feature_target_data(dirpath=get_fold_dir(data_dir, fold_index, subset), features=X[index],
+                                     target=y[index])
+
+
+def load_fold(data_dir: str, fold_index: int) -> tuple:
+    """
+    Memory maps the (X_train, y_train, X_test, y_test) files of a fold written by materialize_folds.
+    """
+    X_train, y_train = load_feature_target_data(dirpath=get_fold_dir(data_dir, fold_index, "train"), mmap_mode="r")
+    X_test, y_test = load_feature_target_data(dirpath=get_fold_dir(data_dir, fold_index, "test"), mmap_mode="r")
+    return X_train, y_train, X_test, y_test
+
+
+def narrow_fold(fold: tuple, sample_index: Optional[np.ndarray] = None) -> tuple:
+    X_train, y_train, X_test, y_test = fold
+    if sample_index is not None:
+        X_train, y_train = X_train[sample_index], y_train[sample_index]
+    return X_train, y_train, X_test, y_test
+
+
+@dataclass
+class FoldRows:
+    """
+    The fold files of materialize_folds mapped once in this process, so every fit of a fold shares
+    one mapping instead of copying the rows of the fold out of the training set.
+    """
+    folds :list
+
+    @staticmethod
+    def load(data_dir: str, n_folds: int) -> "FoldRows":
+        return FoldRows(folds=[load_fold(data_dir, fold_index) for fold_index in range(n_folds)])
+
+    def get_fold(self, fold_index: int, sample_index: Optional[np.ndarray] = None) -> tuple:
+        return narrow_fold(self.folds[fold_index], sample_index)
+
+
+def get_fold(fold_index: int, sample_index: Optional[np.ndarray] = None, data_dir: Optional[str] = None,
+             fold_data: Optional[FoldRows] = None) -> tuple:
+    """
+    The (X_train, y_train, X_test, y_test) rows of a fold, the training rows narrowed to sample_index.
+
+    In a worker the fold files are memory mapped for the task only: a mapping kept for the life of
+    the worker would hold on to the files, and their disk space, after the model selection removed
+    them. Mapping a fold again only reads the .npy headers, the pages stay in the page cache.
+    """
+    if fold_data is not None:
+        return fold_data.get_fold(fold_index, sample_index)
+    return narrow_fold(load_fold(data_dir, fold_index), sample_index)
+
+
+def fit_and_score(estimator, params: dict, fold_index: int, sample_index: Optional[np.ndarray] = None,
+                  data_dir: Optional[str] = None, fold_data: Optional[FoldRows] = None,
+                  scoring: Optional[str] = None) -> tuple:
+    """
+    Fits a clone of the estimator with params on one fold and scores it on the held out rows.
+
+    Args:
+        estimator: The unfitted estimator.
+        params (dict): The parameters set on the clone.
+        fold_index (int): The fold fitted and scored on.
+        sample_index (Optional[np.ndarray]): The training rows of the fold fitted on, None for all of them.
+        data_dir (Optional[str]): The directory of the memory mapped fold rows, in a worker.
+        fold_data (Optional[FoldRows]): The training set and its folds, in the calling process.
+        scoring (Optional[str]): A scikit-learn scorer name. Defaults to the score method of the estimator.
+
+    Returns:
+        tuple: The score and the fit time in seconds.
+    """
+    X_train, y_train, X_test, y_test = get_fold(fold_index, sample_index, data_dir=data_dir, fold_data=fold_data)
+    model = clone(estimator).set_params(**params)
+    start_time = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_time = time.perf_counter() - start_time
+    if scoring is None:
+        score = model.score(X_test, y_test)
+    else:
+        score = get_scorer(scoring)(model, X_test, y_test)
+    return float(score), fit_time
+
+
+def fit_and_score_warm_start(estimator, params: dict, n_estimators_path: list, fold_index: int,
+                             sample_index: Optional[np.ndarray] = None, data_dir: Optional[str] = None,
+                             fold_data: Optional[FoldRows] = None, scoring: Optional[str] = None) -> list:
+    """
+    Grows one warm started ensemble through n_estimators_path on a fold, scoring it at every size,
+    instead of fitting an ensemble from scratch per size. With a fixed random_state the seeds of the
+    trees do not depend on how the ensemble was grown, so the scores are those of separate fits.
+
+    Args:
+        n_estimators_path (list): The increasing ensemble sizes.
+        The other arguments are those of fit_and_score.
+
+    Returns:
+        list: The score and the fit time up to every size, in the order of n_estimators_path.
+    """
+    X_train, y_train, X_test, y_test = get_fold(fold_index, sample_index, data_dir=data_dir, fold_data=fold_data)
+    model = clone(estimator).set_params(**params, warm_start=True)
+    scorer = None if scoring is None else get_scorer(scoring)
+    results, fit_time = [], 0.0
+    with warnings.catch_warnings():
+        # every size is fitted on the same rows, which the class_weight presets warning is about
+        warnings.filterwarnings("ignore", message=".*class_weight presets.*")
+        for n_estimators in n_estimators_path:
+            model.set_params(n_estimators=n_estimators)
+            start_time = time.perf_counter()
+            model.fit(X_train, y_train)
+            fit_time += time.perf_counter() - start_time
+            if scorer is None:
+                score = model.score(X_test, y_test)
+            else:
+                score = scorer(model, X_test, y_test)
+            results.append((float(score), fit_time))
+    return results
+
+
+def get_warm_start_groups(jobs: list) -> list:
+    """
+    Groups the jobs that only differ by n_estimators for an estimator with warm_start.
+
+    Returns:
+        list: (job indices, n_estimators path) pairs, the path being None for a job fitted on its own.
+    """
+    groups, singles = {}, []
+    for job_index, (candidate, params, n_samples) in enumerate(jobs):
+        estimator_params = candidate.estimator.get_params()
+        if "warm_start" not in estimator_params or "n_estimators" not in params:
+            singles.append(([job_index], None))
+            continue
+        other_params = repr(sorted((name, value) for name, value in params.items() if name != "n_estimators"))
+        groups.setdefault((candidate.model_serial_number, n_samples, other_params), []).append(job_index)
+
+    for job_indices in groups.values():
+        job_indices = sorted(job_indices, key=lambda job_index: jobs[job_index][1]["n_estimators"])
+        path = [jobs[job_index][1]["n_estimators"] for job_index in job_indices]
+        if len(job_indices) == 1 or len(set(path)) < len(path):
+            singles.extend(([job_index], None) for job_index in job_indices)
+        else:
+            singles.append((job_indices, path))
+    return singles
+
+
+class ModelSelection:
+    """
+    Selects the best model of config/model.yaml by cross-validation.
+
+    The `grid_search.params` of the config give the number of folds (`cv`), the optional `scoring`
+    and `verbose`. The `model_selection` modules give the candidates, as for neuro_mf.
+
+    Attributes:
+        model_config (dict): The parsed model.yaml.
+        max_workers (int): The CPU budget: the number of concurrent fits, 1 runs them in this process.
+        cv_cache (Optional[CVResultCache]): The cache of the results of earlier runs, None disables it.
+    """
+
+    def __init__(self, model_config_path: str, max_workers: Optional[int] = None,
+                 cv_cache: Optional[CVResultCache] = None):
+        try:
+            self.model_config = read_yaml_file(filepath=model_config_path)
+            self.search_params = dict(self.model_config.get("grid_search", {}).get("params") or {})
+            self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+            self.cv_cache = cv_cache
+
+        except Exception as e:
+            logging.error(f"Error reading the model config {model_config_path}: {e}")
+            raise USVisaException(e, sys) from e
+
+    def get_candidates(self, class_weight: Optional[str] = None) -> list:
+        """
+        Instantiates the estimators of the model_selection modules with their fixed params.
+
+        The estimators with a random_state left to None get the `random_state` of the search strategy,
+        so their scores do not change from one run, or one CPU budget, to the next.
+
+        Args:
+            class_weight (Optional[str]): Set as the class_weight of the estimators that have one.
+
+        Returns:
+            list: The ModelCandidate of every module, in the config order.
+        """
+        candidates = []
+        random_state = (self.model_config.get("search_strategy") or {}).get("random_state")
+        for model_serial_number, module_config in self.model_config["model_selection"].items():
+            estimator_class = getattr(importlib.import_module(module_config["module"]), module_config["class"])
+            estimator = estimator_class(**dict(module_config.get("params") or {}))
+            if random_state is not None and estimator.get_params().get("random_state", random_state) is None:
+                estimator.set_params(random_state=random_state)
+            if class_weight is not None and "class_weight" in estimator.get_params():
+                estimator.set_params(class_weight=class_weight)
+                logging.info(f"Training {module_config['class']} with class_weight={class_weight}")
+            candidates.append(ModelCandidate(model_serial_number=model_serial_number,
+                                             model_name=f"{module_config['module']}.{module_config['class']}",
+                                             estimator=estimator,
+                                             param_grid=dict(module_config.get("search_param_grid") or {})))
+        return candidates
+
+    def evaluate(self, jobs: list, context: SearchContext) -> list:
+        """
+        Cross-validates parameter sets, every fold of every set being one task of the pool.
+
+        Args:
+            jobs (list): (ModelCandidate, params, n_samples) tuples, n_samples being the training rows
+                of every fold to fit on, None for all of them.
+            context (SearchContext): The data and folds. Without a data_dir the tasks run in this process.
+
+        Returns:
+            list: The CVResult of every job, in the order of jobs.
+        """
+        scoring = self.search_params.get("scoring")
+        n_folds = len(context.folds)
+        fold_results = [[None] * n_folds for _ in jobs]
+        result_keys = [get_result_key(candidate.estimator, params, n_samples) for candidate, params, n_samples in jobs]
+        cached = [context.cached_results.get(key) for key in result_keys]
+        pending = [job_index for job_index, entry in enumerate(cached) if entry is None]
+        if len(pending) < len(jobs):
+            logging.info(f"{len(jobs) - len(pending)} of {len(jobs)} parameter sets from the cross-validation cache")
+
+        tasks = [([pending[index] for index in job_indices], path)
+                 for job_indices, path in get_warm_start_groups([jobs[job_index] for job_index in pending])]
+        executor = get_executor(self.max_workers) if context.data_dir is not None else None
+        futures = {}
+        for job_indices, path in tasks:
+            candidate, params, n_samples = jobs[job_indices[0]]
+            estimator = candidate.estimator
+            if executor is not None:
+                # the fits share the CPU budget, a fit does not start threads of its own
+                estimator = set_n_jobs(clone(estimator), 1)
+            if path is not None:
+                params = {name: value for name, value in params.items() if name != "n_estimators"}
+            for fold_index in range(n_folds):
+                sample_index = context.get_sample_index(fold_index, n_samples)
+                if path is None:
+                    function, args = fit_and_score, (estimator, params, fold_index, sample_index)
+                else:
+                    function, args = fit_and_score_warm_start, (estimator, params, path, fold_index, sample_index)
+                if executor is None:
+                    task_result = function(*args, fold_data=context.fold_data, scoring=scoring)
+                    self.set_fold_results(fold_results, job_indices, fold_index, task_result, path)
+                else:
+                    future = executor.submit(function, *args, data_dir=context.data_dir, scoring=scoring)
+                    futures[future] = (job_indices, fold_index, path)
+        for future in as_completed(futures):
+            job_indices, fold_index, path = futures[future]
+            self.set_fold_results(fold_results, job_indices, fold_index, future.result(), path)
+
+        new_entries = {}
+        for job_index, entry in enumerate(cached):
+            if entry is not None:
+                fold_results[job_index] = list(zip(entry["fold_scores"], [entry["fit_time"] / n_folds] * n_folds))
+            elif is_deterministic(jobs[job_index][0].estimator, jobs[job_index][1]):
+                new_entries[result_keys[job_index]] = {
+                    "fold_scores": [score for score, _ in fold_results[job_index]],
+                    "fit_time": sum(fit_time for _, fit_time in fold_results[job_index])}
+        if self.cv_cache is not None and context.cache_fingerprint is not None:
+            context.cached_results.update(new_entries)
+            self.cv_cache.store(context.cache_fingerprint, new_entries)
+
+        results = []
+        for (candidate, params, n_samples), job_results in zip(jobs, fold_results):
+            result = CVResult(model_serial_number=candidate.model_serial_number, params=params,
+                              fold_scores=[score for score, _ in job_results],
+                              fit_time=sum(fit_time for _, fit_time in job_results),
+                              n_samples=n_samples)
+            if self.search_params.get("verbose"):
+                rows = "all" if n_samples is None else n_samples
+                logging.info(f"[{candidate.model_name}] {params} rows={rows} score={result.mean_score:.4f} "
+                             f"folds={[round(score, 4) for score in result.fold_scores]} fit_time={result.fit_time:.2f}s")
+            results.append(result)
+        return results
+
+    @staticmethod
+    def set_fold_results(fold_results: list, job_indices: list, fold_index: int, task_result, path: Optional[list]):
+        task_results = [task_result] if path is None else task_result
+        for job_index, job_result in zip(job_indices, task_results):
+            fold_results[job_index][fold_index] = job_result
+
+    def get_best_model(self, X, y, base_accuracy: float = 0.6, class_weight: Optional[str] = None) -> BestModel:
+        """
+        Searches the parameters of every candidate with the search strategy of model.yaml and
+        refits the best one on X, y.
+
+        The best model is the first of the highest score above base_accuracy among the parameter
+        sets cross-validated on all the training rows and trees, successive halving scoring the
+        others on a part of them only.
+
+        Args:
+            X: The training features, a NumPy array or a CSR matrix.
+            y: The training labels.
+            base_accuracy (float): The score the best model has to exceed. Defaults to 0.6.
+            class_weight (Optional[str]): Set as the class_weight of the estimators that have one.
+
+        Returns:
+            BestModel: The refitted best model, its parameters and cross-validated score.
+        """
+        data_dir = None
+        try:
+            candidates = self.get_candidates(class_weight=class_weight)
+            y = np.asarray(y)
+            cv = check_cv(self.search_params.get("cv", 5), y, classifier=True)
+            folds = list(cv.split(np.zeros((len(y), 1)), y))
+            strategy_config = dict(self.model_config.get("search_strategy") or {})
+            strategy = get_search_strategy(strategy_config)
+            budget = SearchBudget(max_evaluations=strategy_config.get("max_evaluations"),
+                                  max_seconds=strategy_config.get("max_seconds"))
+            rng = np.random.RandomState(strategy_config.get("random_state"))
+            fold_orders = [rng.permutation(len(train_index)) for train_index, _ in folds]
+            logging.info(f"Searching {len(candidates)} models with {type(strategy).__name__} on {len(folds)} folds, "
+                         f"{self.max_workers} fits at a time")
+
+            data_dir = tempfile.mkdtemp(prefix="model_selection_")
+            materialize_folds(X, y, folds, data_dir=data_dir)
+            if self.max_workers > 1:
+                context = SearchContext(folds=folds, fold_orders=fold_orders, data_dir=data_dir)
+            else:
+                context = SearchContext(folds=folds, fold_orders=fold_orders,
+                                        fold_data=FoldRows.load(data_dir, n_folds=len(folds)))
+            if self.cv_cache is not None:
+                context.cache_fingerprint = fingerprint_cv_spec(X, y, folds, fold_orders,
+                                                                scoring=self.search_params.get("scoring"))
+                context.cached_results = self.cv_cache.load(context.cache_fingerprint)
+            results = strategy.search(self, candidates, context, budget)
+            logging.info(f"Cross-validated {budget.n_evaluations} parameter sets in "
+                         f"{time.perf_counter() - budget.start_time:.1f}s")
+
+            full_results = [result for result in results if result.n_samples is None] or results
+            best_result = None
+            for result in full_results:
+                if result.mean_score > base_accuracy:
+                    base_accuracy = result.mean_score
+                    best_result = result
+            if best_result is None:
+                raise Exception(f"None of Model has base accuracy: {base_accuracy}")
+
+            candidate = next(candidate for candidate in candidates
+                             if candidate.model_serial_number == best_result.model_serial_number)
+            best_parameters = best_result.params
+            # the refit alone uses the whole budget, the saved model keeps the n_jobs of the config
+            best_model = set_n_jobs(clone(candidate.estimator).set_params(**best_parameters), self.max_workers)
+            best_model.fit(X, y)
+            set_n_jobs(best_model, candidate.estimator.get_params().get("n_jobs"))
+            logging.info(f"Best model: {candidate.model_name} {best_parameters} score={best_result.mean_score:.4f}")
+            return BestModel(model_serial_number=candidate.model_serial_number, model=candidate.estimator,
+                             best_model=best_model, best_parameters=best_parameters,
+                             best_score=best_result.mean_score, cv_results=results)
+
+        except Exception as e:
+            logging.error(f"Error during model selection: {e}")
+            raise USVisaException(e, sys) from e
+        finally:
+            if data_dir is not None:
+                shutil.rmtree(data_dir, ignore_errors=True)
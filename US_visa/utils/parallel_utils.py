@@ -0,0 +1,188 @@
+## -*- Code : Utf -*-
+
+"""
+Runs per-column work on a process pool without pickling the columns.
+
+The columns are copied once into POSIX shared memory, categorical columns as their codes, and the
+tasks only carry a small descriptor. The workers map the shared block as a NumPy array and rebuild
+the Series around it, so a column is never serialized whatever the number of tasks reading it.
+"""
+
+import os
+import sys
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+from pandas import Series
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+
+
+@dataclass
+class SharedColumn:
+    """
+    Describes a column copied into shared memory. `categories` is set for categorical columns,
+    whose codes are shared.
+    """
+    shm_name :str
+    dtype :str
+    length :int
+    name :str
+    categories :Optional[pd.Index] = None
+    ordered :bool = False
+
+
+def share_column(series: Series) -> tuple:
+    """
+    Copies a column into a new shared memory block.
+
+    Args:
+        series (Series): The column. Numerical columns are shared as they are, any other column as
+            categorical codes.
+
+    Returns:
+        tuple: The SharedMemory block, to close and unlink once done, and the SharedColumn describing it.
+    """
+    categories, ordered = None, False
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_extension_array_dtype(series.dtype):
+        values = series.to_numpy()
+    else:
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype("category")
+        values = series.cat.codes.to_numpy()
+        categories, ordered = series.cat.categories, bool(series.cat.ordered)
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+    return shm, SharedColumn(shm_name=shm.name, dtype=values.dtype.str, length=len(values), name=series.name,
+                             categories=categories, ordered=ordered)
+
+
+def attach_column(shared_column: SharedColumn) -> tuple:
+    """
+    Maps a shared column without copying its values.
+
+    Returns:
+        tuple: The SharedMemory block, to close once the Series is no longer used, and the Series.
+    """
+    shm = shared_memory.SharedMemory(name=shared_column.shm_name)
+    values = np.ndarray((shared_column.length,), dtype=np.dtype(shared_column.dtype), buffer=shm.buf)
+    if shared_column.categories is not None:
+        # the codes were taken from a valid categorical, checking them again would scan the column
+        values = pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(shared_column.categories,
+                                                                            ordered=shared_column.ordered),
+                                           validate=False)
+    return shm, Series(values, name=shared_column.name, copy=False)
+
+
+def run_shared_column_task(function: Callable, shared_columns: list, kwargs: dict):
+    """
+    Runs function(*columns, **kwargs) in a worker on the columns mapped from shared memory.
+    """
+    attached = [attach_column(shared_column) for shared_column in shared_columns]
+    blocks = [shm for shm, _ in attached]
+    try:
+        return function(*[series for _, series in attached], **kwargs)
+    finally:
+        # the Series must be released before their blocks are closed
+        del attached
+        for shm in blocks:
+            shm.close()
+
+
+"Modules imported once by the fork server, so that the workers forked from it start warm"
+FORKSERVER_PRELOAD :list= ["numpy", "pandas", "scipy.stats", "US_visa.utils.parallel_utils",
+                            "US_visa.utils.model_selection"]
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_process_context():
+    """
+    The start method of the pools. Workers are forked from a clean server process where the platform
+    has one, since forking the pipeline itself would copy the locks held by its other threads.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(FORKSERVER_PRELOAD)
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def get_executor(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the process pool of max_workers workers, started on first use and then kept for the
+    life of the process, so the workers import the libraries once and not on every call.
+    """
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None or getattr(executor, "_broken", False):
+            executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=get_process_context())
+            _executors[max_workers] = executor
+        return executor
+
+
+def map_columns(function: Callable, frames: list, columns: list, max_workers: int = 1,
+                column_kwargs: Optional[dict] = None, **kwargs) -> dict:
+    """
+    Calls function(frame_1[column], ..., frame_n[column], **kwargs) for every column.
+
+    With max_workers above 1 the calls run on the process pool of get_executor over the columns shared
+    once in shared memory, function must then be importable from the workers. The columns of the frames
+    are read as they are, so function sees the same Series either way.
+
+    Args:
+        function (Callable): The per-column function.
+        frames (list): The DataFrames holding the columns.
+        columns (list): The columns to process, present in every frame.
+        max_workers (int): The number of worker processes, 1 runs the calls in this process. Defaults to 1.
+        column_kwargs (Optional[dict]): Column to extra keyword arguments of its call. Defaults to None.
+
+    Returns:
+        dict: Column to the result of its call, in the order of columns.
+    """
+    column_kwargs = column_kwargs or {}
+    if max_workers <= 1 or len(columns) <= 1:
+        return {column: function(*[frame[column] for frame in frames], **kwargs, **column_kwargs.get(column, {}))
+                for column in columns}
+
+    blocks = []
+    try:
+        shared = {}
+        for column in columns:
+            shared[column] = []
+            for frame in frames:
+                shm, shared_column = share_column(frame[column])
+                blocks.append(shm)
+                shared[column].append(shared_column)
+
+        executor = get_executor(max_workers)
+        futures = {column: executor.submit(run_shared_column_task, function, shared[column],
+                                           {**kwargs, **column_kwargs.get(column, {})})
+                   for column in columns}
+        return {column: future.result() for column, future in futures.items()}
+
+    except Exception as e:
+        logging.error(f"Error running the per-column tasks of {getattr(function, '__name__', function)}: {e}")
+        raise USVisaException(e, sys) from e
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def resolve_max_workers(max_workers: Optional[int], n_rows: int, min_rows: int) -> int:
+    """
+    The number of worker processes for per-column work on n_rows rows: 1 below min_rows, where
+    starting the pool costs more than it saves, else max_workers or the number of CPUs.
+    """
+    if n_rows < min_rows:
+        return 1
+    return max(1, max_workers or os.cpu_count() or 1)
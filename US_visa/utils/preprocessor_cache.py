@@ -0,0 +1,167 @@
+## -*- Code : Utf -*-
+
+"""
+A disk cache of fitted preprocessors and the training features they produced.
+
+An entry is keyed by a fingerprint of the training rows and of the transformer configuration, so
+a run whose training split did not change loads the fitted ColumnTransformer, including the
+Yeo-Johnson lambdas of its PowerTransformer, instead of fitting it again. The entries live in
+`<cache_dir>/<fingerprint>/` and the least recently used ones are evicted to keep the directory
+under a disk quota.
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import sklearn
+from pandas import DataFrame, Series
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+from US_visa.utils.main_utils import save_object, load_object, save_feature_target_data, load_feature_target_data
+
+
+PREPROCESSOR_FILE_NAME :str= "preprocessor.pkl"
+FEATURES_DIR_NAME :str= "train"
+
+
+def fingerprint_training_data(features: DataFrame, target: Series, transformer_config: dict) -> str:
+    """
+    Fingerprints the training rows fed to a preprocessor and its configuration.
+
+    Args:
+        features (DataFrame): The input features of the training split.
+        target (Series): The mapped target of the training split.
+        transformer_config (dict): Everything that changes the fitted object or the stored features,
+            e.g. the column groups, the preprocessor parameters and the feature dtype.
+
+    Returns:
+        str: The hex sha256 fingerprint.
+    """
+    try:
+        digest = hashlib.sha256()
+        digest.update(json.dumps({"columns": [str(column) for column in features.columns],
+                                  "dtypes": [str(dtype) for dtype in features.dtypes],
+                                  "sklearn": sklearn.__version__,
+                                  "transformer_config": transformer_config},
+                                 sort_keys=True, default=str).encode("utf-8"))
+        # a vectorized hash of every row, so the fingerprint does not depend on the file format
+        digest.update(pd.util.hash_pandas_object(features, index=False).to_numpy().tobytes())
+        digest.update(pd.util.hash_pandas_object(target, index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    except Exception as e:
+        logging.error(f"Error fingerprinting the training data: {e}")
+        raise USVisaException(e, sys) from e
+
+
+class PreprocessorCache:
+    """
+    A disk cache of fitted preprocessors and their transformed training features.
+
+    Attributes:
+        cache_dir (str): The directory holding one subdirectory per entry.
+        max_bytes (int): The disk quota of the cache directory.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def get_entry_dir(self, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, fingerprint)
+
+    def lookup(self, fingerprint: str) -> Optional[tuple]:
+        """
+        Loads a cached entry.
+
+        Args:
+            fingerprint (str): The fingerprint of fingerprint_training_data.
+
+        Returns:
+            Optional[tuple]: The fitted preprocessor, the transformed training features and their
+                target, or None on a miss.
+        """
+        try:
+            entry_dir = self.get_entry_dir(fingerprint)
+            if not os.path.isdir(entry_dir):
+                return None
+            preprocessor = load_object(filepath=os.path.join(entry_dir, PREPROCESSOR_FILE_NAME))
+            features, target = load_feature_target_data(dirpath=os.path.join(entry_dir, FEATURES_DIR_NAME))
+            # the modification time of the entry records its last use for the eviction
+            os.utime(entry_dir)
+            logging.info(f"Preprocessor cache hit {fingerprint[:12]}")
+            return preprocessor, features, target
+
+        except Exception as e:
+            logging.error(f"Error reading the preprocessor cache entry {fingerprint[:12]}: {e}")
+            raise USVisaException(e, sys) from e
+
+    def store(self, fingerprint: str, preprocessor: object, features: object, target: np.ndarray) -> None:
+        """
+        Stores a fitted preprocessor and its transformed training features, then evicts the least
+        recently used entries over the quota.
+
+        The entry is written to a temporary directory first and renamed into place, so a concurrent
+        run never reads a partial entry.
+        """
+        try:
+            entry_dir = self.get_entry_dir(fingerprint)
+            if os.path.isdir(entry_dir):
+                return
+            tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+            save_object(filepath=os.path.join(tmp_dir, PREPROCESSOR_FILE_NAME), obj=preprocessor)
+            save_feature_target_data(dirpath=os.path.join(tmp_dir, FEATURES_DIR_NAME), features=features, target=target)
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                # another run stored the same entry meanwhile
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            logging.info(f"Stored preprocessor cache entry {fingerprint[:12]}")
+            self.evict()
+
+        except Exception as e:
+            logging.error(f"Error writing the preprocessor cache entry {fingerprint[:12]}: {e}")
+            raise USVisaException(e, sys) from e
+
+    @staticmethod
+    def get_dir_size(dirpath: str) -> int:
+        return sum(os.path.getsize(os.path.join(root, file_name))
+                   for root, _, file_names in os.walk(dirpath) for file_name in file_names)
+
+    def evict(self) -> list:
+        """
+        Removes the least recently used entries until the cache fits in max_bytes. An entry larger
+        than the quota on its own is removed as well.
+
+        Returns:
+            list: The evicted fingerprints.
+        """
+        try:
+            entries = []
+            for fingerprint in os.listdir(self.cache_dir):
+                entry_dir = self.get_entry_dir(fingerprint)
+                if os.path.isdir(entry_dir) and not fingerprint.endswith(".tmp"):
+                    entries.append((os.path.getmtime(entry_dir), fingerprint, self.get_dir_size(entry_dir)))
+
+            total_bytes = sum(size for _, _, size in entries)
+            evicted = []
+            for _, fingerprint, size in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                shutil.rmtree(self.get_entry_dir(fingerprint), ignore_errors=True)
+                total_bytes -= size
+                evicted.append(fingerprint)
+            if evicted:
+                logging.info(f"Evicted {len(evicted)} preprocessor cache entries, {total_bytes} bytes left")
+            return evicted
+
+        except Exception as e:
+            logging.error(f"Error evicting preprocessor cache entries: {e}")
+            raise USVisaException(e, sys) from e
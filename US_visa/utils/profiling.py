@@ -0,0 +1,182 @@
+## -*- Code : Utf -*-
+
+"""
+Timing and resource instrumentation of the training pipeline steps.
+
+Wrap a step in `profile_step` to record its wall time, CPU time, peak RSS and throughput
+into the process-wide `metrics_recorder`, which TrainPipeline writes to `metrics.json`.
+One step can additionally be run under cProfile, or pyinstrument when it is installed.
+"""
+
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size of the process so far in MB, None where the resource module is missing.
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    "ru_maxrss is in bytes on macOS and in kilobytes on Linux"
+    return peak_rss / 1024 ** 2 if sys.platform == "darwin" else peak_rss / 1024
+
+
+@dataclass
+class StepMetrics:
+    name :str
+    thread :str
+    start :float
+    wall_time :float = 0.0
+    thread_cpu_time :float = 0.0
+    process_cpu_time :float = 0.0
+    peak_rss_mb :Optional[float] = None
+    peak_rss_growth_mb :Optional[float] = None
+    rows :Optional[int] = None
+    rows_per_sec :Optional[float] = None
+
+
+class MetricsRecorder:
+    """
+    Collects the StepMetrics of a run and optionally profiles one chosen step.
+
+    Attributes
+    ----------
+    steps : List[StepMetrics]
+        The recorded steps, in the order they finished.
+    profile_step_name : str
+        The step to run under a profiler, None to profile nothing.
+    profiler : str
+        `cprofile` or `pyinstrument`.
+    profile_dir : str
+        Where the profiler output is written.
+    """
+
+    def __init__(self):
+        self.steps: List[StepMetrics] = []
+        self.origin = time.perf_counter()
+        self.profile_step_name = None
+        self.profiler = "cprofile"
+        self.profile_dir = None
+        self._lock = threading.Lock()
+
+    def configure(self, profile_step_name: Optional[str] = None, profiler: str = "cprofile",
+                  profile_dir: Optional[str] = None) -> None:
+        """
+        Starts a new recording, forgetting the steps recorded so far.
+        """
+        with self._lock:
+            self.steps = []
+            self.origin = time.perf_counter()
+            self.profile_step_name = profile_step_name
+            self.profiler = profiler
+            self.profile_dir = profile_dir
+
+    def add(self, step: StepMetrics) -> None:
+        with self._lock:
+            self.steps.append(step)
+
+    @contextmanager
+    def run_profiler(self, name: str):
+        """
+        Runs the wrapped block under the configured profiler when `name` is the chosen step.
+        """
+        if name != self.profile_step_name or self.profile_dir is None:
+            yield
+            return
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        if self.profiler == "pyinstrument":
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                profile_file_path = os.path.join(self.profile_dir, f"{name}.html")
+                with open(profile_file_path, "w") as file_obj:
+                    file_obj.write(profiler.output_html())
+                logging.info(f"Saved pyinstrument profile of {name} to {profile_file_path}")
+            return
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profile_file_path = os.path.join(self.profile_dir, f"{name}.prof")
+            profiler.dump_stats(profile_file_path)
+            with open(os.path.join(self.profile_dir, f"{name}.txt"), "w") as file_obj:
+                pstats.Stats(profiler, stream=file_obj).sort_stats("cumulative").print_stats(50)
+            logging.info(f"Saved cProfile profile of {name} to {profile_file_path}")
+
+    def write(self, filepath: str) -> None:
+        """
+        Writes the recorded steps to a JSON file.
+        """
+        try:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with self._lock:
+                content = {"steps": [asdict(step) for step in self.steps]}
+            with open(filepath, "w") as file_obj:
+                json.dump(content, file_obj, indent=2)
+            logging.info(f"Saved pipeline metrics to {filepath}")
+        except Exception as e:
+            logging.error(f"Error writing pipeline metrics: {e}")
+            raise USVisaException(e, sys) from e
+
+
+metrics_recorder = MetricsRecorder()
+
+
+@contextmanager
+def profile_step(name: str, rows: Optional[int] = None):
+    """
+    Records the wall time, CPU time, peak RSS and rows/sec of the wrapped block.
+
+    The yielded StepMetrics can be updated inside the block, e.g. `step.rows = len(df)` once the
+    number of rows is known. Thread CPU time covers the calling thread only, process CPU time
+    also includes the other threads running meanwhile.
+
+    Args:
+        name (str): The step name.
+        rows (Optional[int]): The number of rows processed, if already known.
+    """
+    step = StepMetrics(name=name, thread=threading.current_thread().name,
+                       start=round(time.perf_counter() - metrics_recorder.origin, 3), rows=rows)
+    peak_rss_before = get_peak_rss_mb()
+    wall_start, thread_cpu_start, process_cpu_start = time.perf_counter(), time.thread_time(), time.process_time()
+    try:
+        with metrics_recorder.run_profiler(name):
+            yield step
+    finally:
+        step.wall_time = time.perf_counter() - wall_start
+        step.thread_cpu_time = time.thread_time() - thread_cpu_start
+        step.process_cpu_time = time.process_time() - process_cpu_start
+        step.peak_rss_mb = get_peak_rss_mb()
+        if peak_rss_before is not None:
+            step.peak_rss_growth_mb = step.peak_rss_mb - peak_rss_before
+        if step.rows is not None and step.wall_time > 0:
+            step.rows_per_sec = step.rows / step.wall_time
+        metrics_recorder.add(step)
+        logging.info(f"Step {name}: wall {step.wall_time:.3f}s, cpu {step.thread_cpu_time:.3f}s, "
+                     f"peak rss {step.peak_rss_mb} MB, rows {step.rows}")
@@ -0,0 +1,144 @@
+## -*- Code : Utf -*-
+
+"""
+Row level data quality rules evaluated column by column with NumPy.
+
+Every rule gives a boolean mask of the rows breaking it, computed on the whole column at once.
+The rules come from schema.yaml: every schema column must be set unless it is listed in
+`quality_rules.nullable`, `int` columns must hold whole numbers, columns with `category_domains`
+must stay in their domain and `quality_rules.ranges` bounds the numerical columns.
+"""
+
+import sys
+import numpy as np
+import pandas as pd
+from typing import Optional
+from pandas import DataFrame, Series
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+from US_visa.entity.schema import Schema
+from US_visa.utils.main_utils import cast_dataframe_to_schema
+
+
+def column_rule_failures(series: Series, dtype: str, nullable: bool = False, bounds: Optional[dict] = None,
+                         domain: Optional[tuple] = None) -> dict:
+    """
+    Evaluates the quality rules of one column.
+
+    Args:
+        series (Series): The column, typed with cast_dataframe_to_schema, which keeps the values that
+            do not fit the schema type for the dtype rule.
+        dtype (str): The schema type of the column: category, int or float.
+        nullable (bool): Whether the column may be null. Defaults to False.
+        bounds (Optional[dict]): The `min` and `max` of a numerical column. Defaults to None.
+        domain (Optional[tuple]): The known categories of a categorical column. Defaults to None.
+
+    Returns:
+        dict: Rule name, as `<column>:<rule>`, to the boolean mask of the rows breaking it.
+            Rules no row breaks are left out.
+    """
+    column, bounds = series.name, bounds or {}
+    masks = {}
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        is_null = codes < 0
+        if domain is not None:
+            if list(series.cat.categories[:len(domain)]) == list(domain):
+                # cast_dataframe_to_schema puts the unknown values after the domain categories
+                masks[f"{column}:domain"] = codes >= len(domain)
+            else:
+                masks[f"{column}:domain"] = ~series.isin(domain).to_numpy() & ~is_null
+    elif dtype == "category":
+        is_null = series.isna().to_numpy()
+        if domain is not None:
+            masks[f"{column}:domain"] = ~series.isin(domain).to_numpy() & ~is_null
+    else:
+        values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        is_null = series.isna().to_numpy()
+        is_number = ~np.isnan(values)
+        masks[f"{column}:dtype"] = ~is_number & ~is_null
+        if dtype == "int":
+            masks[f"{column}:dtype"] |= is_number & (values != np.floor(values))
+        with np.errstate(invalid="ignore"):
+            if bounds.get("min") is not None:
+                masks[f"{column}:min"] = values < bounds["min"]
+            if bounds.get("max") is not None:
+                masks[f"{column}:max"] = values > bounds["max"]
+    if not nullable:
+        masks[f"{column}:not_null"] = is_null
+    return {rule: mask for rule, mask in masks.items() if mask.any()}
+
+
+def evaluate_quality_rules(df: DataFrame, schema: Schema) -> dict:
+    """
+    Evaluates the quality rules of the schema on every row of a DataFrame typed with the schema.
+
+    Args:
+        df (DataFrame): The data, read with read_dataframe_with_schema.
+        schema (Schema): The schema holding the rules.
+
+    Returns:
+        dict: Rule name, as `<column>:<rule>`, to the boolean mask of the rows breaking it.
+            Rules no row breaks are left out.
+    """
+    try:
+        # the rules are a few vectorized comparisons per column, about 10ms per million rows, so
+        # unlike the drift tests they run in this process: shipping the columns to workers costs more
+        masks = {}
+        for column, dtype in schema.columns.items():
+            if column not in df.columns:
+                continue
+            masks.update(column_rule_failures(df[column], dtype=dtype, nullable=column in schema.nullable_columns,
+                                              bounds=schema.ranges.get(column),
+                                              domain=schema.category_domains.get(column)))
+        return masks
+
+    except Exception as e:
+        logging.error(f"Error evaluating the data quality rules: {e}")
+        raise USVisaException(e, sys) from e
+
+
+def describe_failed_rules(masks: dict, rows: np.ndarray) -> np.ndarray:
+    """
+    Names the rules broken by some rows.
+
+    Args:
+        masks (dict): The output of evaluate_quality_rules.
+        rows (np.ndarray): The positions of the rows to describe.
+
+    Returns:
+        np.ndarray: For every row, the names of the rules it breaks joined with ", ".
+    """
+    failed_rules = np.full(len(rows), "", dtype=object)
+    for rule, mask in masks.items():
+        broken = mask[rows]
+        failed_rules[broken] = failed_rules[broken] + np.where(failed_rules[broken] == "", "", ", ") + rule
+    return failed_rules
+
+
+def split_valid_rows(df: DataFrame, schema: Schema) -> tuple:
+    """
+    Splits a DataFrame into the rows passing every quality rule and the rows breaking one.
+
+    Args:
+        df (DataFrame): The data, read with read_dataframe_with_schema.
+        schema (Schema): The schema holding the rules.
+
+    Returns:
+        tuple: The valid rows, cast to the schema types again now that the values breaking the
+            dtype rule are out, the invalid rows with a `failed_rules` column, and the number of
+            rows breaking each rule.
+    """
+    masks = evaluate_quality_rules(df, schema)
+    is_invalid = np.logical_or.reduce(list(masks.values())) if masks else np.zeros(len(df), dtype=bool)
+    invalid_rows = np.flatnonzero(is_invalid)
+    invalid_df = df.iloc[invalid_rows].copy()
+    invalid_df["failed_rules"] = describe_failed_rules(masks, invalid_rows)
+    rule_counts = {rule: int(mask.sum()) for rule, mask in masks.items()}
+    if not len(invalid_rows):
+        return df, invalid_df, rule_counts
+    valid_df = df[~is_invalid]
+    if any(masks.get(f"{column}:dtype") is not None for column in schema.columns):
+        valid_df = cast_dataframe_to_schema(df=valid_df.copy(), schema=schema)
+    return valid_df, invalid_df, rule_counts
@@ -0,0 +1,146 @@
+## -*- Code : Utf -*-
+
+"""
+Stratified reservoir sampling of DataFrames, for statistics that do not need every row.
+"""
+
+import sys
+import math
+import numpy as np
+import pandas as pd
+from typing import Optional
+from pandas import DataFrame
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+
+
+def dkw_sample_size(error_tolerance: float, confidence_level: float = 0.95) -> int:
+    """
+    Sample size for which the empirical CDF is within error_tolerance of the population CDF everywhere,
+    with the given confidence, by the Dvoretzky-Kiefer-Wolfowitz inequality.
+
+    Args:
+        error_tolerance (float): The tolerated CDF error, e.g. 0.01.
+        confidence_level (float): The confidence of the bound. Defaults to 0.95.
+
+    Returns:
+        int: The sample size.
+    """
+    return math.ceil(math.log(2 / (1 - confidence_level)) / (2 * error_tolerance ** 2))
+
+
+def dkw_error(sample_size: int, confidence_level: float = 0.95) -> float:
+    """
+    Largest error of the empirical CDF of a sample of sample_size rows, with the given confidence.
+    """
+    if sample_size <= 0:
+        return 1.0
+    return math.sqrt(math.log(2 / (1 - confidence_level)) / (2 * sample_size))
+
+
+class StratifiedReservoirSampler:
+    """
+    Draws a uniform sample of sample_size rows from a stream of DataFrame chunks in one pass,
+    keeping the proportions of the strata of stratify_column.
+
+    Every row gets a uniform random key and each stratum keeps the positions of the sample_size rows
+    with the smallest keys seen so far, which is a uniform reservoir sample of the stratum. Once the
+    stream is consumed, every stratum contributes in proportion to its row count. Only positions are
+    kept, the rows are taken from the data once at the end.
+
+    Attributes:
+        sample_size (int): The number of rows to sample.
+        stratify_column (Optional[str]): The column whose values define the strata, None for a plain reservoir.
+        stratum_counts (dict): The number of rows seen per stratum.
+    """
+
+    def __init__(self, sample_size: int, stratify_column: Optional[str] = None, random_state: Optional[int] = None):
+        self.sample_size = sample_size
+        self.stratify_column = stratify_column
+        self.stratum_counts = {}
+        self.n_rows = 0
+        self._reservoirs = {}
+        self._rng = np.random.default_rng(random_state)
+
+    def update(self, chunk: DataFrame) -> None:
+        """
+        Offers the rows of a chunk, the next rows of the stream, to the reservoirs.
+        """
+        try:
+            keys = self._rng.random(len(chunk))
+            if self.stratify_column is not None and self.stratify_column in chunk.columns:
+                codes, strata = pd.factorize(chunk[self.stratify_column], use_na_sentinel=False)
+            else:
+                codes, strata = np.zeros(len(chunk), dtype=np.intp), [None]
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(strata) + 1))
+
+            for code, stratum in enumerate(strata):
+                stratum = "<null>" if pd.isna(stratum) else stratum
+                positions = order[bounds[code]:bounds[code + 1]]
+                self.stratum_counts[stratum] = self.stratum_counts.get(stratum, 0) + len(positions)
+                row_positions, row_keys = positions + self.n_rows, keys[positions]
+                if stratum in self._reservoirs:
+                    kept_positions, kept_keys = self._reservoirs[stratum]
+                    row_positions = np.concatenate([kept_positions, row_positions])
+                    row_keys = np.concatenate([kept_keys, row_keys])
+                if len(row_keys) > self.sample_size:
+                    smallest = np.argpartition(row_keys, self.sample_size - 1)[:self.sample_size]
+                    row_positions, row_keys = row_positions[smallest], row_keys[smallest]
+                self._reservoirs[stratum] = (row_positions, row_keys)
+            self.n_rows += len(chunk)
+
+        except Exception as e:
+            logging.error(f"Error sampling a chunk: {e}")
+            raise USVisaException(e, sys) from e
+
+    def allocate(self) -> dict:
+        """
+        Splits sample_size across the strata in proportion to their row counts, by largest remainder.
+        """
+        if self.n_rows <= self.sample_size:
+            return dict(self.stratum_counts)
+        shares = {stratum: self.sample_size * count / self.n_rows for stratum, count in self.stratum_counts.items()}
+        allocation = {stratum: int(share) for stratum, share in shares.items()}
+        remainder = self.sample_size - sum(allocation.values())
+        for stratum in sorted(shares, key=lambda stratum: shares[stratum] - allocation[stratum], reverse=True)[:remainder]:
+            allocation[stratum] += 1
+        return allocation
+
+    def sample_positions(self) -> np.ndarray:
+        """
+        Returns the sorted stream positions of the sampled rows.
+        """
+        parts = []
+        for stratum, n_sampled in self.allocate().items():
+            row_positions, row_keys = self._reservoirs[stratum]
+            if n_sampled < len(row_keys):
+                row_positions = row_positions[np.argpartition(row_keys, n_sampled - 1)[:n_sampled]] if n_sampled else row_positions[:0]
+            parts.append(row_positions)
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.intp)
+
+
+def sample_dataframe(df: DataFrame, sample_size: int, stratify_column: Optional[str] = None,
+                     random_state: Optional[int] = None, chunk_size: int = 1_000_000) -> DataFrame:
+    """
+    Stratified reservoir sample of a DataFrame, read in chunks of chunk_size rows.
+
+    Args:
+        df (DataFrame): The data to sample.
+        sample_size (int): The number of rows to sample. The whole DataFrame is returned when it is not larger.
+        stratify_column (Optional[str]): The column whose proportions the sample keeps. Defaults to None.
+        random_state (Optional[int]): Seed of the random keys. Defaults to None.
+
+    Returns:
+        DataFrame: The sample, in the row order of df.
+    """
+    if len(df) <= sample_size:
+        return df
+    sampler = StratifiedReservoirSampler(sample_size=sample_size, stratify_column=stratify_column,
+                                         random_state=random_state)
+    for start in range(0, len(df), chunk_size):
+        sampler.update(df.iloc[start:start + chunk_size])
+    sample = df.iloc[sampler.sample_positions()]
+    logging.info(f"Sampled {len(sample)} of {len(df)} rows, strata {sampler.allocate()}")
+    return sample
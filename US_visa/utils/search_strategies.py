@@ -0,0 +1,358 @@
+## -*- Code : Utf -*-
+
+"""
+The hyperparameter search strategies of ModelSelection, set by the `search_strategy` section of
+config/model.yaml:
+
+    search_strategy:
+      name: grid            # grid, random, halving or smbo
+      max_evaluations: 200  # parameter sets cross-validated, optional
+      max_seconds: 1800     # wall clock of the search, optional
+      n_iter: 20            # random and smbo: parameter sets tried per model
+      factor: 3             # halving: 1 / factor of the candidates survive each round
+      resource: auto        # halving: n_samples, n_estimators, or auto
+
+The `search_param_grid` of a model lists the values of every parameter. Random search and SMBO
+also accept `{distribution: uniform | loguniform | randint, low: ..., high: ...}` ranges.
+
+Successive halving scores every candidate on a small resource, a subsample of the training rows
+or few trees, and only keeps the best 1 / factor of them for the next round on factor times the
+resource. SMBO fits a random forest of the scores seen so far and tries the parameters with the
+highest expected improvement. Whatever the strategy, a search stops at its budget and the best
+model of the parameter sets cross-validated until then is kept.
+"""
+
+import math
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+from scipy import stats
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import ParameterGrid, ParameterSampler
+
+from US_visa.logger import logging
+from US_visa.exception import USVisaException
+
+
+"Parameter sets scored by the surrogate for every proposal of SMBO"
+SMBO_N_PROPOSALS :int= 500
+
+"Fewest training rows of a fold in the first rounds of successive halving on n_samples"
+HALVING_MIN_SAMPLES :int= 100
+
+SEARCH_STRATEGIES = ("grid", "random", "halving", "smbo")
+
+
+class SearchBudget:
+    """
+    The evaluation and wall clock budget of a search. An evaluation is one parameter set
+    cross-validated on every fold, whatever its resource.
+    """
+
+    def __init__(self, max_evaluations: Optional[int] = None, max_seconds: Optional[float] = None):
+        self.max_evaluations = max_evaluations
+        self.max_seconds = max_seconds
+        self.n_evaluations = 0
+        self.start_time = time.perf_counter()
+
+    def remaining_evaluations(self) -> float:
+        if self.max_seconds is not None and time.perf_counter() - self.start_time >= self.max_seconds:
+            return 0
+        if self.max_evaluations is None:
+            return math.inf
+        return max(0, self.max_evaluations - self.n_evaluations)
+
+    def exhausted(self) -> bool:
+        return self.remaining_evaluations() == 0
+
+
+def to_distribution(values):
+    """
+    The values of a parameter for ParameterSampler: a list, or a scipy distribution for a
+    `{distribution, low, high}` range.
+    """
+    if not isinstance(values, dict):
+        return list(values)
+    low, high = values["low"], values["high"]
+    if values["distribution"] == "uniform":
+        return stats.uniform(low, high - low)
+    if values["distribution"] == "loguniform":
+        return stats.loguniform(low, high)
+    if values["distribution"] == "randint":
+        return stats.randint(low, high + 1)
+    raise ValueError(f"Unknown distribution {values['distribution']!r}")
+
+
+def is_grid(param_grid: dict) -> bool:
+    return all(not isinstance(values, dict) for values in param_grid.values())
+
+
+def sample_params(param_grid: dict, n_iter: int, random_state) -> list:
+    """
+    Samples n_iter parameter sets, without replacement from a grid of lists, the whole grid when
+    it is smaller than n_iter.
+    """
+    if is_grid(param_grid) and len(ParameterGrid(param_grid)) <= n_iter:
+        return list(ParameterGrid(param_grid))
+    space = {name: to_distribution(values) for name, values in param_grid.items()}
+    return list(ParameterSampler(space, n_iter=n_iter, random_state=random_state))
+
+
+def evaluate_within_budget(engine, jobs: list, context, budget: SearchBudget, batch_size: Optional[int] = None) -> list:
+    """
+    Cross-validates jobs in order until the budget is spent.
+
+    Without a budget the jobs are evaluated at once, the widest parallelism. With one they go in
+    batches of batch_size, twice the CPU budget by default, so that a wall clock budget is checked
+    between batches.
+
+    Returns:
+        list: The CVResult of the jobs evaluated, a prefix of jobs.
+    """
+    results = []
+    unbounded = budget.max_evaluations is None and budget.max_seconds is None
+    batch_size = len(jobs) if unbounded else (batch_size or 2 * engine.max_workers)
+    position = 0
+    while position < len(jobs):
+        n_jobs = min(batch_size, len(jobs) - position, budget.remaining_evaluations())
+        if n_jobs <= 0:
+            logging.info(f"Search budget spent after {budget.n_evaluations} evaluations")
+            break
+        batch = jobs[position:position + int(n_jobs)]
+        results.extend(engine.evaluate(batch, context))
+        budget.n_evaluations += len(batch)
+        position += len(batch)
+    return results
+
+
+class GridSearch:
+    """Every parameter set of the grids, in the config order."""
+
+    def __init__(self, config: dict):
+        self.config = config
+
+    def search(self, engine, candidates: list, context, budget: SearchBudget) -> list:
+        jobs = [(candidate, params, None) for candidate in candidates
+                for params in ParameterGrid({name: to_distribution(values)
+                                             for name, values in candidate.param_grid.items()})]
+        return evaluate_within_budget(engine, jobs, context, budget)
+
+
+class RandomSearch:
+    """n_iter parameter sets sampled per model."""
+
+    def __init__(self, config: dict):
+        self.n_iter = int(config.get("n_iter", 10))
+        self.random_state = config.get("random_state")
+
+    def search(self, engine, candidates: list, context, budget: SearchBudget) -> list:
+        per_model = [[(candidate, params, None) for params in sample_params(candidate.param_grid, self.n_iter,
+                                                                            self.random_state)]
+                     for candidate in candidates]
+        # interleaved, so a budget cut leaves every model with its share of the evaluations
+        jobs = [job for round_jobs in zip_longest_jobs(per_model) for job in round_jobs]
+        return evaluate_within_budget(engine, jobs, context, budget)
+
+
+def zip_longest_jobs(per_model: list) -> list:
+    return [[jobs[index] for jobs in per_model if index < len(jobs)]
+            for index in range(max((len(jobs) for jobs in per_model), default=0))]
+
+
+class SuccessiveHalving:
+    """
+    Successive halving over the grid, or n_iter sampled sets, of every model. All the models run
+    their rounds side by side, each with its own resource.
+    """
+
+    def __init__(self, config: dict):
+        self.factor = int(config.get("factor", 3))
+        self.resource = config.get("resource", "auto")
+        self.n_iter = int(config.get("n_iter", 10))
+        self.random_state = config.get("random_state")
+        self.min_resources = config.get("min_resources")
+
+    def get_resource(self, candidate) -> str:
+        has_trees = "n_estimators" in candidate.estimator.get_params()
+        if self.resource == "n_estimators" and not has_trees:
+            return "n_samples"
+        if self.resource != "auto":
+            return self.resource
+        return "n_estimators" if has_trees and "n_estimators" not in candidate.param_grid else "n_samples"
+
+    def get_schedule(self, candidate, resource: str, n_candidates: int, n_rows: int) -> list:
+        """
+        The resource of every round, multiplied by factor from one round to the next and ending on the
+        full resource once a single candidate is left.
+        """
+        n_rounds = max(1, math.ceil(math.log(max(n_candidates, 1), self.factor)) + 1)
+        if resource == "n_samples":
+            max_resource = n_rows
+        elif isinstance(candidate.param_grid.get("n_estimators"), list):
+            max_resource = int(max(candidate.param_grid["n_estimators"]))
+        else:
+            max_resource = int(candidate.estimator.get_params()["n_estimators"])
+        min_resource = self.min_resources or max(1, max_resource // self.factor ** (n_rounds - 1))
+        if resource == "n_samples":
+            # a fit on a handful of rows says nothing of the parameters
+            min_resource = min(max_resource, max(min_resource, HALVING_MIN_SAMPLES))
+        return [min(max_resource, int(min_resource * self.factor ** round_index)) for round_index in range(n_rounds - 1)] \
+            + [max_resource]
+
+    def search(self, engine, candidates: list, context, budget: SearchBudget) -> list:
+        states = []
+        for candidate in candidates:
+            resource = self.get_resource(candidate)
+            param_grid = {name: values for name, values in candidate.param_grid.items()
+                          if not (resource == "n_estimators" and name == "n_estimators")}
+            if is_grid(param_grid):
+                params_list = list(ParameterGrid(param_grid))
+            else:
+                params_list = sample_params(param_grid, self.n_iter, self.random_state)
+            schedule = self.get_schedule(candidate, resource, len(params_list), context.n_train_rows)
+            logging.info(f"Successive halving of {candidate.model_name}: {len(params_list)} candidates, "
+                         f"{resource} schedule {schedule}")
+            states.append({"candidate": candidate, "resource": resource, "params": params_list,
+                           "schedule": schedule, "round": 0})
+
+        results = []
+        while not budget.exhausted():
+            jobs, owners = [], []
+            for state in states:
+                if state["round"] >= len(state["schedule"]) or not state["params"]:
+                    continue
+                amount = state["schedule"][state["round"]]
+                for params in state["params"]:
+                    if state["resource"] == "n_estimators":
+                        jobs.append((state["candidate"], {**params, "n_estimators": amount}, None))
+                    else:
+                        full = state["round"] == len(state["schedule"]) - 1
+                        jobs.append((state["candidate"], params, None if full else amount))
+                    owners.append(state)
+            if not jobs:
+                break
+            round_results = evaluate_within_budget(engine, jobs, context, budget)
+            results.extend(round_results)
+
+            for state in states:
+                if state["round"] >= len(state["schedule"]) or not state["params"]:
+                    continue
+                scored = [(result.mean_score, index) for index, (result, owner)
+                          in enumerate(zip(round_results, owners)) if owner is state]
+                scored.sort(key=lambda item: -item[0])
+                n_keep = max(1, len(state["params"]) // self.factor)
+                offset = owners.index(state)
+                state["params"] = [state["params"][index - offset] for _, index in scored[:n_keep]]
+                state["round"] += 1
+        return results
+
+
+class SMBOSearch:
+    """
+    Sequential model-based optimization with a random forest surrogate, as in SMAC: after
+    n_initial random parameter sets, every round tries the sets of highest expected improvement
+    over the best score, as many as the CPU budget runs at once.
+    """
+
+    def __init__(self, config: dict):
+        self.n_iter = int(config.get("n_iter", 20))
+        self.n_initial = int(config.get("n_initial_points", 5))
+        self.random_state = config.get("random_state")
+
+    @staticmethod
+    def encode(param_grid: dict, params: dict) -> list:
+        """
+        Encodes a parameter set as numbers for the surrogate: numerical values as they are, on a log
+        scale for a loguniform range, categorical values as their position in the list.
+        """
+        features = []
+        for name, values in param_grid.items():
+            value = params[name]
+            if isinstance(values, dict):
+                features.append(math.log(value) if values["distribution"] == "loguniform" else float(value))
+            elif all(isinstance(choice, (int, float)) and not isinstance(choice, bool) for choice in values):
+                features.append(float(value))
+            else:
+                features.append(float(list(values).index(value)))
+        return features
+
+    def propose(self, candidate, observed: list, n_proposals: int, rng: np.random.RandomState) -> list:
+        """
+        The n_proposals untried parameter sets of highest expected improvement.
+        """
+        seen = {repr(sorted(params.items())) for params, _ in observed}
+        pool = [params for params in sample_params(candidate.param_grid, SMBO_N_PROPOSALS, rng)
+                if repr(sorted(params.items())) not in seen]
+        if not pool:
+            return []
+        X_observed = np.array([self.encode(candidate.param_grid, params) for params, _ in observed])
+        y_observed = np.array([score for _, score in observed])
+        surrogate = RandomForestRegressor(n_estimators=50, min_samples_leaf=1, random_state=rng.randint(2 ** 31 - 1))
+        surrogate.fit(X_observed, y_observed)
+
+        X_pool = np.array([self.encode(candidate.param_grid, params) for params in pool])
+        tree_predictions = np.stack([tree.predict(X_pool) for tree in surrogate.estimators_])
+        mean, std = tree_predictions.mean(axis=0), tree_predictions.std(axis=0) + 1e-9
+        z = (mean - y_observed.max()) / std
+        expected_improvement = (mean - y_observed.max()) * stats.norm.cdf(z) + std * stats.norm.pdf(z)
+
+        proposals, keys = [], set()
+        for index in np.argsort(-expected_improvement):
+            key = repr(sorted(pool[index].items()))
+            if key not in keys:
+                keys.add(key)
+                proposals.append(pool[index])
+            if len(proposals) == n_proposals:
+                break
+        return proposals
+
+    def search(self, engine, candidates: list, context, budget: SearchBudget) -> list:
+        rng = np.random.RandomState(self.random_state)
+        observed = {candidate.model_serial_number: [] for candidate in candidates}
+        # the models whose space has no untried parameter set left
+        exhausted = set()
+        results = []
+        while not budget.exhausted():
+            jobs = []
+            for candidate in candidates:
+                history = observed[candidate.model_serial_number]
+                n_left = self.n_iter - len(history)
+                if n_left <= 0 or candidate.model_serial_number in exhausted:
+                    continue
+                if len(history) < self.n_initial:
+                    params_list = sample_params(candidate.param_grid, self.n_initial, rng)
+                    params_list = [params for params in params_list
+                                   if repr(sorted(params.items())) not in
+                                   {repr(sorted(seen.items())) for seen, _ in history}][:n_left]
+                else:
+                    params_list = self.propose(candidate, history, min(n_left, engine.max_workers), rng)
+                if not params_list:
+                    exhausted.add(candidate.model_serial_number)
+                    continue
+                jobs.extend((candidate, params, None) for params in params_list)
+            if not jobs:
+                break
+            round_results = evaluate_within_budget(engine, jobs, context, budget)
+            for (candidate, params, _), result in zip(jobs, round_results):
+                observed[candidate.model_serial_number].append((params, result.mean_score))
+            results.extend(round_results)
+        return results
+
+
+def get_search_strategy(config: Optional[dict]):
+    """
+    The strategy of the search_strategy section of model.yaml, grid when there is none.
+    """
+    try:
+        config = dict(config or {})
+        name = config.get("name", "grid")
+        strategies = {"grid": GridSearch, "random": RandomSearch, "halving": SuccessiveHalving, "smbo": SMBOSearch}
+        if name not in strategies:
+            raise ValueError(f"Unknown search strategy {name!r}, expected one of {SEARCH_STRATEGIES}")
+        return strategies[name](config)
+
+    except Exception as e:
+        logging.error(f"Error reading the search strategy: {e}")
+        raise USVisaException(e, sys) from e
@@ -0,0 +1,64 @@
+# -*- Code:Utf -*-
+
+"""
+Benchmark the native drift engine against the evidently Profile path of DataValidation.
+
+The reference and current frames are the two halves of notebook/EasyVisa.csv replicated to --rows rows,
+loaded with the schema types like the pipeline does:
+    python benchmarks/benchmark_drift.py --rows 25000 250000 1000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from US_visa.components.data_validation import DataValidation
+from US_visa.entity.config_entity import DataValidationConfig
+from US_visa.utils.main_utils import cast_dataframe_to_schema
+from US_visa.entity.schema import get_schema
+
+
+def make_frames(source_csv: str, n_rows: int) -> tuple:
+    """Replicates the source csv to n_rows rows and splits it in a reference and a current half."""
+    schema = get_schema()
+    source_df = pd.read_csv(source_csv)
+    df = pd.concat([source_df] * (n_rows // len(source_df) + 1), ignore_index=True).head(n_rows)
+    df["case_id"] = df["case_id"] + "_" + df.index.astype(str)
+    df = cast_dataframe_to_schema(df, schema=schema)
+    df = df.sample(frac=1.0, random_state=42).reset_index(drop=True)
+    return df.iloc[: n_rows // 2], df.iloc[n_rows // 2:]
+
+
+def run_engine(engine: str, reference_df, current_df, report_dir: str) -> tuple:
+    config = DataValidationConfig(drift_report_file_path=os.path.join(report_dir, engine, "drift_report.yaml"),
+                                  drift_engine=engine)
+    data_validation = DataValidation(data_ingestion_artifact=None, data_validation_config=config)
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    drift_status = data_validation.detect_dataset_drift(reference_df, current_df)
+    elapsed_seconds = time.perf_counter() - start_time
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report_size = os.path.getsize(config.drift_report_file_path)
+    return drift_status, elapsed_seconds, peak_bytes / 1024 ** 2, report_size / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[25000, 250000])
+    parser.add_argument("--engines", nargs="+", default=["native", "evidently"])
+    parser.add_argument("--source-csv", default="notebook/EasyVisa.csv")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as report_dir:
+        for n_rows in args.rows:
+            reference_df, current_df = make_frames(source_csv=args.source_csv, n_rows=n_rows)
+            for engine in args.engines:
+                drift_status, elapsed_seconds, peak_mb, report_kb = run_engine(engine, reference_df, current_df,
+                                                                               report_dir)
+                print(f"rows={n_rows:>9} engine={engine:<10} drift={str(drift_status):<5} "
+                      f"time={elapsed_seconds:8.2f}s peak_alloc={peak_mb:9.1f}MB report={report_kb:9.1f}KB")
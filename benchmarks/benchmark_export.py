@@ -0,0 +1,88 @@
+# -*- Code:Utf -*-
+
+"""
+Benchmark the single-cursor streaming export against the range-partitioned export.
+
+Against a local mongod (the benchmark collection is (re)loaded from notebook/EasyVisa.csv):
+    MONGODB_URL=mongodb://localhost:27017 python benchmarks/benchmark_export.py --rows 1000000 --partitions 2 4 8
+
+In-process, with mongomock standing in for the server (pip install mongomock):
+    python benchmarks/benchmark_export.py --in-process --rows 100000 --partitions 2 4
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from US_visa.configuration.mongo_db_connection import MongoDBClient
+from US_visa.data_access.usvisa_data import USvisaData
+
+BENCHMARK_DATABASE_NAME = "US_VISA_BENCHMARK"
+BENCHMARK_COLLECTION_NAME = "visa_data"
+
+
+def load_collection(collection, source_csv: str, n_rows: int, insert_batch_size: int = 50000) -> None:
+    """Replicates the source csv until the collection holds n_rows documents with unique case ids."""
+    source_df = pd.read_csv(source_csv)
+    collection.drop()
+    inserted = 0
+    replica = 0
+    while inserted < n_rows:
+        batch = source_df.head(n_rows - inserted).copy()
+        batch["case_id"] = batch["case_id"] + f"_{replica}"
+        records = batch.to_dict("records")
+        for start in range(0, len(records), insert_batch_size):
+            collection.insert_many(records[start:start + insert_batch_size])
+        inserted += len(batch)
+        replica += 1
+
+
+def run_benchmark(partitions: list, batch_size: int, repeat: int) -> None:
+    usvisa_data = USvisaData()
+
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        df = usvisa_data.export_collection_as_dataframe(collection_name=BENCHMARK_COLLECTION_NAME,
+                                                        database_name=BENCHMARK_DATABASE_NAME,
+                                                        batch_size=batch_size)
+        elapsed_seconds = time.perf_counter() - start_time
+        print(f"streaming      rows={len(df):>9} time={elapsed_seconds:8.2f}s "
+              f"rows/sec={len(df) / elapsed_seconds:12.0f}")
+
+    for n_partitions in partitions:
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            df = usvisa_data.export_collection_in_partitions(collection_name=BENCHMARK_COLLECTION_NAME,
+                                                             database_name=BENCHMARK_DATABASE_NAME,
+                                                             n_partitions=n_partitions,
+                                                             batch_size=batch_size)
+            elapsed_seconds = time.perf_counter() - start_time
+            print(f"partitions={n_partitions:<3} rows={len(df):>9} time={elapsed_seconds:8.2f}s "
+                  f"rows/sec={len(df) / elapsed_seconds:12.0f}")
+            for stats in usvisa_data.partition_stats:
+                print(f"    partition {stats.partition_index:<3} rows={stats.n_rows:>9} "
+                      f"time={stats.elapsed_seconds:8.2f}s rows/sec={stats.rows_per_second:12.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000, help="documents to load into the benchmark collection")
+    parser.add_argument("--partitions", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--source-csv", default="notebook/EasyVisa.csv")
+    parser.add_argument("--in-process", action="store_true", help="use mongomock instead of MONGODB_URL")
+    parser.add_argument("--skip-load", action="store_true", help="reuse the collection from a previous run")
+    args = parser.parse_args()
+
+    if args.in_process:
+        import mongomock
+        MongoDBClient.client = mongomock.MongoClient()
+
+    mongo_client = MongoDBClient(database_name=BENCHMARK_DATABASE_NAME)
+    if not args.skip_load:
+        load_collection(collection=mongo_client.data_base[BENCHMARK_COLLECTION_NAME],
+                        source_csv=args.source_csv, n_rows=args.rows)
+
+    run_benchmark(partitions=args.partitions, batch_size=args.batch_size, repeat=args.repeat)
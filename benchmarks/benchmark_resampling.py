@@ -0,0 +1,83 @@
+# -*- Code:Utf -*-
+
+"""
+Benchmark the resampling strategies of DataResampling: the time of the resampling and the test
+metrics of a fixed RandomForest trained on the resampled training set.
+
+The data is notebook/EasyVisa.csv replicated to --rows rows, transformed like the pipeline does and
+split in a training and an untouched test set. Above 25480 rows the replicated rows land in both
+sets and inflate the metrics, so compare the strategies within one --rows value:
+    python benchmarks/benchmark_resampling.py --rows 25480 100000 --strategies none random_under smote smoteenn
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import balanced_accuracy_score, f1_score, precision_score, recall_score
+from sklearn.model_selection import train_test_split
+
+from US_visa.components.data_resampling import DataResampling, RESAMPLING_STRATEGIES
+from US_visa.components.data_transformation import DataTransformation
+from US_visa.constants import CURRENT_YEAR, TARGET_COLUMN
+from US_visa.entity.config_entity import DataResamplingConfig, DataTransformationConfig
+from US_visa.entity.estimator import TargetValueMapping
+from US_visa.entity.schema import get_schema
+from US_visa.utils.main_utils import cast_dataframe_to_schema
+
+
+def make_arrays(source_csv: str, n_rows: int) -> tuple:
+    """Replicates the source csv to n_rows rows, transforms it and splits it 80/20 by class."""
+    schema = get_schema()
+    source_df = pd.read_csv(source_csv)
+    df = pd.concat([source_df] * (n_rows // len(source_df) + 1), ignore_index=True).head(n_rows)
+    df = cast_dataframe_to_schema(df, schema=schema)
+    features = df.drop(columns=[TARGET_COLUMN])
+    features["company_age"] = CURRENT_YEAR - features["yr_of_estab"]
+    features = features.drop(columns=[column for column in schema.drop_columns if column in features.columns])
+    target = df[TARGET_COLUMN].map(TargetValueMapping()._asdict()).astype(int).to_numpy()
+    x_train, x_test, y_train, y_test = train_test_split(features, target, test_size=0.2, stratify=target,
+                                                        random_state=42)
+    preprocessor = DataTransformation(None, None, DataTransformationConfig()).get_data_transformer_object()
+    return (preprocessor.fit_transform(x_train).astype(np.float32), y_train,
+            preprocessor.transform(x_test).astype(np.float32), y_test)
+
+
+def run_strategy(strategy: str, n_jobs: int, x_train, y_train, x_test, y_test) -> dict:
+    data_resampling = DataResampling(data_transformation_artifact=None,
+                                     data_resampling_config=DataResamplingConfig(strategy=strategy, n_jobs=n_jobs))
+    resampler = data_resampling.get_resampler()
+    start_time = time.perf_counter()
+    if resampler is not None:
+        x_train, y_train = resampler.fit_resample(x_train, y_train)
+    resample_seconds = time.perf_counter() - start_time
+
+    model = RandomForestClassifier(n_estimators=50, max_depth=15, random_state=42, n_jobs=n_jobs,
+                                   class_weight="balanced" if resampler is None else None)
+    start_time = time.perf_counter()
+    model.fit(x_train, y_train)
+    fit_seconds = time.perf_counter() - start_time
+    y_pred = model.predict(x_test)
+    return {"train_rows": len(y_train), "resample": resample_seconds, "fit": fit_seconds,
+            "f1": f1_score(y_test, y_pred), "precision": precision_score(y_test, y_pred),
+            "recall": recall_score(y_test, y_pred), "balanced_accuracy": balanced_accuracy_score(y_test, y_pred)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[25480, 100000])
+    parser.add_argument("--strategies", nargs="+", default=list(RESAMPLING_STRATEGIES))
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--source-csv", default="notebook/EasyVisa.csv")
+    args = parser.parse_args()
+
+    for n_rows in args.rows:
+        x_train, y_train, x_test, y_test = make_arrays(source_csv=args.source_csv, n_rows=n_rows)
+        for strategy in args.strategies:
+            result = run_strategy(strategy, args.n_jobs, x_train, y_train, x_test, y_test)
+            print(f"rows={n_rows:>9} strategy={strategy:<13} train_rows={result['train_rows']:>9} "
+                  f"resample={result['resample']:7.2f}s fit={result['fit']:7.2f}s f1={result['f1']:.4f} "
+                  f"precision={result['precision']:.4f} recall={result['recall']:.4f} "
+                  f"balanced_accuracy={result['balanced_accuracy']:.4f}")
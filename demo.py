@@ -1,10 +1,14 @@
 # -*- Code:Utf -*-
 
 import os
+import sys
 from US_visa.pipeline.train_pipeline import TrainPipeline
 
 obj = TrainPipeline()
-obj.run_pipeline()
+if "--resume" in sys.argv:
+    obj.resume()
+else:
+    obj.run_pipeline()
 
 
 